@@ -1,9 +1,12 @@
+import atexit
 from flask import Flask
 from flask_restx import Api
 
 
-def create_app():
+def create_app(config_class=None):
     app = Flask(__name__)
+    if config_class is not None:
+        app.config.from_object(config_class)
     api = Api(app, version='1.0', title='HBnB API', description='HBnB Application API', doc='/')
     
 
@@ -17,4 +20,13 @@ def create_app():
     api.add_namespace(places_ns, path='/api/v1/places')
     api.add_namespace(reviews_ns, path='/api/v1/reviews')
 
+    if app.config.get('DATA_DIR'):
+        from app.services import facade
+        facade.open_storage(
+            app.config['DATA_DIR'],
+            durable=app.config.get('JOURNAL_DURABLE', True),
+            sync_interval=app.config.get('JOURNAL_SYNC_INTERVAL', 0.0),
+            snapshot_every=app.config.get('SNAPSHOT_EVERY', 100_000))
+        atexit.register(facade.close_storage)
+
     return app
@@ -1,3 +1,4 @@
+from flask import request
 from flask_restx import Namespace, Resource, fields
 from app.services import facade
 
@@ -38,6 +39,25 @@ place_model = api.model('Place', {
 })
 
 
+# Attributes GET /places can be ordered by
+PLACE_ORDERS = {'price', 'latitude', 'longitude', 'title'}
+
+
+def _query_arg(name, convert, default=None):
+    """Query string argument `name` passed through `convert`; ValueError
+    names the argument when it does not convert."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        result = convert(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+    if result < 0:
+        raise ValueError(f"Invalid {name}: {value}")
+    return result
+
+
 @api.route('/')
 class PlaceList(Resource):
     @api.expect(place_model)
@@ -62,9 +82,32 @@ class PlaceList(Resource):
         }, 201
 
     @api.response(200, 'List of places retrieved successfully')
+    @api.response(400, 'Invalid query parameters')
+    @api.doc(params={
+        'min_price': 'Lowest price per night',
+        'max_price': 'Highest price per night',
+        'order_by': "One of price, latitude, longitude or title; "
+                    "prefix with '-' for descending order",
+        'limit': 'Maximum number of places returned',
+        'offset': 'Number of matching places skipped',
+    })
     def get(self):
         """Retrieve a list of all places"""
-        places = facade.get_all_places()
+        try:
+            min_price = _query_arg('min_price', float)
+            max_price = _query_arg('max_price', float)
+            limit = _query_arg('limit', int)
+            offset = _query_arg('offset', int, 0)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        order_by = request.args.get('order_by')
+        if order_by and order_by.lstrip('-') not in PLACE_ORDERS:
+            return {'error': 'Invalid order_by'}, 400
+
+        filters = {}
+        if min_price is not None or max_price is not None:
+            filters['price'] = (min_price, max_price)
+        places = facade.find_places(filters, order_by, limit, offset)
         return [
             {
                 'id': p.id,
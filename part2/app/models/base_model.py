@@ -15,7 +15,17 @@ class BaseModel:
     def update(self, data):
         """Update the attributes of the object based on the provided dictionary"""
         protected = {'id', 'created_at', 'updated_at'}
-        for key, value in data.items():
-            if key not in protected and hasattr(self, key):
-                setattr(self, key, value)
+        changes = {key: value for key, value in data.items()
+                   if key not in protected and hasattr(self, key)}
+        # Set by the repository holding this object, which applies the
+        # changes atomically and keeps its indexes (and journal) in step
+        repository = getattr(self, '_repository', None)
+        if repository is not None:
+            repository.apply_update(self, changes)
+        else:
+            self.apply(changes)
+
+    def apply(self, changes):
+        for key, value in changes.items():
+            setattr(self, key, value)
         self.save()  # Update the updated_at timestamp
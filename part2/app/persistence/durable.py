@@ -0,0 +1,484 @@
+"""Snapshot and journal persistence for InMemoryRepository.
+
+A data directory holds one `snapshot` file and numbered `journal.N` files,
+plus a `lock` file that the process using it keeps locked. Every add, update and delete is appended to the newest journal; a snapshot
+writes every object out and lets the journals before it be deleted. On
+startup the snapshot is loaded, then the journals it does not cover are
+replayed.
+
+Both files are sequences of frames: payload length and CRC-32, then the
+pickled payload. A torn or corrupt frame ends a file, so a crash mid-write
+loses at most the records not yet synced.
+"""
+import fcntl
+import gc
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+from app.models.base_model import BaseModel
+
+_FRAME = struct.Struct('<II')
+# Magic, then the first journal generation the snapshot does not cover
+_SNAPSHOT_HEADER = struct.Struct('<8sQ')
+_SNAPSHOT_MAGIC = b'HBNBSNP1'
+# Records per snapshot frame: fewer, larger pickles load faster
+_SNAPSHOT_CHUNK = 1000
+
+
+def _frame(payload):
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(buffer, offset=0):
+    """Yield (payload, end offset) for each intact frame from `offset`,
+    stopping at the first torn or corrupt one."""
+    size = len(buffer)
+    while offset + _FRAME.size <= size:
+        length, crc = _FRAME.unpack_from(buffer, offset)
+        end = offset + _FRAME.size + length
+        if end > size:
+            return
+        payload = buffer[offset + _FRAME.size:end]
+        if zlib.crc32(payload) != crc:
+            return
+        yield payload, end
+        offset = end
+
+
+@contextmanager
+def _mapped(path):
+    """The file at `path` memory-mapped read-only (bytes if empty)."""
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def _fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StorageLockedError(RuntimeError):
+    """The data directory is already open, in this or another process."""
+
+
+class Journal:
+    """Append-only file of pickled records, written with group commit.
+
+    append() queues a frame for a writer thread, which writes everything
+    queued so far with one write and one fsync: concurrent appends share a
+    flush. append returns the record's sequence number; wait() on it
+    returns once the record is on disk. With `durable`, append waits
+    itself; otherwise it returns at once. `sync_interval` delays each
+    flush to gather more records.
+    """
+
+    def __init__(self, path, durable=True, sync_interval=0.0):
+        self.durable = durable
+        self.sync_interval = sync_interval
+        self._file = open(path, 'ab')
+        self._pending = []
+        self._queued = self._synced = 0
+        self._error = None
+        self._closed = False
+        self._cond = threading.Condition()
+        # Held while writing, so rotate() never swaps the file mid-flush
+        self._io_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._run, daemon=True,
+                                        name='journal-writer')
+        self._writer.start()
+
+    def append(self, record):
+        sequence = self.enqueue(record)
+        if self.durable:
+            self.wait(sequence)
+        return sequence
+
+    def enqueue(self, record):
+        """Queue `record` without waiting; returns its sequence number."""
+        frame = _frame(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+        with self._cond:
+            if self._closed:
+                raise ValueError("Journal is closed")
+            self._pending.append(frame)
+            self._queued += 1
+            self._cond.notify_all()
+            return self._queued
+
+    def wait(self, sequence):
+        """Wait until record `sequence` (and every earlier one) is on
+        disk."""
+        with self._cond:
+            self._wait(sequence)
+
+    def flush(self):
+        """Wait until every record appended so far is on disk."""
+        with self._cond:
+            self._wait(self._queued)
+
+    def _wait(self, sequence):
+        while self._synced < sequence and self._error is None:
+            self._cond.wait()
+        if self._error is not None:
+            raise self._error
+
+    def rotate(self, path):
+        """Append to `path` from now on. Records already queued are
+        written to the current file first, so each file holds exactly the
+        records enqueued before or after the switch."""
+        with self._io_lock:
+            self._write_pending()
+            previous, self._file = self._file, open(path, 'ab')
+        previous.close()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._file.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            if self.sync_interval:
+                # Let concurrent appends join this flush
+                time.sleep(self.sync_interval)
+            with self._io_lock:
+                if not self._write_pending():
+                    return
+
+    def _write_pending(self):
+        """Write and sync every queued frame; called with the I/O lock
+        held. Returns False once writing has failed."""
+        with self._cond:
+            if self._error is not None:
+                return False
+            frames, self._pending = self._pending, []
+            sequence = self._queued
+        if frames:
+            try:
+                self._file.write(b''.join(frames))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as error:
+                with self._cond:
+                    self._error = error
+                    self._cond.notify_all()
+                return False
+        with self._cond:
+            self._synced = sequence
+            self._cond.notify_all()
+        return True
+
+
+class DurableStorage:
+    """Persists InMemoryRepository objects to a data directory.
+
+    `repositories` maps a name to each repository, in an order where
+    objects only refer to objects of earlier repositories (or their own):
+    references are stored as ids and resolved on load. open() loads what a
+    previous run left, then journals every add, update and delete. A
+    snapshot is taken in the background every `snapshot_every` records;
+    journal options are passed to Journal.
+    """
+
+    def __init__(self, directory, repositories, durable=True,
+                 sync_interval=0.0, snapshot_every=100_000):
+        self.directory = directory
+        self.repositories = dict(repositories)
+        self.durable = durable
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self._journal = None
+        self._generation = 0
+        self._since_snapshot = 0
+        self._snapshotting = threading.Lock()
+        self._snapshot_thread = None
+        self._loaded = {}
+        self._lock_file = None
+
+    # -- Paths --------------------------------------------------------------
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, 'snapshot')
+
+    def _journal_path(self, generation):
+        return os.path.join(self.directory, f'journal.{generation}')
+
+    def _lock_path(self):
+        return os.path.join(self.directory, 'lock')
+
+    def _journal_generations(self):
+        generations = []
+        for name in os.listdir(self.directory):
+            prefix, _, suffix = name.partition('.')
+            if prefix == 'journal' and suffix.isdigit():
+                generations.append(int(suffix))
+        return sorted(generations)
+
+    # -- Loading ------------------------------------------------------------
+
+    def open(self):
+        """Load the snapshot and replay the journal tail, then start
+        journaling writes.
+
+        Raises StorageLockedError if the directory is already open: two
+        processes appending to one journal would corrupt it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock()
+        try:
+            self._load()
+        except BaseException:
+            self._unlock()
+            raise
+        self._journal = Journal(self._journal_path(self._generation),
+                                self.durable, self.sync_interval)
+        for name, repository in self.repositories.items():
+            repository._log = self._logger(name)
+
+    def _lock(self):
+        """Hold an exclusive lock on the directory until close()."""
+        lock_file = open(self._lock_path(), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise StorageLockedError(
+                f"{self.directory} is already in use") from None
+        self._lock_file = lock_file
+
+    def _unlock(self):
+        if self._lock_file is not None:
+            # Closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _load(self):
+        # Id -> object, resolving references while loading
+        self._loaded = {obj.id: obj for repository in
+                        self.repositories.values()
+                        for obj in repository.get_all()}
+        # Loading only allocates: cyclic GC passes would rescan the growing
+        # heap over and over
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            tail = self._load_snapshot()
+            self._generation = tail
+            for generation in self._journal_generations():
+                if generation < tail:
+                    os.remove(self._journal_path(generation))
+                    continue
+                self._since_snapshot += self._replay(
+                    self._journal_path(generation))
+                self._generation = generation
+        finally:
+            self._loaded = {}
+            if collecting:
+                gc.enable()
+
+    def _load_snapshot(self):
+        path = self._snapshot_path()
+        if not os.path.exists(path):
+            return 0
+        with _mapped(path) as buffer:
+            magic, tail = _SNAPSHOT_HEADER.unpack_from(buffer)
+            if magic != _SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a snapshot")
+            # Each repository is restored in one go once its records end,
+            # before a later repository's references need resolving
+            name, objects = None, []
+            for payload, _ in _read_frames(buffer, _SNAPSHOT_HEADER.size):
+                for _, record_name, *state in pickle.loads(payload):
+                    if record_name != name:
+                        if name is not None:
+                            self.repositories[name].restore(objects)
+                        name, objects = record_name, []
+                    objects.append(self._decode(*state))
+            if name is not None:
+                self.repositories[name].restore(objects)
+        return tail
+
+    def _replay(self, path):
+        """Apply a journal's records; returns how many there were. A torn
+        tail left by a crash is cut off, so appends follow intact frames."""
+        count = end = 0
+        with _mapped(path) as buffer:
+            for payload, end in _read_frames(buffer):
+                record = pickle.loads(payload)
+                repository = self.repositories[record[1]]
+                if record[0] == 'delete':
+                    repository.delete(record[2])
+                else:
+                    self._apply_put(repository, *record[2:])
+                count += 1
+            size = len(buffer)
+        if end < size:
+            os.truncate(path, end)
+        return count
+
+    def _apply_put(self, repository, cls, attributes, references):
+        existing = repository.get(attributes['id'])
+        if existing is None:
+            repository.add(self._decode(cls, attributes, references))
+            return
+        # In place, so objects referring to it keep seeing the same one
+        draft = type(existing).__new__(type(existing))
+        self._set_state(draft, attributes, references)
+        draft._repository = existing._repository
+        existing.__dict__ = draft.__dict__
+        repository.reindex(existing)
+
+    def _decode(self, cls, attributes, references):
+        obj = cls.__new__(cls)
+        self._set_state(obj, attributes, references)
+        self._loaded[obj.id] = obj
+        return obj
+
+    def _set_state(self, obj, attributes, references):
+        state = vars(obj)
+        state.update(attributes)
+        loaded = self._loaded
+        for name, ids in references.items():
+            state[name] = (loaded.get(ids) if type(ids) is str
+                           else [loaded.get(obj_id) for obj_id in ids])
+
+    # -- Writing ------------------------------------------------------------
+
+    def _logger(self, name):
+        return _RepositoryLog(self, name)
+
+    def _record(self, name, kind, value):
+        """Queue the record of a write; returns its journal sequence."""
+        if kind == 'delete':
+            record = ('delete', name, value)
+        else:
+            record = ('put', name, type(value),
+                      *self._encode(vars(value)))
+        sequence = self._journal.enqueue(record)
+        self._since_snapshot += 1
+        if (self.snapshot_every
+                and self._since_snapshot >= self.snapshot_every
+                and not self._snapshotting.locked()):
+            self._since_snapshot = 0
+            self._snapshot_thread = threading.Thread(
+                target=self.snapshot, daemon=True, name='snapshot')
+            self._snapshot_thread.start()
+        return sequence
+
+    def _sync(self, sequence):
+        if self.durable:
+            self._journal.wait(sequence)
+
+    @staticmethod
+    def _encode(state):
+        """(attributes, references) of an object's `state`: references map
+        attribute names to the id, or list of ids, of the stored objects
+        they hold."""
+        # Copied first: the state may lose its _repository meanwhile
+        attributes = dict(state)
+        attributes.pop('_repository', None)
+        references = {}
+        for name, value in attributes.items():
+            if isinstance(value, BaseModel):
+                references[name] = value.id
+            elif (type(value) is list and value
+                  and isinstance(value[0], BaseModel)):
+                references[name] = [item.id for item in value]
+        for name in references:
+            del attributes[name]
+        return attributes, references
+
+    def snapshot(self):
+        """Write every object to a new snapshot and drop the journals it
+        covers.
+
+        Every repository is captured at one point, with all their write
+        locks held, so each reference in the snapshot resolves within it.
+        Only the object lists and state dicts are taken then: an update
+        swaps in a new state dict rather than changing the published one.
+        The journal moves to a new generation at that same point, after
+        writing out the records still queued for the old one: replayed on
+        top of the snapshot they would undo newer writes. Writes resume
+        while the snapshot is written out.
+        """
+        with self._snapshotting:
+            with ExitStack() as stack:
+                for repository in self.repositories.values():
+                    stack.enter_context(repository._lock)
+                self._generation += 1
+                tail = self._generation
+                self._journal.rotate(self._journal_path(tail))
+                self._since_snapshot = 0
+                captured = [(name, [(type(obj), vars(obj))
+                                    for obj in repository.get_all()])
+                            for name, repository in self.repositories.items()]
+            path = self._snapshot_path()
+            temporary = path + '.tmp'
+            with open(temporary, 'wb') as f:
+                f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, tail))
+                chunk = []
+                for name, objects in captured:
+                    for cls, state in objects:
+                        chunk.append(('put', name, cls,
+                                      *self._encode(state)))
+                        if len(chunk) == _SNAPSHOT_CHUNK:
+                            f.write(_frame(pickle.dumps(
+                                chunk, pickle.HIGHEST_PROTOCOL)))
+                            chunk = []
+                if chunk:
+                    f.write(_frame(pickle.dumps(chunk,
+                                                pickle.HIGHEST_PROTOCOL)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+            _fsync_directory(self.directory)
+            for generation in self._journal_generations():
+                if generation < tail:
+                    os.remove(self._journal_path(generation))
+
+    def close(self):
+        """Wait for a running snapshot, flush the journal, stop journaling
+        and release the directory."""
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        for repository in self.repositories.values():
+            repository._log = None
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self._unlock()
+
+
+class _RepositoryLog:
+    """A repository's journal hook: called with ('put', obj) or ('delete',
+    id) under the repository's write lock, it queues the record and returns
+    its sequence; sync(sequence) then waits for it to be on disk, once the
+    lock is released."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    def __call__(self, kind, value):
+        return self.storage._record(self.name, kind, value)
+
+    def sync(self, sequence):
+        self.storage._sync(sequence)
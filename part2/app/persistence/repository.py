@@ -1,4 +1,9 @@
+import copy
+import heapq
+import threading
 from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain, islice
 
 
 class Repository(ABC):
@@ -27,12 +32,265 @@ class Repository(ABC):
         pass
 
 
+class DuplicateKeyError(ValueError):
+    """Another object already holds the value of a unique attribute."""
+
+
+class _SortedList:
+    """Sorted items split into blocks of at most 2 * LOAD, so an insert or
+    removal copies one block instead of shifting the whole list.
+
+    Copy-on-write: a change builds new block lists and publishes them with
+    one assignment, so iterations already running keep reading the
+    version they started with and never need a lock.
+    """
+
+    LOAD = 500
+
+    def __init__(self, items=()):
+        items = sorted(items)
+        blocks = [items[i:i + self.LOAD]
+                  for i in range(0, len(items), self.LOAD)]
+        self._state = (blocks, [block[-1] for block in blocks])
+
+    def __len__(self):
+        return sum(map(len, self._state[0]))
+
+    def __iter__(self):
+        return chain.from_iterable(self._state[0])
+
+    def add(self, item):
+        blocks, maxes = self._state
+        if not blocks:
+            self._state = ([[item]], [item])
+            return
+        blocks, maxes = blocks[:], maxes[:]
+        i = bisect_left(maxes, item)
+        if i == len(maxes):
+            i -= 1
+            block = blocks[i] + [item]
+        else:
+            block = blocks[i][:]
+            insort(block, item)
+        if len(block) > 2 * self.LOAD:
+            blocks[i:i + 1] = [block[:self.LOAD], block[self.LOAD:]]
+            maxes[i:i + 1] = [block[self.LOAD - 1], block[-1]]
+        else:
+            blocks[i], maxes[i] = block, block[-1]
+        self._state = (blocks, maxes)
+
+    def remove(self, item):
+        blocks, maxes = self._state
+        i = bisect_left(maxes, item)
+        if i == len(maxes):
+            return
+        j = bisect_left(blocks[i], item)
+        if j == len(blocks[i]) or blocks[i][j] != item:
+            return
+        block = blocks[i][:j] + blocks[i][j + 1:]
+        blocks, maxes = blocks[:], maxes[:]
+        if block:
+            blocks[i], maxes[i] = block, block[-1]
+        else:
+            del blocks[i], maxes[i]
+        self._state = (blocks, maxes)
+
+    def irange(self, minimum=None, maximum=None, reverse=False):
+        """Items between the inclusive bounds (None for no bound)."""
+        blocks, maxes = self._state
+        if not blocks:
+            return
+        if not reverse:
+            i = 0 if minimum is None else bisect_left(maxes, minimum)
+            j = 0 if minimum is None or i == len(blocks) else bisect_left(
+                blocks[i], minimum)
+            for block in islice(blocks, i, None):
+                for item in islice(block, j, None):
+                    if maximum is not None and item > maximum:
+                        return
+                    yield item
+                j = 0
+            return
+        i = len(blocks) - 1
+        if maximum is not None:
+            i = min(i, bisect_right(maxes, maximum))
+        j = (len(blocks[i]) if maximum is None
+             else bisect_right(blocks[i], maximum))
+        while i >= 0:
+            block = blocks[i]
+            for k in range(j - 1, -1, -1):
+                if minimum is not None and block[k] < minimum:
+                    return
+                yield block[k]
+            i -= 1
+            j = len(blocks[i]) if i >= 0 else 0
+
+
 class InMemoryRepository(Repository):
-    def __init__(self):
+    def __init__(self, indexes=(), unique=(), sorted_indexes=()):
+        """`indexes` and `unique` name attributes kept in hash indexes, so
+        equality lookups on them skip the scan; `unique` ones also reject
+        a value already held by another object. `sorted_indexes` name
+        attributes kept in order, for range filters and ordering in find.
+        """
         self._storage = {}
+        self._unique = {name: {} for name in unique}
+        # Value -> ids holding it; dicts keep ids in insertion order
+        self._indexes = {name: {} for name in indexes if name not in unique}
+        # Sorted (value, id) pairs; ids whose value is None are kept apart
+        self._sorted = {name: _SortedList() for name in sorted_indexes}
+        self._unsorted = {name: {} for name in sorted_indexes}
+        self._indexed = (*self._unique, *self._indexes, *self._sorted)
+        # Indexed values of each object, as last indexed
+        self._keys = {}
+        # Set by DurableStorage: called with ('put', obj) or ('delete', id)
+        # under the write lock, returning a sequence to sync
+        self._log = None
+        # Serializes writers; readers take no lock and only read
+        # containers through one-step copies, or structures replaced
+        # whole on change
+        self._lock = threading.RLock()
+
+    def _index_keys(self, obj):
+        return {name: getattr(obj, name) for name in self._indexed}
+
+    def _check_unique(self, obj_id, keys):
+        for name, values in self._unique.items():
+            holder = values.get(keys[name], obj_id)
+            if holder != obj_id:
+                raise DuplicateKeyError(
+                    f"{name} {keys[name]!r} is already taken")
+
+    def _unindex(self, obj_id, keys, keep=None):
+        """Drop the entries of `obj_id` under `keys`, except those `keep`
+        (the keys it is now indexed under) shares."""
+        for name, values in self._unique.items():
+            if keep is not None and keep[name] == keys[name]:
+                continue
+            if values.get(keys[name]) == obj_id:
+                del values[keys[name]]
+        for name, index in self._indexes.items():
+            if keep is not None and keep[name] == keys[name]:
+                continue
+            ids = index.get(keys[name])
+            if ids is not None:
+                ids.pop(obj_id, None)
+                if not ids:
+                    del index[keys[name]]
+        for name, pairs in self._sorted.items():
+            if keep is not None and keep[name] == keys[name]:
+                continue
+            if keys[name] is None:
+                self._unsorted[name].pop(obj_id, None)
+            else:
+                pairs.remove((keys[name], obj_id))
+
+    def _index_hashed(self, obj_id, keys):
+        for name, values in self._unique.items():
+            values[keys[name]] = obj_id
+        for name, index in self._indexes.items():
+            index.setdefault(keys[name], {})[obj_id] = None
+        self._keys[obj_id] = keys
+
+    def _index(self, obj_id, keys, previous=None):
+        """Index `obj_id` under `keys`; sorted entries equal to those of
+        `previous` (the keys it was indexed under) are already there."""
+        self._index_hashed(obj_id, keys)
+        for name, pairs in self._sorted.items():
+            if previous is not None and previous[name] == keys[name]:
+                continue
+            if keys[name] is None:
+                self._unsorted[name][obj_id] = None
+            else:
+                pairs.add((keys[name], obj_id))
+
+    def reindex(self, obj):
+        """Bring the indexes up to date with `obj`. New entries go in
+        before stale ones go, so lock-free readers always find it."""
+        if not self._indexed:
+            return
+        keys = self._index_keys(obj)
+        previous = self._keys.get(obj.id)
+        if keys != previous:
+            self._check_unique(obj.id, keys)
+            self._index(obj.id, keys, previous)
+            if previous is not None:
+                self._unindex(obj.id, previous, keep=keys)
+
+    def _journal(self, kind, value):
+        """Queue a journal record (under the write lock, so records follow
+        the order writes were applied in)."""
+        if self._log is not None:
+            return self._log(kind, value)
+
+    def _synced(self, sequence):
+        """Wait for a journal record, once the write lock is released so
+        concurrent writers share the flush."""
+        if sequence is not None and self._log is not None:
+            self._log.sync(sequence)
+
+    def apply_update(self, obj, changes):
+        """Apply `changes` ({attribute: new value}) to `obj`, for
+        BaseModel.update.
+
+        The changes are made on a copy whose state then replaces the
+        object's in one assignment: lock-free readers see every change or
+        none, and a failed validation or unique check changes nothing.
+        """
+        with self._lock:
+            if self._storage.get(obj.id) is not obj:
+                # Deleted meanwhile: nothing left to index or journal
+                obj.apply(changes)
+                return
+            if self._unique:
+                keys = dict(self._keys.get(obj.id) or self._index_keys(obj))
+                keys.update((name, value) for name, value in changes.items()
+                            if name in keys)
+                self._check_unique(obj.id, keys)
+            draft = copy.copy(obj)
+            draft.apply(changes)
+            obj.__dict__ = draft.__dict__
+            self.reindex(obj)
+            sequence = self._journal('put', obj)
+        self._synced(sequence)
 
     def add(self, obj):
-        self._storage[obj.id] = obj
+        with self._lock:
+            keys = self._index_keys(obj)
+            self._check_unique(obj.id, keys)
+            obj._repository = self
+            previous = self._keys.get(obj.id)
+            self._storage[obj.id] = obj
+            if self._indexed:
+                self._index(obj.id, keys, previous)
+                if previous is not None:
+                    self._unindex(obj.id, previous, keep=keys)
+            sequence = self._journal('put', obj)
+        self._synced(sequence)
+
+    def restore(self, objects):
+        """Load objects known to be consistent, such as a snapshot's,
+        without unique checks; each sorted index is rebuilt with one sort."""
+        with self._lock:
+            pairs = {name: list(index)
+                     for name, index in self._sorted.items()}
+            for obj in objects:
+                obj._repository = self
+                self._storage[obj.id] = obj
+                if not self._indexed:
+                    continue
+                keys = self._index_keys(obj)
+                previous = self._keys.get(obj.id)
+                if previous is not None:
+                    self._unindex(obj.id, previous)
+                self._index_hashed(obj.id, keys)
+                for name, values in pairs.items():
+                    if keys[name] is None:
+                        self._unsorted[name][obj.id] = None
+                    else:
+                        values.append((keys[name], obj.id))
+            self._sorted = {name: _SortedList(values)
+                            for name, values in pairs.items()}
 
     def get(self, obj_id):
         return self._storage.get(obj_id)
@@ -43,11 +301,127 @@ class InMemoryRepository(Repository):
     def update(self, obj_id, data):
         obj = self.get(obj_id)
         if obj:
+            # BaseModel.update hands the changes to apply_update
             obj.update(data)
 
     def delete(self, obj_id):
-        if obj_id in self._storage:
-            del self._storage[obj_id]
+        with self._lock:
+            if obj_id not in self._storage:
+                return
+            keys = self._keys.pop(obj_id, None)
+            if keys is not None:
+                self._unindex(obj_id, keys)
+            obj = self._storage.pop(obj_id)
+            if getattr(obj, '_repository', None) is self:
+                del obj._repository
+            sequence = self._journal('delete', obj_id)
+        self._synced(sequence)
 
     def get_by_attribute(self, attr_name, attr_value):
-        return next((obj for obj in self._storage.values() if getattr(obj, attr_name) == attr_value), None)
+        if attr_name in self._unique:
+            obj_id = self._unique[attr_name].get(attr_value)
+            return None if obj_id is None else self._storage.get(obj_id)
+        if attr_name in self._indexes:
+            # Copied in one step: writers may be changing the bucket
+            ids = tuple(self._indexes[attr_name].get(attr_value, ()))
+            return self._storage.get(ids[0]) if ids else None
+        return next((obj for obj in self.get_all() if getattr(obj, attr_name) == attr_value), None)
+
+    def get_all_by_attribute(self, attr_name, attr_value):
+        """Every object whose `attr_name` equals `attr_value`, the earliest
+        indexed first."""
+        if attr_name in self._unique:
+            obj = self.get_by_attribute(attr_name, attr_value)
+            return [] if obj is None else [obj]
+        if attr_name in self._indexes:
+            ids = tuple(self._indexes[attr_name].get(attr_value, ()))
+            return [obj for obj in map(self._storage.get, ids)
+                    if obj is not None]
+        return [obj for obj in self.get_all()
+                if getattr(obj, attr_name) == attr_value]
+
+    def find(self, filters=None, order_by=None, limit=None, offset=0):
+        """Objects matching every filter, optionally ordered and paged.
+
+        `filters` maps an attribute to a value it must equal, or to a
+        (low, high) tuple of inclusive bounds where None leaves a side
+        open. `order_by` names an attribute, prefixed with '-' for
+        descending order; ties are broken by id and None values come last.
+
+        Candidates come from the narrowest index available: a hash index
+        for an equality filter, else the sorted index of `order_by`, read in
+        order so it stops after `offset + limit` matches, else the sorted
+        index of a range filter. Unindexed orderings keep only the top
+        `offset + limit` matches in a heap.
+        """
+        filters = dict(filters or {})
+        ranges = {name: bounds for name, bounds in filters.items()
+                  if isinstance(bounds, tuple)}
+        equals = {name: value for name, value in filters.items()
+                  if name not in ranges}
+        descending = bool(order_by) and order_by.startswith('-')
+        order = order_by.lstrip('-') if order_by else None
+
+        candidates, ordered = None, order is None
+        buckets = [self._hash_ids(name, value)
+                   for name, value in equals.items()
+                   if name in self._unique or name in self._indexes]
+        if buckets:
+            candidates = min(buckets, key=len)
+        elif order in self._sorted:
+            candidates = self._sorted_ids(order, ranges.get(order),
+                                          descending)
+            ordered = True
+        else:
+            ranged = [name for name in ranges if name in self._sorted]
+            if ranged:
+                candidates = self._sorted_ids(ranged[0], ranges[ranged[0]])
+        if candidates is None:
+            objects = self.get_all()
+        else:
+            objects = filter(None, map(self._storage.get, candidates))
+
+        def matches(obj):
+            for name, value in equals.items():
+                if getattr(obj, name) != value:
+                    return False
+            for name, (low, high) in ranges.items():
+                value = getattr(obj, name)
+                if (value is None or (low is not None and value < low)
+                        or (high is not None and value > high)):
+                    return False
+            return True
+
+        found = filter(matches, objects)
+        stop = None if limit is None else offset + limit
+        if not ordered:
+            def key(obj):
+                value = getattr(obj, order)
+                return (value is None) != descending, value, obj.id
+            if stop is None:
+                found = sorted(found, key=key, reverse=descending)
+            elif descending:
+                found = heapq.nlargest(stop, found, key=key)
+            else:
+                found = heapq.nsmallest(stop, found, key=key)
+        return list(islice(found, offset, stop))
+
+    def _hash_ids(self, name, value):
+        if name in self._unique:
+            obj_id = self._unique[name].get(value)
+            return () if obj_id is None else (obj_id,)
+        return tuple(self._indexes[name].get(value, ()))
+
+    def _sorted_ids(self, name, bounds=None, descending=False):
+        """Ids in `name` order within inclusive `bounds`; without bounds,
+        ids whose value is None follow the others."""
+        low, high = bounds or (None, None)
+        pairs = self._sorted[name].irange(
+            None if low is None else (low,),
+            # Past every pair whose value is `high`, whatever its id
+            None if high is None else (high, chr(0x10FFFF)),
+            reverse=descending)
+        ids = (obj_id for _, obj_id in pairs)
+        if bounds is None:
+            ids = chain(ids, sorted(self._unsorted[name], reverse=descending))
+        return ids
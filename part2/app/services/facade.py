@@ -1,5 +1,6 @@
 
 from app.persistence.repository import InMemoryRepository
+from app.persistence.durable import DurableStorage
 from app.models.user import User
 from app.models.amenity import Amenity
 from app.models.place import Place
@@ -9,10 +10,33 @@ from app.models.review import Review
 class HBnBFacade:
 
     def __init__(self):
-        self.user_repo = InMemoryRepository()
+        self.user_repo = InMemoryRepository(unique=("email",))
         self.amenity_repo = InMemoryRepository()
-        self.place_repo = InMemoryRepository()
-        self.review_repo = InMemoryRepository()
+        self.place_repo = InMemoryRepository(
+            indexes=("owner_id",),
+            sorted_indexes=("price", "latitude", "longitude"))
+        self.review_repo = InMemoryRepository(
+            indexes=("place_id", "user_id"), sorted_indexes=("rating",))
+        self.storage = None
+
+    def open_storage(self, directory, **options):
+        """Persist the repositories under `directory`, first loading what a
+        previous run left there; `options` go to DurableStorage."""
+        self.close_storage()
+        # Referenced objects first: places point at users and amenities,
+        # reviews at users and places
+        self.storage = DurableStorage(directory, {
+            "users": self.user_repo,
+            "amenities": self.amenity_repo,
+            "places": self.place_repo,
+            "reviews": self.review_repo,
+        }, **options)
+        self.storage.open()
+
+    def close_storage(self):
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
 
     # -----------------
     # User operations
@@ -74,6 +98,10 @@ class HBnBFacade:
     def get_all_places(self):
         return self.place_repo.get_all()
 
+    def find_places(self, filters=None, order_by=None, limit=None, offset=0):
+        """Places matching `filters`, see InMemoryRepository.find."""
+        return self.place_repo.find(filters, order_by, limit, offset)
+
     def update_place(self, place_id, place_data):
         place = self.get_place(place_id)
         if not place:
@@ -152,7 +180,11 @@ class HBnBFacade:
         return self.review_repo.get_all()
 
     def get_reviews_by_place(self, place_id):
-        return [r for r in self.review_repo.get_all() if r.place_id == place_id]
+        # Read from the place_id index, which follows reviews moving places
+        return self.review_repo.get_all_by_attribute("place_id", place_id)
+
+    def get_reviews_by_user(self, user_id):
+        return self.review_repo.get_all_by_attribute("user_id", user_id)
 
     def update_review(self, review_id, review_data):
         review = self.get_review(review_id)
@@ -0,0 +1,127 @@
+"""Benchmark restart time of the persisted in-memory repositories.
+
+Writes --objects objects (mostly reviews) through a facade journaling to a
+throw-away data directory, then restarts from:
+
+* snapshot + tail: a snapshot of everything, then --tail journaled updates
+* journal only: the same writes, never snapshotted, replayed one by one
+
+and times journaled writes with and without waiting for fsync, where
+concurrent writers share each fsync (group commit):
+
+    python benchmarks/bench_restart.py --objects 1000000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.models.review import Review  # noqa: E402
+from app.services.facade import HBnBFacade  # noqa: E402
+
+
+def populate(facade, objects):
+    users = [facade.create_user({'first_name': 'B', 'last_name': 'User',
+                                 'email': f'user{i}@bench.io'})
+             for i in range(max(1, objects // 100))]
+    places = [facade.create_place({
+        'title': f'Place {i}', 'price': i % 500, 'latitude': 0,
+        'longitude': 0, 'owner_id': users[i % len(users)].id})
+        for i in range(max(1, objects // 100))]
+    reviews = objects - len(users) - len(places)
+    for i in range(reviews):
+        facade.review_repo.add(Review(
+            text='Bench', rating=1 + i % 5, place=places[i % len(places)],
+            user=users[i % len(users)]))
+    return places
+
+
+def restart(directory):
+    start = time.perf_counter()
+    facade = HBnBFacade()
+    facade.open_storage(directory)
+    elapsed = time.perf_counter() - start
+    count = sum(len(repo.get_all()) for repo in (
+        facade.user_repo, facade.place_repo, facade.review_repo))
+    facade.close_storage()
+    return elapsed, count
+
+
+def size_mb(directory):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for name in os.listdir(directory)) / 2**20
+
+
+def write_rate(directory, threads, writes, durable):
+    facade = HBnBFacade()
+    facade.open_storage(directory, durable=durable, snapshot_every=0)
+    place = facade.create_place({
+        'title': 'Rate', 'price': 1, 'latitude': 0, 'longitude': 0,
+        'owner_id': facade.create_user({
+            'first_name': 'R', 'last_name': 'Ate',
+            'email': 'rate@bench.io'}).id})
+
+    def work():
+        for i in range(writes):
+            facade.place_repo.update(place.id, {'price': i})
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    facade.close_storage()
+    return threads * writes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--objects', type=int, default=1_000_000)
+    parser.add_argument('--tail', type=int, default=10_000)
+    parser.add_argument('--writes', type=int, default=200)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    rows = []
+    for scenario in ('snapshot + tail', 'journal only'):
+        directory = os.path.join(root, scenario.split()[0])
+        facade = HBnBFacade()
+        # Loading speed is not measured here: skip the per-write fsync wait
+        facade.open_storage(directory, durable=False, snapshot_every=0)
+        start = time.perf_counter()
+        places = populate(facade, args.objects)
+        if scenario == 'snapshot + tail':
+            facade.storage.snapshot()
+        for i in range(args.tail):
+            facade.place_repo.update(places[i % len(places)].id,
+                                     {'price': i % 700})
+        facade.close_storage()
+        written = time.perf_counter() - start
+        elapsed, count = restart(directory)
+        rows.append((scenario, count, written, size_mb(directory), elapsed))
+
+    print(f"\n{'restart from':<18}{'objects':>10}{'write s':>9}{'MB':>8}"
+          f"{'restart s':>11}")
+    for scenario, count, written, size, elapsed in rows:
+        print(f"{scenario:<18}{count:>10}{written:>9.1f}{size:>8.1f}"
+              f"{elapsed:>11.2f}")
+
+    print(f"\n{'journaled writes':<28}{'threads':>8}{'writes/s':>11}")
+    for durable in (True, False):
+        for threads in (1, 8):
+            directory = os.path.join(root, f'rate-{durable}-{threads}')
+            rate = write_rate(directory, threads, args.writes, durable)
+            label = 'fsync per commit' if durable else 'background fsync'
+            print(f"{label:<28}{threads:>8}{rate:>11.0f}")
+    shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
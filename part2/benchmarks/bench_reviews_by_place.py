@@ -0,0 +1,82 @@
+"""Benchmark reviews-by-place lookups: full scan vs the place_id index.
+
+Fills a facade's review repository with --reviews reviews spread over
+--places places, then times get_reviews_by_place against the previous
+list comprehension over get_all(), and a review moving between places:
+
+    python benchmarks/bench_reviews_by_place.py --reviews 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.models.review import Review  # noqa: E402
+from app.services.facade import HBnBFacade  # noqa: E402
+
+
+def populate(facade, places, users, reviews):
+    owner = facade.create_user({'first_name': 'B', 'last_name': 'Owner',
+                                'email': 'owner@bench.io'})
+    place_list = [facade.create_place({
+        'title': f'Place {i}', 'price': 10, 'latitude': 0, 'longitude': 0,
+        'owner_id': owner.id}) for i in range(places)]
+    user_list = [facade.create_user({
+        'first_name': 'B', 'last_name': 'User',
+        'email': f'user{i}@bench.io'}) for i in range(users)]
+    # Built directly: create_review's existence checks are not measured
+    for i in range(reviews):
+        facade.review_repo.add(Review(
+            text='Bench', rating=1 + i % 5, place=place_list[i % places],
+            user=user_list[i % users]))
+    return place_list
+
+
+def timed(count, lookup):
+    start = time.perf_counter()
+    for _ in range(count):
+        lookup()
+    return (time.perf_counter() - start) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=1_000_000)
+    parser.add_argument('--places', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--lookups', type=int, default=10_000)
+    parser.add_argument('--scans', type=int, default=5)
+    args = parser.parse_args()
+
+    facade = HBnBFacade()
+    start = time.perf_counter()
+    places = populate(facade, args.places, args.users, args.reviews)
+    print(f"loaded {args.reviews} reviews in "
+          f"{time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(0)
+    repo = facade.review_repo
+
+    def full_scan():
+        place_id = rng.choice(places).id
+        return [r for r in repo.get_all() if r.place_id == place_id]
+
+    scan = timed(args.scans, full_scan)
+    indexed = timed(args.lookups, lambda: facade.get_reviews_by_place(
+        rng.choice(places).id))
+    review = repo.get_all()[0]
+    moved = timed(args.lookups, lambda: facade.update_review(
+        review.id, {'place_id': rng.choice(places).id}))
+
+    print(f"\n{'operation':<34}{'ms/op':>12}")
+    print(f"{'reviews by place, full scan':<34}{scan:>12.3f}")
+    print(f"{'reviews by place, indexed':<34}{indexed:>12.4f}"
+          f"{scan / indexed:>10.0f}x")
+    print(f"{'update_review moving place':<34}{moved:>12.4f}")
+
+
+if __name__ == '__main__':
+    main()
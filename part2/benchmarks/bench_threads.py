@@ -0,0 +1,109 @@
+"""Benchmark the shared facade under 1, 4 and 16 threads.
+
+Each thread runs for --seconds against one in-memory facade holding
+--places places and --reviews reviews, doing one of:
+
+* read: a place's reviews, then a page of places by price
+* write: a place price update
+* mixed: nine reads for each write
+
+Reads take no lock; writes serialize on their repository's lock. The
+"unlocked" row reruns the single-threaded writes with that lock replaced by
+a no-op, to show what thread safety costs a lone writer:
+
+    python benchmarks/bench_threads.py --seconds 2
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.models.review import Review  # noqa: E402
+from app.services.facade import HBnBFacade  # noqa: E402
+
+
+def populate(places, reviews):
+    facade = HBnBFacade()
+    owner = facade.create_user({'first_name': 'B', 'last_name': 'User',
+                                'email': 'owner@bench.io'})
+    created = [facade.create_place({
+        'title': f'Place {i}', 'price': 1 + i % 500, 'latitude': 0,
+        'longitude': 0, 'owner_id': owner.id}) for i in range(places)]
+    for i in range(reviews):
+        facade.review_repo.add(Review(text='Bench', rating=1 + i % 5,
+                                      place=created[i % places], user=owner))
+    return facade, [place.id for place in created]
+
+
+def read(facade, place_ids, rng):
+    facade.get_reviews_by_place(rng.choice(place_ids))
+    low = rng.randint(1, 400)
+    facade.find_places({'price': (low, low + 100)}, 'price', limit=20)
+
+
+def write(facade, place_ids, rng):
+    facade.update_place(rng.choice(place_ids),
+                        {'price': rng.randint(1, 500)})
+
+
+def mixed(facade, place_ids, rng):
+    if rng.random() < 0.1:
+        write(facade, place_ids, rng)
+    else:
+        read(facade, place_ids, rng)
+
+
+def throughput(facade, place_ids, operation, threads, seconds):
+    counts = [0] * threads
+    stop = threading.Event()
+
+    def work(slot):
+        rng = random.Random(slot)
+        done = 0
+        while not stop.is_set():
+            operation(facade, place_ids, rng)
+            done += 1
+        counts[slot] = done
+
+    workers = [threading.Thread(target=work, args=(slot,))
+               for slot in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--places', type=int, default=10_000)
+    parser.add_argument('--reviews', type=int, default=100_000)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    facade, place_ids = populate(args.places, args.reviews)
+    operations = {'read': read, 'write': write, 'mixed': mixed}
+
+    print(f"\n{'workload':<10}" + ''.join(f"{f'{n} thr ops/s':>16}"
+                                         for n in (1, 4, 16)))
+    for name, operation in operations.items():
+        rates = [throughput(facade, place_ids, operation, threads,
+                            args.seconds) for threads in (1, 4, 16)]
+        print(f"{name:<10}" + ''.join(f"{rate:>16.0f}" for rate in rates))
+
+    lock = facade.place_repo._lock
+    facade.place_repo._lock = contextlib.nullcontext()
+    rate = throughput(facade, place_ids, write, 1, args.seconds)
+    facade.place_repo._lock = lock
+    print(f"{'unlocked':<10}{rate:>16.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,16 @@ import os
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'default_secret_key')
     DEBUG = False
+    # Directory persisting the in-memory repositories; unset keeps
+    # everything in memory only
+    DATA_DIR = os.getenv('HBNB_DATA_DIR')
+    # False acknowledges writes before their journal fsync, which then
+    # happens at most JOURNAL_SYNC_INTERVAL seconds later
+    JOURNAL_DURABLE = os.getenv('HBNB_JOURNAL_DURABLE', '1') != '0'
+    JOURNAL_SYNC_INTERVAL = float(os.getenv('HBNB_JOURNAL_SYNC_INTERVAL',
+                                            '0'))
+    # Journal records between background snapshots
+    SNAPSHOT_EVERY = int(os.getenv('HBNB_SNAPSHOT_EVERY', '100000'))
 
 
 class DevelopmentConfig(Config):
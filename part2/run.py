@@ -1,6 +1,9 @@
 from app import create_app
+from config import config
 
-app = create_app()
+app = create_app(config['default'])
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # The reloader runs the app in a child process, which could not open
+    # the data directory the parent already holds
+    app.run(debug=True, use_reloader=not app.config.get('DATA_DIR'))
@@ -1,15 +1,16 @@
 import unittest
 from app import create_app
-from app.persistence.repository import InMemoryRepository
+from app.services.facade import HBnBFacade
 
 
 def reset_facade():
     """Reset the shared facade singleton between tests."""
     from app.services import facade
-    facade.user_repo = InMemoryRepository()
-    facade.amenity_repo = InMemoryRepository()
-    facade.place_repo = InMemoryRepository()
-    facade.review_repo = InMemoryRepository()
+    fresh = HBnBFacade()
+    facade.user_repo = fresh.user_repo
+    facade.amenity_repo = fresh.amenity_repo
+    facade.place_repo = fresh.place_repo
+    facade.review_repo = fresh.review_repo
 
 
 class TestUserEndpoints(unittest.TestCase):
@@ -282,6 +283,22 @@ class TestPlaceEndpoints(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(len(res.get_json()), 1)
 
+    def test_get_places_filtered_and_ordered(self):
+        for title, price in (("A", 80.0), ("B", 120.0), ("C", 100.0)):
+            self.client.post('/api/v1/places/', json=dict(
+                self.place_payload, title=title, price=price))
+        res = self.client.get('/api/v1/places/?min_price=90&order_by=-price')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([p['title'] for p in res.get_json()], ['B', 'C'])
+        res = self.client.get('/api/v1/places/?order_by=price&limit=1'
+                              '&offset=1')
+        self.assertEqual([p['title'] for p in res.get_json()], ['C'])
+
+    def test_get_places_invalid_query(self):
+        for query in ('min_price=cheap', 'limit=-1', 'order_by=owner'):
+            res = self.client.get(f'/api/v1/places/?{query}')
+            self.assertEqual(res.status_code, 400)
+
     # ── GET /api/v1/places/<id> ───────────────────────────────────────────────
 
     def test_get_place_by_id(self):
@@ -0,0 +1,476 @@
+import os
+import random
+import sys
+import threading
+import time
+from unittest import mock
+import pytest
+from app.models.user import User
+from app.models.place import Place
+from app.models.review import Review
+from app.persistence.repository import (InMemoryRepository,
+                                        DuplicateKeyError, _SortedList)
+from app.persistence.durable import (DurableStorage, Journal,
+                                     StorageLockedError)
+from app.services.facade import HBnBFacade
+
+
+# ── Helpers ──────────────────────────────────────────────────────────────────
+
+def make_user(email="a@example.com"):
+    return User(first_name="Alice", last_name="Smith", email=email)
+
+
+def make_place(owner, title="House"):
+    return Place(title=title, description="", price=50,
+                 latitude=0, longitude=0, owner=owner)
+
+
+def make_review(place, user, rating=4):
+    return Review(text="Nice", rating=rating, place=place, user=user)
+
+
+# ── Hash indexes ─────────────────────────────────────────────────────────────
+
+def test_unique_index_lookup_and_rejection():
+    repo = InMemoryRepository(unique=("email",))
+    alice = make_user("alice@example.com")
+    repo.add(alice)
+    assert repo.get_by_attribute("email", "alice@example.com") is alice
+    assert repo.get_by_attribute("email", "bob@example.com") is None
+
+    with pytest.raises(DuplicateKeyError):
+        repo.add(make_user("alice@example.com"))
+    assert len(repo.get_all()) == 1
+    # Re-adding the same object is not a conflict
+    repo.add(alice)
+
+
+def test_update_moves_index_entries():
+    repo = InMemoryRepository(unique=("email",))
+    alice, bob = make_user("alice@example.com"), make_user("bob@example.com")
+    repo.add(alice)
+    repo.add(bob)
+
+    repo.update(alice.id, {"email": "alice@new.com"})
+    assert repo.get_by_attribute("email", "alice@example.com") is None
+    assert repo.get_by_attribute("email", "alice@new.com") is alice
+
+    # A taken value is refused before the object is modified
+    with pytest.raises(DuplicateKeyError):
+        repo.update(bob.id, {"email": "alice@new.com", "first_name": "Bo"})
+    assert (bob.email, bob.first_name) == ("bob@example.com", "Alice")
+
+    repo.delete(alice.id)
+    assert repo.get_by_attribute("email", "alice@new.com") is None
+    repo.add(make_user("alice@new.com"))
+
+
+def test_direct_model_update_is_tracked():
+    repo = InMemoryRepository(unique=("email",))
+    alice = make_user("alice@example.com")
+    repo.add(alice)
+    alice.update({"email": "changed@example.com"})
+    assert repo.get_by_attribute("email", "changed@example.com") is alice
+    assert repo.get_by_attribute("email", "alice@example.com") is None
+
+    # A failed validation changes nothing, in the object or the index
+    with pytest.raises(ValueError):
+        alice.update({"email": "other@example.com", "last_name": ""})
+    assert (alice.email, alice.last_name) == ("changed@example.com", "Smith")
+    assert repo.get_by_attribute("email", "changed@example.com") is alice
+    assert repo.get_by_attribute("email", "other@example.com") is None
+
+
+def test_non_unique_index_on_derived_attribute():
+    repo = InMemoryRepository(indexes=("place_id", "user_id"))
+    owner, guest = make_user("o@example.com"), make_user("g@example.com")
+    house, flat = make_place(owner), make_place(owner, "Flat")
+    first, second = make_review(house, guest), make_review(house, owner)
+    repo.add(first)
+    repo.add(second)
+    assert repo.get_all_by_attribute("place_id", house.id) == [first, second]
+    assert repo.get_by_attribute("user_id", guest.id) is first
+
+    # Review.place_id follows the `place` attribute
+    repo.update(first.id, {"place": flat})
+    assert repo.get_all_by_attribute("place_id", house.id) == [second]
+    assert repo.get_all_by_attribute("place_id", flat.id) == [first]
+
+    repo.delete(second.id)
+    assert repo.get_all_by_attribute("place_id", house.id) == []
+
+
+def test_unindexed_attributes_still_scan():
+    repo = InMemoryRepository(unique=("email",))
+    alice = make_user()
+    repo.add(alice)
+    assert repo.get_by_attribute("first_name", "Alice") is alice
+    assert repo.get_all_by_attribute("last_name", "Smith") == [alice]
+
+
+# ── Facade review relations ──────────────────────────────────────────────────
+
+def test_facade_reviews_follow_writes():
+    facade = HBnBFacade()
+    owner = facade.create_user({"first_name": "O", "last_name": "Wner",
+                                "email": "owner@example.com"})
+    guest = facade.create_user({"first_name": "G", "last_name": "Uest",
+                                "email": "guest@example.com"})
+    house, flat = (facade.create_place({
+        "title": title, "price": 10, "latitude": 0, "longitude": 0,
+        "owner_id": owner.id}) for title in ("House", "Flat"))
+    review = facade.create_review({"text": "Nice", "rating": 5,
+                                   "user_id": guest.id,
+                                   "place_id": house.id})
+    assert facade.get_reviews_by_place(house.id) == [review]
+    assert facade.get_reviews_by_user(guest.id) == [review]
+
+    facade.update_review(review.id, {"place_id": flat.id,
+                                     "user_id": owner.id})
+    assert facade.get_reviews_by_place(house.id) == []
+    assert facade.get_reviews_by_place(flat.id) == [review]
+    assert facade.get_reviews_by_user(guest.id) == []
+    assert facade.get_reviews_by_user(owner.id) == [review]
+
+    facade.delete_review(review.id)
+    assert facade.get_reviews_by_place(flat.id) == []
+    assert facade.get_reviews_by_user(owner.id) == []
+
+
+# ── Sorted indexes and find ──────────────────────────────────────────────────
+
+def make_places(repo, prices):
+    owner = make_user()
+    places = [make_place(owner, f"P{i}") for i in range(len(prices))]
+    for place, price in zip(places, prices):
+        place.price = price
+        repo.add(place)
+    return places
+
+
+def titles(places):
+    return [p.title for p in places]
+
+
+def test_find_range_order_and_paging():
+    repo = InMemoryRepository(sorted_indexes=("price",))
+    make_places(repo, [30, 10, 50, 20, 40])
+    assert titles(repo.find({"price": (15, 45)}, "price")) == \
+        ["P3", "P0", "P4"]
+    assert titles(repo.find({"price": (None, 30)}, "-price")) == \
+        ["P0", "P3", "P1"]
+    assert titles(repo.find(order_by="price", limit=2, offset=1)) == \
+        ["P3", "P0"]
+    assert titles(repo.find({"price": (60, None)})) == []
+
+
+def test_find_without_index_matches_indexed():
+    prices = [7, 3, 3, 9, 1, 5, 3, 8]
+    indexed = InMemoryRepository(sorted_indexes=("price",))
+    plain = InMemoryRepository()
+    for place in make_places(indexed, prices):
+        plain.add(place)
+    for order_by in ("price", "-price"):
+        for filters in ({}, {"price": (3, 8)}):
+            for limit, offset in ((None, 0), (3, 0), (2, 3)):
+                assert indexed.find(filters, order_by, limit, offset) == \
+                    plain.find(filters, order_by, limit, offset)
+
+
+def test_sorted_index_follows_updates():
+    repo = InMemoryRepository(indexes=("title",), sorted_indexes=("price",))
+    cheap, dear = make_places(repo, [10, 20])
+    repo.update(cheap.id, {"price": 30})
+    assert titles(repo.find(order_by="price")) == ["P1", "P0"]
+    cheap.update({"price": 5})
+    assert titles(repo.find({"price": (None, 15)})) == ["P0"]
+    repo.delete(dear.id)
+    assert titles(repo.find(order_by="-price")) == ["P0"]
+    # An equality filter on a hash index combines with a range
+    assert titles(repo.find({"title": "P0", "price": (1, 9)})) == ["P0"]
+    assert titles(repo.find({"title": "P0", "price": (6, 9)})) == []
+
+
+def test_sorted_list_matches_sorted():
+    items, reference = _SortedList(), []
+    rng = random.Random(0)
+    with mock.patch.object(_SortedList, "LOAD", 4):
+        for _ in range(500):
+            item = (rng.randint(0, 20), str(rng.random()))
+            if reference and rng.random() < 0.3:
+                item = rng.choice(reference)
+                items.remove(item)
+                reference.remove(item)
+            else:
+                items.add(item)
+                reference.append(item)
+            reference.sort()
+            assert list(items) == reference
+        for low, high in ((None, None), ((5,), (12, "~")), ((30,), None)):
+            expected = [x for x in reference
+                        if (low is None or x >= low)
+                        and (high is None or x <= high)]
+            assert list(items.irange(low, high)) == expected
+            assert list(items.irange(low, high, reverse=True)) == \
+                expected[::-1]
+
+
+# ── Concurrent access ────────────────────────────────────────────────────────
+
+def run_threads(*targets):
+    errors = []
+
+    def run(target):
+        try:
+            target()
+        except Exception as error:  # reported by the main thread
+            errors.append(error)
+
+    threads = [threading.Thread(target=run, args=(target,))
+               for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+class PricedUser(User):
+    """A user whose price setter lets other threads run mid-update."""
+
+    @property
+    def price(self):
+        return self._price
+
+    @price.setter
+    def price(self, value):
+        time.sleep(0)
+        self._price = value
+
+
+def test_concurrent_writers_and_readers_stay_consistent():
+    repo = InMemoryRepository(unique=("email",), indexes=("first_name",),
+                              sorted_indexes=("price",))
+    users = [PricedUser(first_name="Alice", last_name="Smith",
+                        email=f"u{i}@example.com") for i in range(8)]
+    for user in users:
+        user.price = 0
+        repo.add(user)
+    stop = threading.Event()
+
+    def writer(seed):
+        def write():
+            rng = random.Random(seed)
+            for step in range(200):
+                user = rng.choice(users)
+                price = rng.randint(0, 100)
+                # first_name and price always change together
+                changes = {"first_name": f"P{price}", "price": price}
+                if step % 10 == 0:
+                    changes["email"] = f"u{rng.randrange(12)}@example.com"
+                try:
+                    repo.update(user.id, changes)
+                except DuplicateKeyError:
+                    pass
+        return write
+
+    def reader():
+        while not stop.is_set():
+            # An update is never seen half applied
+            for user in repo.get_all():
+                state = vars(user)
+                assert state["_first_name"] == f"P{state['_price']}" or \
+                    state["_price"] == 0
+
+    def index_reader():
+        while not stop.is_set():
+            # Each object is read whole, but not all of them at one moment:
+            # emails may move between users mid-scan
+            for user in repo.find({"price": (0, 100)}, "price"):
+                assert repo.get_by_attribute("email", user.email) in \
+                    users + [None]
+
+    def write_all():
+        try:
+            run_threads(*(writer(seed) for seed in range(2)))
+        finally:
+            stop.set()
+
+    # Readers spin: hand the GIL back to a yielding writer quickly
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        run_threads(write_all, reader, index_reader)
+    finally:
+        sys.setswitchinterval(interval)
+
+    # Indexes agree with the objects once writes settle
+    for user in users:
+        assert repo.get_by_attribute("email", user.email) is user
+        assert user in repo.get_all_by_attribute("first_name",
+                                                 user.first_name)
+    assert repo.find(order_by="price") == sorted(
+        users, key=lambda user: (user.price, user.id))
+
+
+def test_concurrent_adds_of_one_email_keep_one(tmp_path):
+    facade = open_facade(tmp_path)
+    created = []
+
+    def create():
+        try:
+            created.append(facade.create_user({
+                "first_name": "A", "last_name": "B",
+                "email": "same@example.com"}))
+        except DuplicateKeyError:
+            pass
+
+    run_threads(*[create] * 8)
+    facade.close_storage()
+    assert len(created) == 1
+    assert [u.id for u in open_facade(tmp_path).get_users()] == \
+        [created[0].id]
+
+
+# ── Snapshot and journal persistence ─────────────────────────────────────────
+
+def open_facade(directory, **options):
+    facade = HBnBFacade()
+    facade.open_storage(str(directory), **options)
+    return facade
+
+
+def populate(facade):
+    owner = facade.create_user({"first_name": "O", "last_name": "Wner",
+                                "email": "owner@example.com"})
+    wifi = facade.create_amenity({"name": "Wi-Fi"})
+    place = facade.create_place({
+        "title": "House", "price": 80, "latitude": 1, "longitude": 2,
+        "owner_id": owner.id, "amenities": [wifi.id]})
+    review = facade.create_review({"text": "Nice", "rating": 4,
+                                   "user_id": owner.id,
+                                   "place_id": place.id})
+    return owner, wifi, place, review
+
+
+def test_restart_restores_objects_relations_and_indexes(tmp_path):
+    facade = open_facade(tmp_path)
+    owner, wifi, place, review = populate(facade)
+    facade.storage.snapshot()
+    # Journal tail after the snapshot
+    facade.update_place(place.id, {"price": 120})
+    facade.update_user(owner.id, {"email": "new@example.com"})
+    gone = facade.create_amenity({"name": "Pool"})
+    facade.amenity_repo.delete(gone.id)
+    facade.close_storage()
+
+    restarted = open_facade(tmp_path)
+    loaded = restarted.get_place(place.id)
+    assert (loaded.title, loaded.price) == ("House", 120)
+    assert loaded.created_at == place.created_at
+    assert loaded.owner is restarted.get_user(owner.id)
+    assert loaded.amenities == [restarted.get_amenity(wifi.id)]
+    assert restarted.get_user_by_email("new@example.com").id == owner.id
+    assert restarted.get_user_by_email("owner@example.com") is None
+    assert restarted.get_amenity(gone.id) is None
+    assert [r.id for r in restarted.get_reviews_by_place(place.id)] == \
+        [review.id]
+    assert restarted.find_places({"price": (100, None)}) == [loaded]
+    # Writes after the restart are journaled too
+    restarted.update_review(review.id, {"rating": 2})
+    restarted.close_storage()
+    assert open_facade(tmp_path).get_review(review.id).rating == 2
+
+
+def test_torn_journal_tail_is_dropped(tmp_path):
+    facade = open_facade(tmp_path)
+    owner, *_ = populate(facade)
+    facade.close_storage()
+    with open(tmp_path / "journal.0", "ab") as f:
+        f.write(b"\x40\x00\x00\x00partial")
+
+    restarted = open_facade(tmp_path)
+    assert restarted.get_user(owner.id).email == "owner@example.com"
+    restarted.create_amenity({"name": "Sauna"})
+    restarted.close_storage()
+    assert [a.name for a in open_facade(tmp_path).get_all_amenities()] == \
+        ["Wi-Fi", "Sauna"]
+
+
+def test_periodic_snapshot_compacts_journals(tmp_path):
+    facade = open_facade(tmp_path, snapshot_every=3)
+    populate(facade)
+    facade.close_storage()
+    assert sorted(os.listdir(tmp_path)) == ["journal.1", "lock", "snapshot"]
+    assert len(open_facade(tmp_path).get_all_places()) == 1
+
+
+def test_snapshot_taken_during_writes_loads(tmp_path):
+    facade = open_facade(tmp_path)
+    owner, *_ = populate(facade)
+    encode = DurableStorage._encode
+    written = []
+
+    def encode_and_write(state):
+        # Writes landing while the snapshot is being written out
+        if not written and "_price" in state:
+            written.append(None)
+            place = facade.create_place({
+                "title": "Late", "price": 5, "latitude": 0, "longitude": 0,
+                "owner_id": owner.id})
+            written[0] = facade.create_review({
+                "text": "Late", "rating": 3, "user_id": owner.id,
+                "place_id": place.id})
+        return encode(state)
+
+    with mock.patch.object(DurableStorage, "_encode",
+                           staticmethod(encode_and_write)):
+        facade.storage.snapshot()
+    facade.close_storage()
+
+    restarted = open_facade(tmp_path)
+    review = restarted.get_review(written[0].id)
+    assert review.place is restarted.get_place(written[0].place.id)
+    assert restarted.get_reviews_by_place(review.place_id) == [review]
+
+
+def test_snapshot_covers_records_still_queued(tmp_path):
+    facade = open_facade(tmp_path, durable=False, sync_interval=0.5)
+    a = facade.create_user({"first_name": "A", "last_name": "A",
+                            "email": "p@x.com"})
+    b = facade.create_user({"first_name": "B", "last_name": "B",
+                            "email": "y@x.com"})
+    facade.storage._journal.flush()
+    # Hand x@x.com from A to B, all within one unsynced flush
+    facade.update_user(a.id, {"email": "x@x.com"})
+    facade.update_user(a.id, {"email": "z@x.com"})
+    facade.update_user(b.id, {"email": "x@x.com"})
+    facade.storage.snapshot()
+    facade.close_storage()
+
+    restarted = open_facade(tmp_path)
+    assert restarted.get_user(a.id).email == "z@x.com"
+    assert restarted.get_user_by_email("x@x.com").id == b.id
+
+
+def test_data_directory_opens_once(tmp_path):
+    facade = open_facade(tmp_path)
+    with pytest.raises(StorageLockedError):
+        open_facade(tmp_path)
+    facade.close_storage()
+    open_facade(tmp_path).close_storage()
+
+
+def test_group_commit_shares_fsyncs(tmp_path):
+    journal = Journal(str(tmp_path / "journal"), sync_interval=0.01)
+    with mock.patch("app.persistence.durable.os.fsync",
+                    wraps=os.fsync) as fsync:
+        threads = [threading.Thread(target=journal.append, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    journal.close()
+    assert 1 <= fsync.call_count < 8
@@ -13,11 +13,26 @@ db = SQLAlchemy()
 def create_app(config_class="config.DevelopmentConfig"):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    if app.config.get('PROXY_FIX_X_FOR'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app,
+                                x_for=app.config['PROXY_FIX_X_FOR'])
     api = Api(app, version='1.0', title='HBnB API', description='HBnB Application API', doc='/')
+    from app.api.v1.serializers import output_json
+    api.representation('application/json')(output_json)
 
     bcrypt.init_app(app)
+    from app.passwords import passwords
+    passwords.init_app(app)
     jwt.init_app(app)
     db.init_app(app)
+
+    from app.persistence.transactions import configure_sqlite, configure_writes
+    with app.app_context():
+        configure_sqlite(db.engine, app.config.get('SQLITE_PRAGMAS'))
+    configure_writes(retries=app.config.get('DB_WRITE_RETRIES', 0),
+                     backoff=app.config.get('DB_WRITE_BACKOFF', 0.05),
+                     serialize=app.config.get('DB_SERIALIZE_WRITES', False))
     CORS(app, resources={r"/api/*": {"origins": "*"}},
          supports_credentials=True)
 
@@ -26,11 +41,25 @@ def create_app(config_class="config.DevelopmentConfig"):
     from app.api.v1.places import api as places_ns
     from app.api.v1.reviews import api as reviews_ns
     from app.api.v1.auth import api as auth_ns
+    from app.api.v1.admin import api as admin_ns
 
     api.add_namespace(users_ns, path='/api/v1/users')
     api.add_namespace(amenities_ns, path='/api/v1/amenities')
     api.add_namespace(places_ns, path='/api/v1/places')
     api.add_namespace(reviews_ns, path='/api/v1/reviews')
     api.add_namespace(auth_ns, path='/api/v1/auth')
+    api.add_namespace(admin_ns, path='/api/v1/admin')
+
+    from app.services import facade
+    facade.configure_cache(app.config.get('REPOSITORY_CACHE', {}))
+
+    from app.api.v1.throttling import init_login_throttle
+    init_login_throttle(app)
+
+    from app.compression import init_compression
+    init_compression(app)
+
+    from app.commands import register_commands
+    register_commands(app)
 
     return app
@@ -0,0 +1,32 @@
+from flask_restx import Namespace, Resource
+from flask_jwt_extended import jwt_required, get_jwt
+from app import db
+from app.services import facade
+
+api = Namespace('admin', description='Operational metrics')
+
+
+def pool_status(pool):
+    """Connection counts for pools that track them (QueuePool)."""
+    status = {'class': type(pool).__name__, 'status': pool.status()}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
+
+
+@api.route('/stats')
+class Stats(Resource):
+    @jwt_required()
+    @api.response(200, 'Connection pool and cache metrics')
+    @api.response(403, 'Admin privileges required')
+    def get(self):
+        """Report database pool usage and repository cache counters"""
+        claims = get_jwt()
+        if not claims.get('is_admin', False):
+            return {'error': 'Admin privileges required'}, 403
+        return {
+            'pool': pool_status(db.engine.pool),
+            'cache': facade.cache_stats()
+        }, 200
@@ -1,5 +1,10 @@
 from flask_restx import Namespace, Resource, fields
 from app.services import facade
+from app.api.v1.ndjson import read_bulk_items, bulk_chunk_size, bulk_response
+from app.api.v1.serializers import AMENITY, json_response
+from app.api.v1.conditional import (conditional, collection_etag,
+                                    resource_etag, precondition_failed,
+                                    validator_headers)
 from flask_jwt_extended import jwt_required, get_jwt
 
 api = Namespace('amenities', description='Amenity operations')
@@ -26,28 +31,53 @@ class AmenityList(Resource):
             new_amenity = facade.create_amenity(amenity_data)
         except (ValueError, KeyError) as e:
             return {'error': str(e)}, 400
-        return {
-            'id': new_amenity.id,
-            'name': new_amenity.name
-        }, 201
+        return AMENITY(new_amenity), 201
 
     @api.response(200, 'List of amenities retrieved successfully')
+    @api.response(304, 'List unchanged since the given validators')
     def get(self):
         """Retrieve a list of all amenities"""
-        amenities = facade.get_all_amenities()
-        return [{'id': a.id, 'name': a.name} for a in amenities], 200
+        versions = facade.collection_version('amenities')
+
+        def build():
+            return json_response(facade.get_all_amenities(), AMENITY)
+
+        return conditional(collection_etag(versions), None, build)
+
+
+@api.route('/bulk')
+class AmenityBulk(Resource):
+    @api.expect([amenity_model])
+    @api.response(200, 'Bulk import processed, see per-item errors')
+    @api.response(400, 'Invalid request body')
+    @api.response(403, 'Admin privileges required')
+    @jwt_required()
+    def post(self):
+        """Import amenities from a JSON array or an NDJSON stream (admin)"""
+        claims = get_jwt()
+        if not claims.get('is_admin', False):
+            return {'error': 'Admin privileges required'}, 403
+        try:
+            items = read_bulk_items()
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        created, errors = facade.bulk_create_amenities(
+            items, chunk_size=bulk_chunk_size())
+        return bulk_response(created, errors)
 
 
 @api.route('/<amenity_id>')
 class AmenityResource(Resource):
     @api.response(200, 'Amenity details retrieved successfully')
+    @api.response(304, 'Amenity unchanged since the given validators')
     @api.response(404, 'Amenity not found')
     def get(self, amenity_id):
         """Get amenity details by ID"""
         amenity = facade.get_amenity(amenity_id)
         if not amenity:
             return {'error': 'Amenity not found'}, 404
-        return {'id': amenity.id, 'name': amenity.name}, 200
+        return conditional(resource_etag(amenity), amenity.updated_at,
+                           lambda: (AMENITY(amenity), 200))
 
     @jwt_required()
     @api.expect(amenity_model)
@@ -60,10 +90,18 @@ class AmenityResource(Resource):
         if not claims.get('is_admin', False):
             return {'error': 'Admin privileges required'}, 403
         amenity_data = api.payload
+        amenity = facade.get_amenity(amenity_id)
+        if not amenity:
+            return {'error': 'Amenity not found'}, 404
+        failed = precondition_failed(amenity)
+        if failed:
+            return failed
         try:
             updated_amenity = facade.update_amenity(amenity_id, amenity_data)
         except (ValueError, KeyError) as e:
             return {'error': str(e)}, 400
         if not updated_amenity:
             return {'error': 'Amenity not found'}, 404
-        return {'id': updated_amenity.id, 'name': updated_amenity.name}, 200
+        return (AMENITY(updated_amenity), 200,
+                validator_headers(resource_etag(updated_amenity),
+                                  updated_amenity.updated_at))
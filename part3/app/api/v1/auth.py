@@ -1,6 +1,8 @@
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from app.services import facade
+from app.api.v1.throttling import login_retry_after, busy
+from app.passwords import PasswordServiceBusy
 
 api = Namespace('auth', description='Authentication operations')
 
@@ -14,16 +16,26 @@ login_model = api.model('Login', {
 @api.route('/login')
 class Login(Resource):
     @api.expect(login_model)
+    @api.response(429, 'Too many login attempts')
+    @api.response(503, 'Password service busy')
     def post(self):
         """Authenticate user and return a JWT token"""
         credentials = api.payload
         # Get the email and password from the request payload
 
-        # Step 1: Retrieve the user based on the provided email
-        user = facade.get_user_by_email(credentials['email'])
-
-        # Step 2: Check if the user exists and the password is correct
-        if not user or not user.verify_password(credentials['password']):
+        # Step 1: Turn away floods before any password hashing
+        retry_after = login_retry_after(credentials['email'])
+        if retry_after is not None:
+            return ({'error': 'Too many login attempts, try again later'},
+                    429, {'Retry-After': str(retry_after)})
+
+        # Step 2: Check the user exists and the password is correct
+        try:
+            user = facade.authenticate(credentials['email'],
+                                       credentials['password'])
+        except PasswordServiceBusy as e:
+            return busy(e)
+        if not user:
             return {'error': 'Invalid credentials'}, 401
 
         # Step 3: Create a JWT token with the user's id and is_admin flag
@@ -0,0 +1,18 @@
+from flask import request
+
+
+def owner_write(claims):
+    """True when a write can go through the facade's *_owned methods, which
+    check ownership inside the UPDATE or DELETE itself: the caller is not
+    an admin (admins may write any row, so theirs load it once) and sent no
+    If-Match (which needs the stored version)."""
+    return (not claims.get('is_admin', False)
+            and request.headers.get('If-Match') is None)
+
+
+def not_owned(obj, name):
+    """Response for an owned write that matched no row: the row is missing,
+    or it belongs to someone else."""
+    if obj is None:
+        return {'error': f'{name} not found'}, 404
+    return {'error': 'Unauthorized action'}, 403
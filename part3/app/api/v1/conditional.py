@@ -0,0 +1,106 @@
+import hashlib
+from datetime import timezone
+from flask import Response, request
+from werkzeug.http import http_date, unquote_etag
+from app.compression import strip_encoding
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def object_version(obj):
+    """Version of one row, changing whenever updated_at does."""
+    return _digest(obj.id, obj.updated_at)
+
+
+def resource_etag(obj, variant=None, related=()):
+    """Strong ETag of a single-object representation.
+
+    It starts with the object's own version, the part compared by
+    If-Match. When the body depends on request options (`variant`) or on
+    related rows (`related` objects), those are folded into a suffix, so
+    the tag changes whenever the body does.
+    """
+    version = object_version(obj)
+    if variant is None and not related:
+        return f'"{version}"'
+    related = sorted((o.id, o.updated_at) for o in related if o is not None)
+    return f'"{version}-{_digest(variant, related)}"'
+
+
+def collection_etag(versions):
+    """Weak ETag of a list from the versions of the collections it reads
+    and the request that shaped it.
+
+    Lists carry no Last-Modified: deleting a row other than the newest
+    leaves the latest updated_at unchanged, while the version counters see
+    every write."""
+    accept = request.accept_mimetypes.best_match(['application/json',
+                                                  'application/x-ndjson'])
+    return f'W/"{_digest(versions, request.full_path, accept)}"'
+
+
+def latest(*timestamps):
+    return max((t for t in timestamps if t is not None), default=None)
+
+
+def _not_modified(etag, modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+    if request.headers.get('If-None-Match') is not None:
+        tags = request.if_none_match
+        # Tags of compressed copies match too, by their unencoded value
+        value = unquote_etag(etag)[0]
+        return tags.star_tag or any(
+            strip_encoding(tag) == value
+            for tag in tags.as_set(include_weak=True))
+    since = request.if_modified_since
+    if since is None or modified is None:
+        return False
+    # HTTP dates have a one-second resolution
+    modified = modified.replace(microsecond=0, tzinfo=timezone.utc)
+    return modified <= since
+
+
+def validator_headers(etag, modified=None):
+    headers = {'ETag': etag}
+    if modified is not None:
+        headers['Last-Modified'] = http_date(modified.replace(
+            tzinfo=timezone.utc))
+    return headers
+
+
+def conditional(etag, modified, build):
+    """Answer 304 when the client's copy is current, without calling
+    `build`; otherwise return build()'s response with ETag and
+    Last-Modified attached."""
+    headers = validator_headers(etag, modified)
+    if _not_modified(etag, modified):
+        return Response(status=304, headers=headers)
+    result = build()
+    if isinstance(result, Response):
+        result.headers.update(headers)
+        return result
+    data, status = result
+    if status != 200:
+        return data, status
+    return data, status, headers
+
+
+def precondition_failed(obj):
+    """Check If-Match before modifying `obj` (optimistic concurrency).
+
+    Any strong ETag returned by a GET of the resource matches while the
+    object is unchanged, compressed or not. The comparison is strong (RFC
+    9110): weak tags never match. Returns an error response to send, or
+    None to proceed.
+    """
+    if request.headers.get('If-Match') is None:
+        return None
+    tags = request.if_match
+    if tags.star_tag:
+        return None
+    version = object_version(obj)
+    if any(tag.split('-')[0] == version for tag in tags.as_set()):
+        return None
+    return {'error': 'Resource was modified; fetch it again and retry'}, 412
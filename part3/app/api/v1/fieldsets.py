@@ -0,0 +1,19 @@
+from flask import request
+
+
+def requested_names(param, allowed, default):
+    """Read a comma-separated query parameter such as ?fields= or ?embed=.
+
+    Returns `default` when the parameter is absent, otherwise the names in
+    request order without duplicates. Raises ValueError on unknown names.
+    """
+    value = request.args.get(param)
+    if value is None:
+        return default
+    names = list(dict.fromkeys(name.strip() for name in value.split(',')
+                               if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown {param}: {', '.join(unknown)}; "
+                         f"expected any of {', '.join(allowed)}")
+    return names
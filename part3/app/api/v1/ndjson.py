@@ -0,0 +1,72 @@
+import json
+from flask import Response, current_app, request, stream_with_context
+from app.api.v1.serializers import dumps
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Serialized rows per chunk written to the streaming response
+STREAM_BATCH = 500
+
+
+def wants_ndjson():
+    """True when the client prefers application/x-ndjson over JSON."""
+    best = request.accept_mimetypes.best_match(['application/json',
+                                                NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_response(rows, serialize):
+    """Stream `rows` as one JSON document per line.
+
+    Rows are consumed lazily, so with a server-side cursor peak memory stays
+    bounded by one batch whatever the table size.
+    """
+    def generate():
+        buffer = []
+        for row in rows:
+            buffer.append(dumps(serialize(row)))
+            if len(buffer) >= STREAM_BATCH:
+                yield b'\n'.join(buffer) + b'\n'
+                buffer = []
+        if buffer:
+            yield b'\n'.join(buffer) + b'\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype=NDJSON_MIMETYPE)
+
+
+def read_bulk_items():
+    """Return the items of a bulk request body.
+
+    A JSON array is parsed at once; an application/x-ndjson body is read
+    lazily line by line, so large imports are never held in memory.
+    Malformed lines are yielded as ValueError so they are reported per item.
+    """
+    if request.mimetype == NDJSON_MIMETYPE:
+        return _read_ndjson(request.stream)
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValueError("Body must be a JSON array or NDJSON stream")
+    return items
+
+
+def _read_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield ValueError("Invalid JSON line")
+
+
+def bulk_chunk_size():
+    return current_app.config.get('BULK_CHUNK_SIZE', 500)
+
+
+def bulk_response(created, errors):
+    return {
+        'created': created,
+        'errors': [{'index': index, 'error': message}
+                   for index, message in errors]
+    }, 200
@@ -1,5 +1,15 @@
-from flask_restx import Namespace, Resource, fields
+from flask_restx import Namespace, Resource, fields, inputs
 from app.services import facade
+from app.services.place_repository import PLACE_SORTS
+from app.persistence.search import SearchUnavailableError
+from app.api.v1.ndjson import (read_bulk_items, bulk_chunk_size, bulk_response,
+                               wants_ndjson, ndjson_response)
+from app.api.v1.fieldsets import requested_names
+from app.api.v1.serializers import PLACE, REVIEW, json_response
+from app.api.v1.conditional import (conditional, collection_etag,
+                                    resource_etag, precondition_failed,
+                                    validator_headers, latest)
+from app.api.v1.authorization import owner_write, not_owned
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 
 api = Namespace('places', description='Place operations')
@@ -39,6 +49,111 @@ place_model = api.model('Place', {
         description="List of amenities ID's"),
 })
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Fields selectable with ?fields= (id is always returned)
+PLACE_FIELDS = ('title', 'description', 'price', 'latitude', 'longitude',
+                'owner_id', 'review_count', 'average_rating',
+                'rating_histogram')
+SUMMARY_FIELDS = ('title', 'price', 'latitude', 'longitude', 'review_count',
+                  'average_rating')
+DETAIL_FIELDS = ('title', 'description', 'price', 'latitude', 'longitude',
+                 'review_count', 'average_rating', 'rating_histogram')
+PLACE_EMBEDS = ('owner', 'amenities', 'reviews')
+# Collections whose changes show through each embed, for list versions
+EMBED_COLLECTIONS = {'owner': ['users'], 'amenities': ['amenities'],
+                     'reviews': ['reviews', 'users']}
+
+# Query parameters shaping the place representation
+detail_parser = api.parser()
+detail_parser.add_argument('fields', type=str, location='args',
+                           help='Comma-separated fields to return: '
+                                + ', '.join(PLACE_FIELDS))
+detail_parser.add_argument('embed', type=str, location='args',
+                           help='Comma-separated relationships to include: '
+                                + ', '.join(PLACE_EMBEDS))
+
+# Query parameters for keyset pagination of the place list
+list_parser = detail_parser.copy()
+list_parser.add_argument('limit', type=inputs.int_range(1, MAX_PAGE_SIZE),
+                         location='args', help='Page size')
+list_parser.add_argument('cursor', type=str, location='args',
+                         help='Opaque cursor returned as next_cursor')
+list_parser.add_argument('bbox', type=str, location='args',
+                         help='min_lat,min_lng,max_lat,max_lng')
+list_parser.add_argument('near', type=str, location='args',
+                         help='lat,lng (requires radius_km)')
+list_parser.add_argument('radius_km', type=float, location='args',
+                         help='Search radius around near, in kilometers')
+list_parser.add_argument('min_price', type=float, location='args',
+                         help='Lowest price per night')
+list_parser.add_argument('max_price', type=float, location='args',
+                         help='Highest price per night')
+list_parser.add_argument('amenities', type=str, location='args',
+                         help='Comma-separated amenity IDs, all required')
+list_parser.add_argument('min_rating', type=float, location='args',
+                         help='Lowest average rating (0-5)')
+list_parser.add_argument('sort', type=str, location='args',
+                         choices=list(PLACE_SORTS),
+                         help='Sort order, "-" for descending')
+
+FILTER_ARGS = ('min_price', 'max_price', 'amenities', 'min_rating', 'sort')
+
+# Query parameters for full-text search, paginated by offset
+search_parser = detail_parser.copy()
+search_parser.add_argument('q', type=str, location='args', required=True,
+                           help='Words to find in titles and descriptions; '
+                                'a trailing * matches a prefix')
+search_parser.add_argument('limit', type=inputs.int_range(1, MAX_PAGE_SIZE),
+                           location='args', help='Page size')
+search_parser.add_argument('offset', type=inputs.natural, location='args',
+                           help='Results to skip, as returned in next_offset')
+
+
+def parse_floats(value, count, name):
+    """Parse a comma-separated list of exactly `count` floats."""
+    try:
+        numbers = [float(v) for v in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count:
+        raise ValueError(f"{name} must be {count} comma-separated numbers")
+    return numbers
+
+
+# What POST and PUT echo back
+place_written = PLACE.only(('title', 'description', 'price', 'latitude',
+                            'longitude', 'owner_id'), ('amenities',))
+review_summary = REVIEW.only(('text', 'rating'))
+
+
+def collection_response(embed, build):
+    """Run `build` behind list validators covering places and the
+    collections of the embedded relationships."""
+    names = ['places'] + [name for e in embed for name in EMBED_COLLECTIONS[e]]
+    versions = facade.collection_version(*dict.fromkeys(names))
+    return conditional(collection_etag(versions), None, build)
+
+
+def related_objects(place, embed):
+    """The loaded rows a place representation embeds."""
+    related = []
+    if 'owner' in embed:
+        related.append(place.owner)
+    if 'amenities' in embed:
+        related.extend(place.amenities)
+    if 'reviews' in embed:
+        related.extend(place.reviews)
+        related.extend(r.user for r in place.reviews)
+    return related
+
+
+def requested_shape(default_fields, default_embed):
+    """(fields, embed) from ?fields= and ?embed=, or the defaults."""
+    return (requested_names('fields', PLACE_FIELDS, default_fields),
+            requested_names('embed', PLACE_EMBEDS, default_embed))
+
 
 @api.route('/')
 class PlaceList(Resource):
@@ -55,84 +170,177 @@ class PlaceList(Resource):
             new_place = facade.create_place(place_data)
         except (ValueError, KeyError) as e:
             return {'error': str(e)}, 400
-        return {
-            'id': new_place.id,
-            'title': new_place.title,
-            'description': new_place.description,
-            'price': new_place.price,
-            'latitude': new_place.latitude,
-            'longitude': new_place.longitude,
-            'owner_id': new_place.owner_id,
-            'amenities': [
-                {'id': a.id, 'name': a.name}
-                for a in new_place.amenities
-            ]
-        }, 201
+        return place_written(new_place), 201
 
+    @api.expect(list_parser)
     @api.response(200, 'List of places retrieved successfully')
+    @api.response(304, 'List unchanged since the given validators')
+    @api.response(400, 'Invalid pagination parameters')
     def get(self):
-        """Retrieve a list of all places"""
-        places = facade.get_all_places()
-        return [
-            {
-                'id': p.id,
-                'title': p.title,
-                'price': p.price,
-                'latitude': p.latitude,
-                'longitude': p.longitude
-            } for p in places
-        ], 200
+        """Retrieve a list of places, paginated when limit or cursor is set"""
+        args = list_parser.parse_args()
+        try:
+            fields, embed = requested_shape(SUMMARY_FIELDS, [])
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return collection_response(
+            embed, lambda: self.respond(args, fields, embed))
+
+    def respond(self, args, fields, embed):
+        """Build the list for whichever search the arguments ask for"""
+        represent = PLACE.only(fields, embed)
+        if args['bbox'] or args['near']:
+            return self.geo_search(args, fields, embed, represent)
+        if any(args[name] is not None for name in FILTER_ARGS):
+            return self.filtered(args, fields, embed, represent)
+        if args['limit'] is None and args['cursor'] is None:
+            if wants_ndjson():
+                return ndjson_response(facade.iter_places(fields, embed),
+                                       represent)
+            return json_response(facade.get_all_places(fields, embed),
+                                 represent)
+
+        try:
+            places, next_cursor = facade.get_places_page(
+                args['limit'] or DEFAULT_PAGE_SIZE, args['cursor'],
+                fields, embed)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return json_response({'items': places, 'next_cursor': next_cursor},
+                             represent)
+
+    def filtered(self, args, fields, embed, represent):
+        """Answer a filtered and/or sorted listing, one page at a time"""
+        filters = {name: args[name]
+                   for name in ('min_price', 'max_price', 'min_rating')}
+        if args['amenities']:
+            filters['amenity_ids'] = [a.strip()
+                                      for a in args['amenities'].split(',')
+                                      if a.strip()]
+        try:
+            places, next_cursor = facade.filter_places(
+                filters, args['sort'] or 'created_at',
+                args['limit'] or DEFAULT_PAGE_SIZE, args['cursor'],
+                fields, embed)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return json_response({'items': places, 'next_cursor': next_cursor},
+                             represent)
+
+    def geo_search(self, args, fields, embed, represent):
+        """Answer a bbox or near/radius_km query one page at a time: oldest
+        first for bbox, nearest first for near"""
+        limit = args['limit'] or MAX_PAGE_SIZE
+        try:
+            if args['bbox']:
+                bbox = parse_floats(args['bbox'], 4, 'bbox')
+                items, next_cursor = facade.get_places_in_bbox(
+                    *bbox, limit, args['cursor'], fields, embed)
+            else:
+                if args['radius_km'] is None:
+                    raise ValueError("radius_km is required with near")
+                latitude, longitude = parse_floats(args['near'], 2, 'near')
+                matches, next_cursor = facade.get_places_near(
+                    latitude, longitude, args['radius_km'], limit,
+                    args['cursor'], fields, embed)
+                items = [dict(represent(p), distance_km=round(distance, 3))
+                         for p, distance in matches]
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        if args['limit'] is None and args['cursor'] is None:
+            # Unpaged form: the first page alone
+            return json_response(items, represent)
+        return json_response({'items': items, 'next_cursor': next_cursor},
+                             represent)
+
+
+@api.route('/search')
+class PlaceSearch(Resource):
+    @api.expect(search_parser)
+    @api.response(200, 'Matching places, best match first')
+    @api.response(304, 'Results unchanged since the given validators')
+    @api.response(400, 'Invalid search parameters')
+    @api.response(501, 'Full-text search not available')
+    def get(self):
+        """Search places by title and description, ranked by relevance"""
+        args = search_parser.parse_args()
+        try:
+            fields, embed = requested_shape(SUMMARY_FIELDS, [])
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return collection_response(
+            embed, lambda: self.respond(args, fields, embed))
+
+    def respond(self, args, fields, embed):
+        """Run the search and build one page of results"""
+        represent = PLACE.only(fields, embed)
+        try:
+            results, next_offset = facade.search_places(
+                args['q'], args['limit'] or DEFAULT_PAGE_SIZE,
+                args['offset'] or 0, fields, embed)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        except SearchUnavailableError as e:
+            return {'error': str(e)}, 501
+        return {
+            'items': [
+                dict(represent(p), score=score)
+                for p, score in results
+            ],
+            'next_offset': next_offset
+        }, 200
+
+
+@api.route('/bulk')
+class PlaceBulk(Resource):
+    @api.expect([place_model])
+    @api.response(200, 'Bulk import processed, see per-item errors')
+    @api.response(400, 'Invalid request body')
+    @api.response(403, 'Admin privileges required')
+    @jwt_required()
+    def post(self):
+        """Import places from a JSON array or an NDJSON stream (admin)"""
+        claims = get_jwt()
+        if not claims.get('is_admin', False):
+            return {'error': 'Admin privileges required'}, 403
+        try:
+            items = read_bulk_items()
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        created, errors = facade.bulk_create_places(
+            items, owner_id=get_jwt_identity(),
+            chunk_size=bulk_chunk_size())
+        return bulk_response(created, errors)
 
 
 @api.route('/<place_id>')
 class PlaceResource(Resource):
+    @api.expect(detail_parser)
     @api.response(200, 'Place details retrieved successfully')
+    @api.response(304, 'Place unchanged since the given validators')
+    @api.response(400, 'Unknown field or relationship')
     @api.response(404, 'Place not found')
     def get(self, place_id):
-        """Get place details by ID"""
-        place = facade.get_place(place_id)
+        """Get place details by ID, optionally only some fields"""
+        try:
+            fields, embed = requested_shape(None, None)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        if fields is None and embed is None:
+            place = facade.get_place_details(place_id)
+            fields, embed = DETAIL_FIELDS, PLACE_EMBEDS
+        else:
+            # Asking for either narrows the response to what was named
+            fields = DETAIL_FIELDS if fields is None else fields
+            embed = embed or []
+            place = facade.get_place_details(place_id, fields, embed)
         if not place:
             return {'error': 'Place not found'}, 404
-
-        owner_data = None
-        if place.owner:
-            owner_data = {
-                'id': place.owner.id,
-                'first_name': place.owner.first_name,
-                'last_name': place.owner.last_name,
-                'email': place.owner.email
-            }
-
-        amenities_data = [
-            {'id': a.id, 'name': a.name}
-            for a in place.amenities
-        ]
-
-        reviews_data = [
-            {
-                'id': r.id,
-                'text': r.text,
-                'rating': r.rating,
-                'user_id': r.user_id,
-                'user_name': (
-                    r.user.first_name + ' ' + r.user.last_name
-                    if r.user else 'Unknown'
-                )
-            }
-            for r in place.reviews
-        ]
-
-        return {
-            'id': place.id,
-            'title': place.title,
-            'description': place.description,
-            'price': place.price,
-            'latitude': place.latitude,
-            'longitude': place.longitude,
-            'owner': owner_data,
-            'amenities': amenities_data,
-            'reviews': reviews_data
-        }, 200
+        related = related_objects(place, embed)
+        return conditional(
+            resource_etag(place, (fields, embed), related),
+            latest(place.updated_at, *(o.updated_at for o in related if o)),
+            lambda: (PLACE.only(fields, embed)(place), 200))
 
     @api.expect(place_model)
     @api.response(200, 'Place updated successfully')
@@ -144,6 +352,20 @@ class PlaceResource(Resource):
         current_user = get_jwt_identity()
         claims = get_jwt()
         is_admin = claims.get('is_admin', False)
+        place_data = api.payload or {}
+
+        if (owner_write(claims)
+                and facade.owned_place_update_supported(place_data)):
+            # Ownership check and update in a single statement
+            try:
+                updated_place = facade.update_owned_place(
+                    place_id, current_user, place_data)
+            except (ValueError, KeyError) as e:
+                return {'error': str(e)}, 400
+            if not updated_place:
+                return not_owned(facade.get_place(place_id), 'Place')
+            return self.updated(updated_place)
+
         place = facade.get_place(place_id)
 
         if not place:
@@ -152,7 +374,9 @@ class PlaceResource(Resource):
         if not is_admin and place.owner_id != current_user:
             return {'error': 'Unauthorized action'}, 403
 
-        place_data = api.payload
+        failed = precondition_failed(place)
+        if failed:
+            return failed
 
         try:
             updated_place = facade.update_place(place_id, place_data)
@@ -160,24 +384,17 @@ class PlaceResource(Resource):
             return {'error': str(e)}, 400
         if not updated_place:
             return {'error': 'Place not found'}, 404
-        return {
-            'id': updated_place.id,
-            'title': updated_place.title,
-            'description': updated_place.description,
-            'price': updated_place.price,
-            'latitude': updated_place.latitude,
-            'longitude': updated_place.longitude,
-            'owner_id': updated_place.owner_id,
-            'amenities': [
-                {'id': a.id, 'name': a.name}
-                for a in updated_place.amenities
-            ]
-        }, 200
+        return self.updated(updated_place)
+
+    def updated(self, place):
+        return place_written(place), 200, validator_headers(
+            resource_etag(place), place.updated_at)
 
 
 @api.route('/<place_id>/reviews')
 class PlaceReviewList(Resource):
     @api.response(200, 'List of reviews for the place retrieved successfully')
+    @api.response(304, 'Reviews unchanged since the given validators')
     @api.response(404, 'Place not found')
     def get(self, place_id):
         """Get all reviews for a specific place"""
@@ -185,7 +402,7 @@ class PlaceReviewList(Resource):
         if not place:
             return {'error': 'Place not found'}, 404
         reviews = facade.get_reviews_by_place(place_id)
-        return [
-            {'id': r.id, 'text': r.text, 'rating': r.rating}
-            for r in reviews
-        ], 200
+        return conditional(
+            resource_etag(place, 'reviews', reviews),
+            latest(place.updated_at, *(r.updated_at for r in reviews)),
+            lambda: json_response(reviews, review_summary))
@@ -1,5 +1,13 @@
 from flask_restx import Namespace, Resource, fields
 from app.services import facade
+from app.api.v1.ndjson import (read_bulk_items, bulk_chunk_size, bulk_response,
+                               wants_ndjson, ndjson_response)
+from app.api.v1.fieldsets import requested_names
+from app.api.v1.serializers import REVIEW, json_response
+from app.api.v1.conditional import (conditional, collection_etag,
+                                    resource_etag, precondition_failed,
+                                    validator_headers, latest)
+from app.api.v1.authorization import owner_write, not_owned
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 
 api = Namespace('reviews', description='Review operations')
@@ -11,6 +19,27 @@ review_model = api.model('Review', {
     'place_id': fields.String(required=True, description='ID of the place')
 })
 
+# Fields selectable with ?fields= (id is always returned)
+REVIEW_FIELDS = ('text', 'rating', 'user_id', 'place_id')
+SUMMARY_FIELDS = ('text', 'rating')
+REVIEW_EMBEDS = ('user', 'place')
+EMBED_COLLECTIONS = {'user': 'users', 'place': 'places'}
+
+# Query parameters shaping the review representation
+shape_parser = api.parser()
+shape_parser.add_argument('fields', type=str, location='args',
+                          help='Comma-separated fields to return: '
+                               + ', '.join(REVIEW_FIELDS))
+shape_parser.add_argument('embed', type=str, location='args',
+                          help='Comma-separated relationships to include: '
+                               + ', '.join(REVIEW_EMBEDS))
+
+
+def requested_shape(default_fields):
+    """(fields, embed) from ?fields= and ?embed=."""
+    return (requested_names('fields', REVIEW_FIELDS, default_fields),
+            requested_names('embed', REVIEW_EMBEDS, []))
+
 
 @api.route('/')
 class ReviewList(Resource):
@@ -31,53 +60,87 @@ class ReviewList(Resource):
         if place.owner_id == current_user:
             return {"error": "You cannot review your own place"}, 400
 
-        existing = [r for r in facade.get_reviews_by_place(place.id)
-                    if r.user_id == current_user]
-        if existing:
+        if facade.has_reviewed(current_user, place.id):
             return {"error": "You have already reviewed this place"}, 400
         try:
             new_review = facade.create_review(review_data)
         except (ValueError, KeyError) as e:
             return {'error': str(e)}, 400
 
-        return {
-            'id': new_review.id,
-            'text': new_review.text,
-            'rating': new_review.rating,
-            'user_id': new_review.user_id,
-            'place_id': new_review.place_id
-        }, 201
+        return REVIEW.only(REVIEW_FIELDS)(new_review), 201
 
+    @api.expect(shape_parser)
     @api.response(200, 'List of reviews retrieved successfully')
+    @api.response(304, 'List unchanged since the given validators')
+    @api.response(400, 'Unknown field or relationship')
     def get(self):
-        """Retrieve a list of all reviews"""
-        reviews = facade.get_all_reviews()
+        """Retrieve a list of all reviews (NDJSON stream on request)"""
+        try:
+            fields, embed = requested_shape(SUMMARY_FIELDS)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        represent = REVIEW.only(fields, embed)
 
-        return [
-            {'id': r.id, 'text': r.text, 'rating': r.rating}
-            for r in reviews
-        ], 200
+        def build():
+            if wants_ndjson():
+                return ndjson_response(facade.iter_reviews(fields, embed),
+                                       represent)
+            return json_response(facade.get_all_reviews(fields, embed),
+                                 represent)
+
+        versions = facade.collection_version(
+            'reviews', *(EMBED_COLLECTIONS[e] for e in embed))
+        return conditional(collection_etag(versions), None, build)
+
+
+@api.route('/bulk')
+class ReviewBulk(Resource):
+    @api.expect([review_model])
+    @api.response(200, 'Bulk import processed, see per-item errors')
+    @api.response(400, 'Invalid request body')
+    @api.response(403, 'Admin privileges required')
+    @jwt_required()
+    def post(self):
+        """Import reviews from a JSON array or an NDJSON stream (admin)"""
+        claims = get_jwt()
+        if not claims.get('is_admin', False):
+            return {'error': 'Admin privileges required'}, 403
+        try:
+            items = read_bulk_items()
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        created, errors = facade.bulk_create_reviews(
+            items, chunk_size=bulk_chunk_size())
+        return bulk_response(created, errors)
 
 
 @api.route('/<review_id>')
 class ReviewResource(Resource):
+    @api.expect(shape_parser)
     @api.response(200, 'Review details retrieved successfully')
+    @api.response(304, 'Review unchanged since the given validators')
+    @api.response(400, 'Unknown field or relationship')
     @api.response(404, 'Review not found')
     def get(self, review_id):
         """Get review details by ID"""
+        try:
+            fields, embed = requested_shape(REVIEW_FIELDS)
+        except ValueError as e:
+            return {'error': str(e)}, 400
 
-        review = facade.get_review(review_id)
+        review = facade.get_review_details(review_id, fields, embed)
 
         if not review:
             return {'error': 'Review not found'}, 404
 
-        return {
-            'id': review.id,
-            'text': review.text,
-            'rating': review.rating,
-            'user_id': review.user_id,
-            'place_id': review.place_id
-        }, 200
+        related = [getattr(review, name) for name in embed]
+        plain = tuple(fields) == REVIEW_FIELDS and not embed
+        return conditional(
+            resource_etag(review, None if plain else (fields, embed),
+                          related),
+            latest(review.updated_at, *(o.updated_at for o in related if o)),
+            lambda: (REVIEW.only(fields, embed)(review), 200))
 
     @api.expect(review_model)
     @api.response(200, 'Review updated successfully')
@@ -89,13 +152,28 @@ class ReviewResource(Resource):
         current_user = get_jwt_identity()
         claims = get_jwt()
         is_admin = claims.get('is_admin', False)
-        review = facade.get_review(review_id)
-        review_data = api.payload
+        review_data = api.payload or {}
+
+        if (owner_write(claims)
+                and facade.owned_review_update_supported(review_data)):
+            # Ownership check and update without loading the review
+            try:
+                updated_review = facade.update_owned_review(
+                    review_id, current_user, review_data)
+            except (ValueError, KeyError) as e:
+                return {'error': str(e)}, 400
+            if not updated_review:
+                return not_owned(facade.get_review(review_id), 'Review')
+            return self.updated(updated_review)
 
+        review = facade.get_review(review_id)
         if not review:
             return {'error': 'Review not found'}, 404
         if not is_admin and review.user_id != current_user:
             return {'error': 'Unauthorized action'}, 403
+        failed = precondition_failed(review)
+        if failed:
+            return failed
 
         try:
             updated_review = facade.update_review(review_id, review_data)
@@ -105,13 +183,11 @@ class ReviewResource(Resource):
         if not updated_review:
             return {'error': 'Review not found'}, 404
 
-        return {
-            'id': updated_review.id,
-            'text': updated_review.text,
-            'rating': updated_review.rating,
-            'user_id': updated_review.user_id,
-            'place_id': updated_review.place_id
-        }, 200
+        return self.updated(updated_review)
+
+    def updated(self, review):
+        return REVIEW.only(REVIEW_FIELDS)(review), 200, validator_headers(
+            resource_etag(review), review.updated_at)
 
     @api.response(200, 'Review deleted successfully')
     @api.response(404, 'Review not found')
@@ -122,8 +198,14 @@ class ReviewResource(Resource):
         current_user = get_jwt_identity()
         claims = get_jwt()
         is_admin = claims.get('is_admin', False)
-        review = facade.get_review(review_id)
 
+        if owner_write(claims):
+            # Ownership check and delete in a single statement
+            if not facade.delete_owned_review(review_id, current_user):
+                return not_owned(facade.get_review(review_id), 'Review')
+            return {'message': 'Review deleted successfully'}, 200
+
+        review = facade.get_review(review_id)
         if not review:
             return {'error': 'Review not found'}, 404
         if not is_admin and review.user_id != current_user:
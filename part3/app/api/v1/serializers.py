@@ -0,0 +1,173 @@
+"""JSON representations of the models, declared once and shared by every
+endpoint.
+
+A Serializer lists the attributes of a model that may appear in a response,
+and the computed values and relationships that may be added. `only()` builds the function
+for one shape (the id plus some fields and embeds) and keeps the most
+recently used ones, so a row is built with one itemgetter call over the
+loaded columns instead of an attribute lookup per field. Lists are encoded
+with `dumps(objects, serialize)`: the encoder asks for each object's dict
+as it reaches it, so no list of dicts is built first. orjson is used when
+installed, which also encodes datetimes and UUIDs natively.
+"""
+import json
+from datetime import date
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+from uuid import UUID
+from flask import current_app, make_response
+from app.models.amenity import Amenity
+from app.models.place import Place
+from app.models.review import Review
+from app.models.user import User
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used instead
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+# Shapes kept per serializer; requests choose them with ?fields= and ?embed=
+VIEW_CACHE_SIZE = 64
+
+
+class Serializer:
+
+    def __init__(self, model, *attributes, **computed):
+        self.attributes = attributes
+        # name -> function(obj), for computed values and embedded objects
+        self.computed = computed
+        self._columns = set(model.__table__.columns.keys())
+        self._order = {name: i for i, name in enumerate(attributes)}
+        self._views = lru_cache(maxsize=VIEW_CACHE_SIZE)(self._compile)
+        self._full = self.only(attributes, computed)
+
+    def __call__(self, obj):
+        return self._full(obj)
+
+    def only(self, fields=(), embed=()):
+        """The serializing function for the id plus `fields` and `embed`.
+
+        Names are deduplicated and put in declaration order first, so every
+        spelling of the same shape shares one function."""
+        fields = sorted(set(fields) - {'id'}, key=self._position)
+        embed = set(embed)
+        embed = [name for name in self.computed if name in embed]
+        return self._views(tuple(fields), tuple(embed))
+
+    def _position(self, name):
+        # Undeclared attributes go last, by name
+        return self._order.get(name, len(self._order)), name
+
+    def _compile(self, fields, embed):
+        # Loaded columns are read from the instance __dict__ in one call,
+        # skipping the ORM descriptors; when one is not loaded the attribute
+        # reads lazy-load it as usual.
+        columns = ('id',) + tuple(name for name in fields
+                                  if name in self._columns)
+        fast, slow = _getter(itemgetter, columns), _getter(attrgetter, columns)
+        values = [(name, attrgetter(name)) for name in fields
+                  if name not in self._columns]
+        values += [(name, self.computed[name]) for name in embed]
+
+        def view(obj):
+            try:
+                row = dict(zip(columns, fast(obj.__dict__)))
+            except KeyError:
+                row = dict(zip(columns, slow(obj)))
+            for name, get in values:
+                row[name] = get(obj)
+            return row
+        return view
+
+
+def _getter(factory, names):
+    # itemgetter and attrgetter return a bare value for a single name
+    if len(names) > 1:
+        return factory(*names)
+    get = factory(*names)
+    return lambda obj: (get(obj),)
+
+
+def _view(serializer):
+    # Call the compiled function directly, one frame less per object
+    return serializer._full if isinstance(serializer, Serializer) \
+        else serializer
+
+
+def nested(attribute, serializer):
+    """Embed the object behind a many-to-one relationship (or null)."""
+    get, serializer = attrgetter(attribute), _view(serializer)
+
+    def represent(obj):
+        related = get(obj)
+        return None if related is None else serializer(related)
+    return represent
+
+
+def many(attribute, serializer):
+    """Embed the objects of a one-to-many or many-to-many relationship."""
+    get, serializer = attrgetter(attribute), _view(serializer)
+
+    def represent(obj):
+        return [serializer(related) for related in get(obj)]
+    return represent
+
+
+def _review_author(review):
+    user = review.user
+    return user.first_name + ' ' + user.last_name if user else 'Unknown'
+
+
+AMENITY = Serializer(Amenity, 'name')
+USER = Serializer(User, 'first_name', 'last_name', 'email')
+PLACE = Serializer(
+    Place,
+    'title', 'description', 'price', 'latitude', 'longitude', 'owner_id',
+    'review_count', 'average_rating', 'rating_histogram',
+    owner=nested('owner', USER),
+    amenities=many('amenities', AMENITY),
+    reviews=many('reviews', Serializer(Review, 'text', 'rating', 'user_id',
+                                       user_name=_review_author)),
+)
+REVIEW = Serializer(
+    Review,
+    'text', 'rating', 'user_id', 'place_id',
+    user=nested('user', USER.only(('first_name', 'last_name'))),
+    place=nested('place', PLACE.only(('title',))),
+)
+
+
+def _stdlib_default(serialize):
+    def default(value):
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, UUID):
+            return str(value)
+        if serialize is not None:
+            return serialize(value)
+        raise TypeError(f"{type(value).__name__} is not JSON serializable")
+    return default
+
+
+def dumps(data, serialize=None):
+    """Encode `data` to JSON bytes; model objects met along the way are
+    passed through `serialize`."""
+    if orjson is not None:
+        return orjson.dumps(data, default=serialize)
+    return json.dumps(data, default=_stdlib_default(serialize),
+                      separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, serialize=None, status=200):
+    """A ready JSON response, for lists returned without flask-restx's
+    encoding pass."""
+    return current_app.response_class(dumps(data, serialize) + b'\n',
+                                      status=status, mimetype=JSON_MIMETYPE)
+
+
+def output_json(data, code, headers=None):
+    """flask-restx representation for the dicts returned by resources."""
+    response = make_response(dumps(data) + b'\n', code)
+    response.headers.extend(headers or {})
+    return response
@@ -0,0 +1,82 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets: `capacity` hits in a burst, refilled at
+    `capacity` per `period` seconds.
+
+    Buckets live in process memory, so each worker limits on its own. At
+    most `max_keys` buckets are kept; the least recently used is dropped
+    (which amounts to refilling it).
+    """
+
+    def __init__(self, capacity, period, max_keys=100_000,
+                 clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Take a token for `key`: 0 when granted, otherwise the seconds
+        until one is available."""
+        return self._refill(key, take=True)
+
+    def peek(self, key):
+        """The wait `acquire(key)` would report, without taking a token."""
+        return self._refill(key, take=False)
+
+    def _refill(self, key, take):
+        now = self._clock()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - stamp) * self.rate)
+            if tokens >= 1:
+                tokens, wait = tokens - take, 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+def init_login_throttle(app):
+    """Create the login limiters from LOGIN_RATE_LIMITS, {'email' or 'ip':
+    (attempts, seconds)}; a missing entry disables that limit."""
+    limits = app.config.get('LOGIN_RATE_LIMITS') or {}
+    app.extensions['login_throttle'] = {
+        scope: TokenBucketLimiter(attempts, seconds)
+        for scope, (attempts, seconds) in limits.items()
+    }
+
+
+def login_retry_after(email):
+    """Seconds the client must wait before trying to log in as `email`
+    again, or None when the attempt may go ahead.
+
+    Called before the password check, so a flood is turned away without
+    doing any bcrypt work. Every attempt that goes ahead counts against
+    each limit, successful or not; one refused by any limit counts against
+    none, so flooding one email does not use up its address's allowance.
+    """
+    limiters = current_app.extensions.get('login_throttle', {})
+    keys = {'email': str(email).strip().lower(),
+            'ip': request.remote_addr or ''}
+    wait = max((limiter.peek(keys[scope])
+                for scope, limiter in limiters.items()), default=0.0)
+    if not wait:
+        wait = max((limiter.acquire(keys[scope])
+                    for scope, limiter in limiters.items()), default=0.0)
+    return math.ceil(wait) if wait else None
+
+
+def busy(error):
+    """503 response for work turned away by a full worker pool."""
+    return {'error': str(error)}, 503, {'Retry-After': '1'}
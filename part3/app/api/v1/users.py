@@ -1,5 +1,12 @@
 from flask_restx import Namespace, Resource, fields
 from app.services import facade
+from app.api.v1.ndjson import wants_ndjson, ndjson_response
+from app.api.v1.serializers import USER, json_response
+from app.api.v1.conditional import (conditional, collection_etag,
+                                    resource_etag, precondition_failed,
+                                    validator_headers)
+from app.api.v1.throttling import busy
+from app.passwords import PasswordServiceBusy
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 
 api = Namespace('users', description='User operations')
@@ -26,6 +33,7 @@ class UserList(Resource):
     @api.response(201, 'User successfully created')
     @api.response(400, 'Email already registered')
     @api.response(400, 'Invalid input data')
+    @api.response(503, 'Password service busy')
     def post(self):
         """Register a new user"""
 
@@ -43,6 +51,8 @@ class UserList(Resource):
             new_user = facade.create_user(user_data)
         except (ValueError, KeyError) as e:
             return {'error': str(e)}, 400
+        except PasswordServiceBusy as e:
+            return busy(e)
 
         return {
             'id': new_user.id,
@@ -50,24 +60,24 @@ class UserList(Resource):
         }, 201
 
     @api.response(200, 'List of users retrieved successfully')
+    @api.response(304, 'List unchanged since the given validators')
     def get(self):
-        """Retrieve the list of users"""
+        """Retrieve the list of users (NDJSON stream on request)"""
+        versions = facade.collection_version('users')
 
-        users = facade.get_users()
+        def build():
+            if wants_ndjson():
+                return ndjson_response(facade.iter_users(), USER)
 
-        return [
-            {
-                'id': u.id,
-                'first_name': u.first_name,
-                'last_name': u.last_name,
-                'email': u.email
-            } for u in users
-        ], 200
+            return json_response(facade.get_users(), USER)
+
+        return conditional(collection_etag(versions), None, build)
 
 
 @api.route('/<user_id>')
 class UserResource(Resource):
     @api.response(200, 'User details retrieved successfully')
+    @api.response(304, 'User unchanged since the given validators')
     @api.response(404, 'User not found')
     def get(self, user_id):
         """Get user details by ID"""
@@ -77,18 +87,15 @@ class UserResource(Resource):
         if not user:
             return {'error': 'User not found'}, 404
 
-        return {
-            'id': user.id,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'email': user.email
-        }, 200
+        return conditional(resource_etag(user), user.updated_at,
+                           lambda: (USER(user), 200))
 
     @api.expect(user_update_model, validate=True)
     @api.response(200, 'User updated successfully')
     @api.response(404, 'User not found')
     @api.response(400, 'Email already registered')
     @api.response(400, 'Invalid input data')
+    @api.response(503, 'Password service busy')
     @jwt_required()
     def put(self, user_id):
         """Update user details"""
@@ -114,15 +121,16 @@ class UserResource(Resource):
         user = facade.get_user(user_id)
         if not user:
             return {'error': 'User not found'}, 404
+        failed = precondition_failed(user)
+        if failed:
+            return failed
 
         try:
             updated = facade.update_user(user_id, data)
         except (ValueError, KeyError) as e:
             return {'error': str(e)}, 400
+        except PasswordServiceBusy as e:
+            return busy(e)
 
-        return {
-            'id': updated.id,
-            'first_name': updated.first_name,
-            'last_name': updated.last_name,
-            'email': updated.email
-        }, 200
+        return USER(updated), 200, validator_headers(
+            resource_etag(updated), updated.updated_at)
@@ -0,0 +1,22 @@
+import click
+
+
+def register_commands(app):
+    """Register maintenance commands on the Flask CLI."""
+
+    @app.cli.command('rebuild-ratings')
+    def rebuild_ratings():
+        """Recompute the rating aggregates of every place."""
+        from app.services import facade
+        count = facade.rebuild_place_ratings()
+        click.echo(f"Rebuilt rating aggregates for {count} places")
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        """Create missing tables and apply pending schema migrations."""
+        from app import db
+        from app.persistence.migrations import upgrade
+        db.create_all()
+        applied = upgrade(log=click.echo)
+        click.echo(f"Database at version {applied[-1]}" if applied
+                   else "Database already up to date")
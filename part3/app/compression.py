@@ -0,0 +1,165 @@
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: br is only offered when installed
+    brotli = None
+
+# Every Content-Encoding this module may apply
+ENCODINGS = ('br', 'gzip', 'deflate')
+DEFAULT_MIMETYPES = ('application/json', 'application/x-ndjson',
+                     'text/html', 'text/plain', 'text/css',
+                     'application/javascript')
+
+
+class _ZlibCompressor:
+    """gzip or deflate (zlib-wrapped, as HTTP defines it) stream."""
+
+    def __init__(self, encoding, level):
+        wbits = 31 if encoding == 'gzip' else 15
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        return self._zlib.compress(data)
+
+    def flush(self):
+        # Sync flush: everything so far is decodable by the client, so a
+        # streamed chunk is not held back until the next one arrives
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+
+    def __init__(self, level):
+        # zlib levels go up to 9, brotli qualities up to 11
+        self._brotli = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self._brotli.process(data)
+
+    def flush(self):
+        return self._brotli.flush()
+
+    def finish(self):
+        return self._brotli.finish()
+
+
+def available_encodings(preferred=ENCODINGS):
+    return [e for e in preferred if e != 'br' or brotli is not None]
+
+
+def compressor(encoding, level):
+    if encoding == 'br':
+        return _BrotliCompressor(level)
+    return _ZlibCompressor(encoding, level)
+
+
+def compress(data, encoding, level):
+    stream = compressor(encoding, level)
+    return stream.compress(data) + stream.finish()
+
+
+def _compress_stream(chunks, encoding, level):
+    stream = compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = stream.compress(chunk) + stream.flush()
+            if data:
+                yield data
+        yield stream.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _negotiate(encodings):
+    accepted = request.accept_encodings
+    best = accepted.best_match(encodings)
+    # best_match falls back to the first option on "*"; an explicit q=0
+    # still refuses it
+    if best is None or accepted[best] == 0:
+        return None
+    return best
+
+
+def strip_encoding(etag):
+    """The ETag value without the suffix added for an encoding."""
+    head, _, tail = etag.rpartition('-')
+    return head if head and tail in ENCODINGS else etag
+
+
+def _tag_encoding(response, encoding):
+    # A strong ETag promises byte-identical bodies: each encoding gets its
+    # own, the original value plus "-<encoding>", which If-Match still
+    # compares by its leading version
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+
+
+def _tag_not_modified(response, encodings):
+    # A 304 carries the tag of the representation the client holds: the
+    # encoded one when that is what it sent back and would get again
+    etag, weak = response.get_etag()
+    encoding = _negotiate(encodings)
+    if (etag and not weak and encoding is not None
+            and request.if_none_match.contains(f'{etag}-{encoding}')):
+        response.set_etag(f'{etag}-{encoding}')
+
+
+def init_compression(app):
+    """Compress responses whose client accepts it (after_request hook).
+
+    Only successful responses of an allowlisted content type are touched.
+    Buffered bodies shorter than COMPRESS_MIN_SIZE are sent as is; streamed
+    bodies (NDJSON lists) have no known size and are compressed chunk by
+    chunk, each chunk flushed so the client still receives rows as they
+    are produced.
+    """
+    config = app.config
+    min_size = config.get('COMPRESS_MIN_SIZE', 500)
+    level = config.get('COMPRESS_LEVEL', 6)
+    mimetypes = set(config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES))
+    encodings = available_encodings(
+        config.get('COMPRESS_ALGORITHMS', ('br', 'gzip', 'deflate')))
+    if not config.get('COMPRESS_ENABLED', True) or not encodings:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code == 304:
+            response.vary.add('Accept-Encoding')
+            _tag_not_modified(response, encodings)
+            return response
+        if response.mimetype not in mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or request.method == 'HEAD'
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.headers.get('Cache-Control',
+                                                          '')):
+            return response
+        encoding = _negotiate(encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _compress_stream(response.response,
+                                                 encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            response.set_data(compress(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        _tag_encoding(response, encoding)
+        return response
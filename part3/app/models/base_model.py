@@ -9,8 +9,9 @@ class BaseModel(db.Model):
     id = db.Column(db.String(36), primary_key=True,
                    default=lambda: str(uuid.uuid4()))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Indexed so collection versions (latest updated_at) are a lookup
     updated_at = db.Column(db.DateTime, default=datetime.utcnow,
-                           onupdate=datetime.utcnow)
+                           onupdate=datetime.utcnow, index=True)
 
     def update(self, data):
         """Update model attributes from a dictionary."""
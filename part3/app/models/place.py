@@ -1,22 +1,51 @@
 from app.models.base_model import BaseModel
 from app import db
 from sqlalchemy.orm import validates
+from app.persistence.geo import geohash_encode
+from app.persistence.search import SearchTable
 
 # Table d'association many-to-many Place↔Amenity
 place_amenity = db.Table('place_amenity',
     db.Column('place_id', db.String(36), db.ForeignKey('places.id'), primary_key=True),
-    db.Column('amenity_id', db.String(36), db.ForeignKey('amenities.id'), primary_key=True)
+    db.Column('amenity_id', db.String(36), db.ForeignKey('amenities.id'), primary_key=True),
+    # The primary key covers place_id lookups, not amenity_id ones
+    db.Index('ix_place_amenity_amenity_id', 'amenity_id')
 )
 
 class Place(BaseModel):
     __tablename__ = 'places'
+    __table_args__ = (
+        # Supports keyset pagination ordered by (created_at, id)
+        db.Index('ix_places_created_at_id', 'created_at', 'id'),
+        # Price range filters and price-ordered pages
+        db.Index('ix_places_price_id', 'price', 'id'),
+    )
 
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(500))
     price = db.Column(db.Float, nullable=False)
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
-    owner_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    owner_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False,
+                         index=True)
+    # Geohash of (latitude, longitude), kept in sync by the validators below
+    geohash = db.Column(db.String(12), index=True)
+
+    # Rating aggregates, maintained by the facade on every review write
+    review_count = db.Column(db.Integer, nullable=False, default=0,
+                             server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0,
+                           server_default='0')
+    rating_1_count = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
+    rating_2_count = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
+    rating_3_count = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
+    rating_4_count = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
+    rating_5_count = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
 
     # Relationships
     reviews = db.relationship('Review', backref='place', lazy=True)
@@ -39,10 +68,73 @@ class Place(BaseModel):
     def validate_latitude(self, key, value):
         if value is None or not (-90 <= value <= 90):
             raise ValueError("Latitude must be between -90 and 90")
+        self._update_geohash(value, self.longitude)
         return value
 
     @validates('longitude')
     def validate_longitude(self, key, value):
         if value is None or not (-180 <= value <= 180):
             raise ValueError("Longitude must be between -180 and 180")
+        self._update_geohash(self.latitude, value)
         return value
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 2)
+
+    @property
+    def rating_histogram(self):
+        return {str(r): getattr(self, f'rating_{r}_count') or 0
+                for r in range(1, 6)}
+
+    def adjust_ratings(self, deltas):
+        """Apply {rating: count_delta} to the aggregates as SQL expressions,
+        so concurrent review writes cannot lose increments."""
+        for column, value in self.rating_values(deltas).items():
+            setattr(self, column, value)
+
+    @classmethod
+    def rating_values(cls, deltas):
+        """The aggregate columns changed by {rating: count_delta}, as SQL
+        expressions."""
+        values = {
+            'review_count': cls.review_count + sum(deltas.values()),
+            'rating_sum': cls.rating_sum + sum(
+                rating * delta for rating, delta in deltas.items()),
+        }
+        for rating, delta in deltas.items():
+            if delta:
+                column = f'rating_{rating}_count'
+                values[column] = getattr(cls, column) + delta
+        return values
+
+    @classmethod
+    def rating_move_values(cls, old, new):
+        """The aggregate columns changed by one review going from rating
+        `old`, a SQL expression such as a subquery, to `new`."""
+        values = {'rating_sum': cls.rating_sum - old + new}
+        for rating in range(1, 6):
+            column = f'rating_{rating}_count'
+            values[column] = (getattr(cls, column)
+                              - db.case((old == rating, 1), else_=0)
+                              + int(rating == new))
+        return values
+
+    def _update_geohash(self, latitude, longitude):
+        if latitude is not None and longitude is not None:
+            self.geohash = geohash_encode(latitude, longitude)
+
+
+# Average rating as SQL, 0 for places without reviews. Constants are
+# inlined so queries match the expression index below exactly
+AVERAGE_RATING = db.case(
+    (Place.review_count > db.literal_column('0'),
+     Place.rating_sum * db.literal_column('1.0') / Place.review_count),
+    else_=db.literal_column('0.0'))
+db.Index('ix_places_rating_id', AVERAGE_RATING, Place.id)
+
+# Full-text index over the descriptive text, titles weighted double
+PLACE_SEARCH_WEIGHTS = {'title': 2.0, 'description': 1.0}
+place_search = SearchTable(Place, 'places_fts', PLACE_SEARCH_WEIGHTS)
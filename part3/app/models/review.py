@@ -4,10 +4,16 @@ from sqlalchemy.orm import validates
 
 class Review(BaseModel):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        # One review per user and place; also serves user_id lookups
+        db.Index('unique_user_place_review', 'user_id', 'place_id',
+                 unique=True),
+    )
 
     text = db.Column(db.String(500), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
-    place_id = db.Column(db.String(36), db.ForeignKey('places.id'), nullable=False)
+    place_id = db.Column(db.String(36), db.ForeignKey('places.id'), nullable=False,
+                         index=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
 
     @validates('text')
@@ -1,5 +1,7 @@
+from flask import current_app
 from app.models.base_model import BaseModel
-from app import db, bcrypt
+from app import db
+from app.passwords import passwords
 
 
 class User(BaseModel):
@@ -17,8 +19,17 @@ class User(BaseModel):
 
     def hash_password(self, password):
         """Hashes the password before storing it."""
-        self.password = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password = passwords.hash(password)
 
     def verify_password(self, password):
         """Verifies if the provided password matches the hashed password."""
-        return bcrypt.check_password_hash(self.password, password)
\ No newline at end of file
+        return passwords.verify(self.password, password)
+
+    def needs_rehash(self):
+        """True when the stored hash was made with another cost than the
+        configured BCRYPT_LOG_ROUNDS."""
+        try:
+            rounds = int(self.password.split('$')[2])
+        except (AttributeError, IndexError, ValueError):
+            return True
+        return rounds != current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import flask_bcrypt
+
+
+class PasswordServiceBusy(Exception):
+    """Every worker is busy and the queue is full; retry later (503)."""
+
+
+class PasswordService:
+    """Hashes and checks passwords with bcrypt, optionally on a pool.
+
+    With PASSWORD_WORKERS = 0 (the default) the work runs inline in the
+    request thread. Otherwise it runs on a pool of that many threads
+    (bcrypt releases the GIL) or processes (PASSWORD_POOL = 'process'),
+    which caps the CPU spent on bcrypt however many requests arrive. At most
+    PASSWORD_QUEUE_LIMIT further calls wait for a worker; beyond that
+    PasswordServiceBusy is raised at once instead of piling up requests.
+    """
+
+    def __init__(self):
+        self.rounds = 12
+        self._executor = None
+        self._slots = None
+
+    def init_app(self, app):
+        self.shutdown()
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        workers = app.config.get('PASSWORD_WORKERS', 0)
+        if not workers:
+            return
+        pool = (ProcessPoolExecutor
+                if app.config.get('PASSWORD_POOL', 'thread') == 'process'
+                else ThreadPoolExecutor)
+        self._executor = pool(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(
+            workers + app.config.get('PASSWORD_QUEUE_LIMIT', 0))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._slots = None
+
+    def hash(self, password):
+        return self._run(flask_bcrypt.generate_password_hash, password,
+                         self.rounds).decode('utf-8')
+
+    def verify(self, hashed, password):
+        return self._run(flask_bcrypt.check_password_hash, hashed, password)
+
+    def _run(self, function, *args):
+        executor, slots = self._executor, self._slots
+        if executor is None:
+            return function(*args)
+        if not slots.acquire(blocking=False):
+            raise PasswordServiceBusy("Password service is busy")
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+
+passwords = PasswordService()
@@ -0,0 +1,199 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from app.persistence.repository import Repository
+
+# Live caches, so session events can invalidate them whatever the write path
+_caches = weakref.WeakSet()
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping whose entries expire after `ttl`
+    seconds (no expiry when ttl is None)."""
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CachedRepository(Repository):
+    """Read-through cache in front of an SQLAlchemyRepository.
+
+    `get` serves column snapshots from an LRU cache and re-attaches them to
+    the current session without a query, so relationships still lazy-load.
+    Every other method is delegated to the wrapped repository.
+    """
+
+    def __init__(self, inner, maxsize=1024, ttl=60.0):
+        self.inner = inner
+        self.model = inner.model
+        self.cache = LRUCache(maxsize, ttl)
+        _caches.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    @property
+    def stats(self):
+        return {'hits': self.cache.hits, 'misses': self.cache.misses,
+                'size': len(self.cache)}
+
+    def invalidate(self, obj_id):
+        self.cache.pop(obj_id)
+
+    def clear(self):
+        self.cache.clear()
+
+    def add(self, obj):
+        self.inner.add(obj)
+
+    def get(self, obj_id):
+        if obj_id is None:
+            return None
+        snapshot = self.cache.get(obj_id)
+        if snapshot is not None:
+            return self._attach(snapshot)
+        obj = self.inner.get(obj_id)
+        # Only cache clean rows, never uncommitted changes of this session
+        if obj is not None and not inspect(obj).modified:
+            self.cache.set(obj_id, self._snapshot(obj))
+        return obj
+
+    def get_all(self, *args, **kwargs):
+        return self.inner.get_all(*args, **kwargs)
+
+    def update(self, obj_id, data):
+        self.invalidate(obj_id)
+        self.inner.update(obj_id, data)
+        self.invalidate(obj_id)
+
+    def delete(self, obj_id):
+        self.invalidate(obj_id)
+        self.inner.delete(obj_id)
+        self.invalidate(obj_id)
+
+    def update_owned(self, obj_id, *args, **kwargs):
+        self.invalidate(obj_id)
+        row = self.inner.update_owned(obj_id, *args, **kwargs)
+        self.invalidate(obj_id)
+        return row
+
+    def delete_owned(self, obj_id, *args, **kwargs):
+        self.invalidate(obj_id)
+        row = self.inner.delete_owned(obj_id, *args, **kwargs)
+        self.invalidate(obj_id)
+        return row
+
+    def update_values(self, obj_id, values, commit=True):
+        self._forget(obj_id)
+        self.inner.update_values(obj_id, values, commit)
+        self._forget(obj_id)
+
+    def _forget(self, obj_id):
+        if isinstance(obj_id, str):
+            self.invalidate(obj_id)
+        else:
+            # A subquery only the database resolves: drop every row
+            self.clear()
+
+    def get_by_attribute(self, attr_name, attr_value):
+        return self.inner.get_by_attribute(attr_name, attr_value)
+
+    def _snapshot(self, obj):
+        return {attr.key: getattr(obj, attr.key)
+                for attr in inspect(self.model).column_attrs}
+
+    def _attach(self, snapshot):
+        # Same instance if this session already holds the row
+        key = inspect(self.model).identity_key_from_primary_key(
+            [snapshot['id']])
+        existing = db.session.identity_map.get(key)
+        if existing is not None:
+            return existing
+        obj = inspect(self.model).class_manager.new_instance()
+        for name, value in snapshot.items():
+            set_committed_value(obj, name, value)
+        make_transient_to_detached(obj)
+        return db.session.merge(obj, load=False)
+
+
+def _invalidate(keys=(), models=()):
+    for repo in list(_caches):
+        if repo.model in models:
+            repo.clear()
+            continue
+        for model, obj_id in keys:
+            if issubclass(model, repo.model):
+                repo.invalidate(obj_id)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _after_flush(session, flush_context):
+    keys = [(type(obj), inspect(obj).identity[0])
+            for obj in list(session.dirty) + list(session.deleted)
+            if inspect(obj).identity]
+    session.info.setdefault('cache_keys', []).extend(keys)
+    _invalidate(keys=keys)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _on_bulk_write(state):
+    if state.is_update or state.is_delete:
+        models = {mapper.class_ for mapper in state.all_mappers}
+        state.session.info.setdefault('cache_models', set()).update(models)
+        _invalidate(models=models)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(session):
+    # Invalidate again so readers that refilled the cache between the flush
+    # and the commit cannot leave a pre-commit row behind
+    _invalidate(keys=session.info.pop('cache_keys', []),
+                models=session.info.pop('cache_models', set()))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('cache_keys', None)
+    session.info.pop('cache_models', None)
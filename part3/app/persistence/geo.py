@@ -0,0 +1,119 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+# Upper bound on the number of geohash cells used to cover a search area
+MAX_COVER_CELLS = 32
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string of `precision` characters."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return the (latitude, longitude) size in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def _split_antimeridian(min_lat, min_lng, max_lat, max_lng):
+    if min_lng <= max_lng:
+        return [(min_lat, min_lng, max_lat, max_lng)]
+    return [(min_lat, min_lng, max_lat, 180.0),
+            (min_lat, -180.0, max_lat, max_lng)]
+
+
+def _cells_for_box(box, precision):
+    min_lat, min_lng, max_lat, max_lng = box
+    cell_lat, cell_lng = cell_size(precision)
+    lat_cells = int(90 * 2 / cell_lat)
+    lng_cells = int(180 * 2 / cell_lng)
+    i0 = int((min_lat + 90) // cell_lat)
+    i1 = min(int((max_lat + 90) // cell_lat), lat_cells - 1)
+    j0 = int((min_lng + 180) // cell_lng)
+    j1 = min(int((max_lng + 180) // cell_lng), lng_cells - 1)
+    return i0, i1, j0, j1, cell_lat, cell_lng
+
+
+def cover_bbox(min_lat, min_lng, max_lat, max_lng):
+    """Return the geohash prefixes of the cells covering a bounding box.
+
+    The finest precision that needs at most MAX_COVER_CELLS cells is used.
+    Returns None when the box is too large to be worth prefiltering.
+    A box with min_lng > max_lng crosses the antimeridian.
+    """
+    boxes = _split_antimeridian(min_lat, min_lng, max_lat, max_lng)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        count = 0
+        for box in boxes:
+            i0, i1, j0, j1, _, _ = _cells_for_box(box, precision)
+            count += (i1 - i0 + 1) * (j1 - j0 + 1)
+        if count > MAX_COVER_CELLS:
+            continue
+        prefixes = set()
+        for box in boxes:
+            i0, i1, j0, j1, cell_lat, cell_lng = _cells_for_box(box, precision)
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    prefixes.add(geohash_encode((i + 0.5) * cell_lat - 90,
+                                                (j + 0.5) * cell_lng - 180,
+                                                precision))
+        return sorted(prefixes)
+    return None
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two coordinates in kilometers."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = (math.sin(d_phi / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Return the bounding box (min_lat, min_lng, max_lat, max_lng) that
+    encloses every point within `radius_km` of the given coordinate."""
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(-90.0, latitude - d_lat)
+    max_lat = min(90.0, latitude + d_lat)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return min_lat, -180.0, max_lat, 180.0
+    ratio = (math.sin(radius_km / EARTH_RADIUS_KM) /
+             math.cos(math.radians(latitude)))
+    if ratio >= 1.0:
+        return min_lat, -180.0, max_lat, 180.0
+    d_lng = math.degrees(math.asin(ratio))
+    min_lng = longitude - d_lng
+    max_lng = longitude + d_lng
+    if min_lng < -180.0:
+        min_lng += 360.0
+    if max_lng > 180.0:
+        max_lng -= 360.0
+    return min_lat, min_lng, max_lat, max_lng
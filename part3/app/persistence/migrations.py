@@ -0,0 +1,178 @@
+from sqlalchemy import (Column, Index, Integer, MetaData, String, Table,
+                        case, inspect, literal_column, text)
+from sqlalchemy.schema import CreateIndex
+from app import db
+from app.persistence.geo import geohash_encode
+from app.models.place import place_search
+
+RATING_COLUMNS = ['review_count', 'rating_sum'] + [
+    f'rating_{rating}_count' for rating in range(1, 6)]
+
+
+def _columns(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+def _add_place_geohash(conn):
+    if 'geohash' not in _columns(conn, 'places'):
+        conn.execute(text("ALTER TABLE places ADD COLUMN geohash VARCHAR(12)"))
+    rows = conn.execute(text(
+        "SELECT id, latitude, longitude FROM places WHERE geohash IS NULL"))
+    updates = [{'id': row.id,
+                'geohash': geohash_encode(row.latitude, row.longitude)}
+               for row in rows]
+    if updates:
+        conn.execute(text("UPDATE places SET geohash = :geohash "
+                          "WHERE id = :id"), updates)
+
+
+def _add_place_rating_aggregates(conn):
+    existing = _columns(conn, 'places')
+    for column in RATING_COLUMNS:
+        if column not in existing:
+            conn.execute(text(f"ALTER TABLE places ADD COLUMN {column} "
+                              "INTEGER NOT NULL DEFAULT 0"))
+    counts = ["review_count = (SELECT COUNT(*) FROM reviews "
+              "WHERE reviews.place_id = places.id)",
+              "rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews "
+              "WHERE reviews.place_id = places.id)"]
+    counts += [f"rating_{rating}_count = (SELECT COUNT(*) FROM reviews "
+               f"WHERE reviews.place_id = places.id AND rating = {rating})"
+               for rating in range(1, 6)]
+    conn.execute(text("UPDATE places SET " + ", ".join(counts)))
+
+
+# The tables as the index migrations saw them. Indexes are declared here
+# rather than taken from the models, so each migration creates the same
+# indexes whenever it runs
+_SCHEMA = MetaData()
+_USERS = Table('users', _SCHEMA, Column('id', String(36)),
+               Column('updated_at'))
+_AMENITIES = Table('amenities', _SCHEMA, Column('id', String(36)),
+                   Column('updated_at'))
+_PLACES = Table('places', _SCHEMA, Column('id', String(36)),
+                Column('owner_id'), Column('price'), Column('geohash'),
+                Column('review_count', Integer), Column('rating_sum', Integer),
+                Column('created_at'), Column('updated_at'))
+_PLACE_AMENITY = Table('place_amenity', _SCHEMA, Column('amenity_id'))
+_REVIEWS = Table('reviews', _SCHEMA, Column('id', String(36)),
+                 Column('place_id'), Column('user_id'), Column('updated_at'))
+
+# Foreign-key lookups, one review per user and place, and the pagination
+# and geohash indexes
+LOOKUP_INDEXES = (
+    Index('ix_places_owner_id', _PLACES.c.owner_id),
+    Index('ix_reviews_place_id', _REVIEWS.c.place_id),
+    Index('ix_place_amenity_amenity_id', _PLACE_AMENITY.c.amenity_id),
+    Index('unique_user_place_review', _REVIEWS.c.user_id,
+          _REVIEWS.c.place_id, unique=True),
+    Index('ix_places_created_at_id', _PLACES.c.created_at, _PLACES.c.id),
+    Index('ix_places_geohash', _PLACES.c.geohash),
+)
+# Same expression as app.models.place.AVERAGE_RATING, which queries must
+# match exactly to use the index
+SORT_INDEXES = (
+    Index('ix_places_price_id', _PLACES.c.price, _PLACES.c.id),
+    Index('ix_places_rating_id', case(
+        (_PLACES.c.review_count > literal_column('0'),
+         _PLACES.c.rating_sum * literal_column('1.0')
+         / _PLACES.c.review_count),
+        else_=literal_column('0.0')), _PLACES.c.id),
+)
+UPDATED_AT_INDEXES = tuple(
+    Index(f'ix_{table.name}_updated_at', table.c.updated_at)
+    for table in (_USERS, _PLACES, _AMENITIES, _REVIEWS))
+_COLLECTION_VERSIONS = Table(
+    'collection_versions', _SCHEMA,
+    Column('name', String(50), primary_key=True),
+    Column('version', Integer, nullable=False, server_default='0'))
+
+
+def _create_indexes(indexes):
+    """A migration creating `indexes` where missing."""
+    def migrate(conn):
+        # IF NOT EXISTS rather than checkfirst: reflection skips expression
+        # indexes, so they would be created twice
+        for index in indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+    return migrate
+
+
+def _add_place_search(conn):
+    """Create the FTS5 index of place titles and descriptions (SQLite
+    only) and fill it from the existing rows."""
+    if place_search.create(conn):
+        place_search.rebuild(conn)
+
+
+def _key_place_search_by_rowid(conn):
+    """Rebuild a full-text index made when its rows were found by MATCHing
+    an id column, in today's layout keyed by rowid."""
+    if inspect(conn).has_table(place_search.name):
+        place_search.drop(conn)
+        _add_place_search(conn)
+
+
+def _add_collection_versions(conn):
+    """Create the per-table version counters behind list ETags."""
+    _COLLECTION_VERSIONS.create(conn, checkfirst=True)
+    existing = {row.name for row in conn.execute(
+        _COLLECTION_VERSIONS.select())}
+    missing = [{'name': table.name, 'version': 0}
+               for table in (_USERS, _AMENITIES, _PLACES, _REVIEWS)
+               if table.name not in existing]
+    if missing:
+        conn.execute(_COLLECTION_VERSIONS.insert(), missing)
+
+
+MIGRATIONS = [
+    (1, 'Add places.geohash', _add_place_geohash),
+    (2, 'Add place rating aggregates', _add_place_rating_aggregates),
+    (3, 'Index foreign keys and enforce one review per user and place',
+     _create_indexes(LOOKUP_INDEXES)),
+    (4, 'Add full-text search over places', _add_place_search),
+    (5, 'Index place price and average rating',
+     _create_indexes(SORT_INDEXES)),
+    (6, 'Index updated_at for collection versions',
+     _create_indexes(UPDATED_AT_INDEXES)),
+    (7, 'Key full-text search rows by rowid', _key_place_search_by_rowid),
+    (8, 'Add collection version counters', _add_collection_versions),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(text("SELECT version FROM schema_version")).scalar() or 0
+
+
+def _set_version(conn, version):
+    if not inspect(conn).has_table('schema_version'):
+        conn.execute(text("CREATE TABLE schema_version "
+                          "(version INTEGER NOT NULL)"))
+    conn.execute(text("DELETE FROM schema_version"))
+    conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"),
+                 {'v': version})
+
+
+def upgrade(engine=None, log=print):
+    """Bring a database created by an older release up to date.
+
+    Migrations run in order, each in its own transaction, and only add what
+    the live schema is missing, so they are safe on a database just built by
+    db.create_all(). The applied version is recorded in `schema_version`.
+    Returns the list of versions applied.
+    """
+    engine = engine or db.engine
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        with engine.begin() as conn:
+            if current_version(conn) >= version:
+                continue
+            log(f"Applying migration {version}: {description}")
+            migrate(conn)
+            _set_version(conn, version)
+        applied.append(version)
+    return applied
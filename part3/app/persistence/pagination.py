@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_key(key):
+    """Encode a JSON-serializable keyset position as an opaque URL-safe
+    token."""
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_key(token):
+    """Decode a token produced by encode_key into a [sort value, id]
+    pair."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, obj_id = json.loads(base64.urlsafe_b64decode(padded))
+        return value, str(obj_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def encode_cursor(obj):
+    """Encode the (created_at, id) keyset position of an object."""
+    return encode_key([obj.created_at.isoformat(), obj.id])
+
+
+def decode_cursor(token):
+    """Decode a token produced by encode_cursor into (created_at, id)."""
+    created_at, obj_id = decode_key(token)
+    try:
+        return datetime.fromisoformat(created_at), obj_id
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
@@ -1,5 +1,11 @@
 from abc import ABC, abstractmethod
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import lazyload, load_only
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.session import make_transient_to_detached
 from app import db
+from app.persistence.search import InvertedIndex, SearchUnavailableError
+from app.persistence.versions import table_version
 
 class Repository(ABC):
     @abstractmethod
@@ -28,11 +34,20 @@ class Repository(ABC):
 
 
 class InMemoryRepository(Repository):
-    def __init__(self):
+    def __init__(self, search_weights=None):
+        """`search_weights` ({attribute: weight}) enables `search` over
+        those text attributes through an inverted index."""
         self._storage = {}
+        self._index = InvertedIndex(search_weights) if search_weights else None
+
+    def _reindex(self, obj):
+        if self._index is not None:
+            self._index.add(obj.id, {name: getattr(obj, name, None)
+                                     for name in self._index.weights})
 
     def add(self, obj):
         self._storage[obj.id] = obj
+        self._reindex(obj)
 
     def get(self, obj_id):
         return self._storage.get(obj_id)
@@ -44,41 +59,227 @@ class InMemoryRepository(Repository):
         obj = self.get(obj_id)
         if obj:
             obj.update(data)
+            self._reindex(obj)
 
     def delete(self, obj_id):
         if obj_id in self._storage:
             del self._storage[obj_id]
+            if self._index is not None:
+                self._index.remove(obj_id)
+
+    def collection_version(self):
+        return (len(self._storage),
+                max((getattr(obj, 'updated_at', None)
+                     for obj in self._storage.values()
+                     if getattr(obj, 'updated_at', None)), default=None))
+
+    def search_text(self, query, limit, offset=0, options=()):
+        """Return (obj, score) pairs ranked by bm25, best first. Loader
+        `options` do not apply to objects held in memory."""
+        if self._index is None:
+            raise SearchUnavailableError("Full-text search is not available")
+        return [(self._storage[obj_id], score)
+                for obj_id, score in self._index.search(query, limit, offset)]
 
     def get_by_attribute(self, attr_name, attr_value):
         return next((obj for obj in self._storage.values() if getattr(obj, attr_name) == attr_value), None)
 
 
 class SQLAlchemyRepository(Repository):
+    # Computed field name -> columns it is derived from
+    FIELD_COLUMNS = {}
+    # Relationship name -> function(many) returning the loader option used
+    # when a response embeds it
+    EMBEDS = {}
+
     def __init__(self, model):
         self.model = model
 
+    def loader_options(self, fields=None, embed=(), many=False):
+        """Loader options fetching only the columns behind `fields` (every
+        column when None) and the `embed` relationships, eagerly. Other
+        relationships stay lazy. `many` selects loaders suited to lists."""
+        options = []
+        if fields is not None:
+            # Always load the columns behind identity, pagination and ETags
+            columns = {'id', 'created_at', 'updated_at'}
+            for name in fields:
+                columns.update(self.FIELD_COLUMNS.get(name, (name,)))
+            options.append(load_only(*[getattr(self.model, column)
+                                       for column in sorted(columns)]))
+        for name, loader in self.EMBEDS.items():
+            options.append(loader(many) if name in embed
+                           else lazyload(getattr(self.model, name)))
+        return options
+
+    def get_with_options(self, obj_id, options=()):
+        """Load one object with explicit loader options, bypassing any
+        cache."""
+        return self.model.query.options(*options).filter_by(id=obj_id).first()
+
     def add(self, obj):
         db.session.add(obj)
+        self._commit()
+
+    def _commit(self):
+        """Commit, rolling the session back if the database rejects it so
+        the next request does not inherit a failed transaction."""
+        try:
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            raise
+
+    def bulk_add(self, items, chunk_size=500):
+        """Insert (index, obj) pairs with one commit per chunk.
+
+        A chunk rejected by the database is retried row by row inside
+        savepoints, so only the offending rows are dropped.
+        Returns (created_count, [(index, message), ...]).
+        """
+        created = 0
+        errors = []
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                created += self._commit_chunk(chunk, errors)
+                chunk = []
+        if chunk:
+            created += self._commit_chunk(chunk, errors)
+        return created, errors
+
+    def _commit_chunk(self, chunk, errors):
+        try:
+            db.session.add_all([obj for _, obj in chunk])
+            db.session.commit()
+            return len(chunk)
+        except SQLAlchemyError:
+            db.session.rollback()
+
+        created = 0
+        for index, obj in chunk:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(obj)
+                created += 1
+            except SQLAlchemyError as e:
+                errors.append((index, str(getattr(e, 'orig', None) or e)))
         db.session.commit()
+        return created
 
     def get(self, obj_id):
         return self.model.query.get(obj_id)
 
-    def get_all(self):
-        return self.model.query.all()
+    def get_all(self, options=()):
+        return self.model.query.options(*options).all()
+
+    def iter_all(self, batch_size=1000, options=None):
+        """Iterate over every object through a server-side cursor, holding
+        at most `batch_size` rows in memory at a time."""
+        # Joined eager loaders cannot be combined with yield_per
+        return (self.model.query
+                .options(*(options if options is not None
+                           else [lazyload('*')]))
+                .execution_options(stream_results=True)
+                .yield_per(batch_size))
+
+    def collection_version(self):
+        """The table's version counter, which changes with every insert,
+        update and delete."""
+        return table_version(self.model.__tablename__)
+
+    def get_page(self, limit, after=None, options=()):
+        """Return up to `limit` objects in (created_at, id) order, starting
+        strictly after the `after` key (keyset pagination)."""
+        query = (self.model.query.options(*options)
+                 .order_by(self.model.created_at, self.model.id))
+        if after:
+            created_at, obj_id = after
+            query = query.filter(db.or_(
+                self.model.created_at > created_at,
+                db.and_(self.model.created_at == created_at,
+                        self.model.id > obj_id)
+            ))
+        return query.limit(limit).all()
 
     def update(self, obj_id, data):
         obj = self.get(obj_id)
         if obj:
             for key, value in data.items():
                 setattr(obj, key, value)
-            db.session.commit()
+            self._commit()
 
     def delete(self, obj_id):
         obj = self.get(obj_id)
         if obj:
             db.session.delete(obj)
-            db.session.commit()
+            self._commit()
+
+    def update_owned(self, obj_id, owner_column, owner_id, values,
+                     commit=True):
+        """Write `values` to a row only if its `owner_column` is `owner_id`.
+
+        The ownership check is part of the UPDATE's WHERE clause, so nothing
+        is loaded beforehand. Returns the updated row, or None when no row
+        matched (missing, or owned by someone else). With commit=False the
+        transaction stays open for follow-up writes, if a row matched.
+        """
+        table = self.model.__table__
+        statement = (table.update()
+                     .where(table.c.id == obj_id,
+                            table.c[owner_column] == owner_id)
+                     .values(**values))
+        if db.engine.dialect.update_returning:
+            row = db.session.execute(statement.returning(*table.c)).first()
+        elif db.session.execute(statement).rowcount:
+            row = db.session.execute(
+                table.select().where(table.c.id == obj_id)).first()
+        else:
+            row = None
+        if row is not None:
+            self._owned_updated(row, values)
+        if commit or row is None:
+            self._commit()
+        return row
+
+    def _owned_updated(self, row, values):
+        """Hook for what the ORM events would do after update_owned."""
+
+    def delete_owned(self, obj_id, owner_column, owner_id, commit=True):
+        """Delete a row only if its `owner_column` is `owner_id`, in one
+        statement. Returns the deleted row, or None when none matched."""
+        table = self.model.__table__
+        condition = db.and_(table.c.id == obj_id,
+                            table.c[owner_column] == owner_id)
+        if db.engine.dialect.delete_returning:
+            row = db.session.execute(
+                table.delete().where(condition).returning(*table.c)).first()
+        else:
+            row = db.session.execute(table.select().where(condition)).first()
+            if row is not None:
+                db.session.execute(table.delete().where(condition))
+        if commit or row is None:
+            self._commit()
+        return row
+
+    def update_values(self, obj_id, values, commit=True):
+        """UPDATE one row by id, which may be a scalar subquery, with
+        `values` that may be SQL expressions; nothing is loaded."""
+        table = self.model.__table__
+        db.session.execute(
+            table.update().where(table.c.id == obj_id).values(**values))
+        if commit:
+            self._commit()
+
+    def from_row(self, row):
+        """The persistent object for a full row read by a Core statement,
+        without querying again."""
+        obj = self.model.__mapper__.class_manager.new_instance()
+        for name, value in row._mapping.items():
+            set_committed_value(obj, name, value)
+        make_transient_to_detached(obj)
+        return db.session.merge(obj, load=False)
 
     def get_by_attribute(self, attr_name, attr_value):
         return self.model.query.filter_by(**{attr_name: attr_value}).first()
@@ -0,0 +1,249 @@
+import math
+import re
+import unicodedata
+import weakref
+from collections import defaultdict
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import OperationalError
+
+# Same defaults as the FTS5 bm25() function
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Letters and digits, like the FTS5 unicode61 tokenizer; "term*" is a prefix
+TOKEN_RE = re.compile(r'[^\W_]+')
+QUERY_RE = re.compile(r'([^\W_]+)(\*?)')
+
+
+def _normalize(value):
+    """Lowercase and strip diacritics ("Café" -> "cafe")."""
+    value = unicodedata.normalize('NFKD', value or '')
+    return ''.join(c for c in value if not unicodedata.combining(c)).lower()
+
+
+def tokenize(value):
+    return TOKEN_RE.findall(_normalize(value))
+
+
+def parse_query(query):
+    """Split a search string into (term, is_prefix) pairs, all required."""
+    return [(term, bool(star))
+            for term, star in QUERY_RE.findall(_normalize(query))]
+
+
+class SearchUnavailableError(Exception):
+    """Full-text search was asked of a store without a search index."""
+
+
+def _idf(matching, total):
+    # bm25() clamps negative IDFs of very common terms to a tiny positive one
+    return max(math.log((total - matching + 0.5) / (matching + 0.5)), 1e-6)
+
+
+class InvertedIndex:
+    """In-memory full-text index ranked like SQLite's FTS5 bm25().
+
+    Documents are dicts of field -> text; `weights` maps each indexed field
+    to its bm25 column weight. Every query term must match.
+    """
+
+    def __init__(self, weights):
+        self.weights = weights
+        # term -> {doc_id: {field: term frequency}}
+        self._postings = defaultdict(dict)
+        self._terms = {}
+        self._lengths = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, doc_id, fields):
+        self.remove(doc_id)
+        length = 0
+        terms = set()
+        for field in self.weights:
+            tokens = tokenize(fields.get(field))
+            length += len(tokens)
+            for token in tokens:
+                counts = self._postings[token].setdefault(doc_id, {})
+                counts[field] = counts.get(field, 0) + 1
+                terms.add(token)
+        self._terms[doc_id] = terms
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id):
+        for term in self._terms.pop(doc_id, ()):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+
+    def _phrase_hits(self, term, prefix):
+        """{doc_id: weighted frequency} for one query term."""
+        terms = ([t for t in self._postings if t.startswith(term)]
+                 if prefix else [term] if term in self._postings else [])
+        hits = defaultdict(float)
+        for t in terms:
+            for doc_id, counts in self._postings[t].items():
+                hits[doc_id] += sum(self.weights[field] * count
+                                    for field, count in counts.items())
+        return hits
+
+    def search(self, query, limit=None, offset=0):
+        """Return [(doc_id, score), ...], best first, ties by doc_id."""
+        phrases = parse_query(query)
+        if not phrases or not self._lengths:
+            return []
+        hits = [self._phrase_hits(term, prefix) for term, prefix in phrases]
+        candidates = set.intersection(*(set(h) for h in hits))
+        total = len(self._lengths)
+        average = self._total_length / total or 1
+        scores = []
+        for doc_id in candidates:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B *
+                              self._lengths[doc_id] / average)
+            score = sum(_idf(len(h), total) * h[doc_id] * (BM25_K1 + 1)
+                        / (h[doc_id] + norm) for h in hits)
+            scores.append((doc_id, score))
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        end = None if limit is None else offset + limit
+        return scores[offset:end]
+
+
+class SearchTable:
+    """SQLite FTS5 index over text columns of a model.
+
+    The virtual table is created alongside the model's table and kept in
+    step by mapper events on insert, text update and delete, inside the same
+    transaction as the row. It is skipped on other databases and on SQLite
+    builds without FTS5; `enabled()` tells callers which case applies.
+
+    Index rows are keyed by rowid. A companion `<name>_ids` table maps each
+    rowid to the model's primary key, so a row is found by an integer
+    lookup whatever its id looks like.
+    """
+
+    def __init__(self, model, name, weights):
+        self.model = model
+        self.name = name
+        self.ids = f'{name}_ids'
+        self.weights = weights
+        self.columns = list(weights)
+        self._enabled = weakref.WeakKeyDictionary()
+        table = model.__table__
+        event.listen(table, 'after_create', self._after_create)
+        event.listen(table, 'before_drop', self._before_drop)
+        event.listen(model, 'after_insert', self._after_insert)
+        event.listen(model, 'after_update', self._after_update)
+        event.listen(model, 'after_delete', self._after_delete)
+
+    def enabled(self, conn):
+        engine = conn.engine
+        if engine not in self._enabled:
+            self._enabled[engine] = (conn.dialect.name == 'sqlite' and
+                                     inspect(conn).has_table(self.name))
+        return self._enabled[engine]
+
+    def create(self, conn):
+        """Create the virtual table if SQLite supports it; returns whether
+        the index is available."""
+        if conn.dialect.name != 'sqlite':
+            return False
+        columns = ', '.join(self.columns)
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.name} USING "
+                f"fts5({columns}, tokenize='unicode61 remove_diacritics 2')"))
+        except OperationalError:
+            # SQLite compiled without FTS5
+            self._enabled[conn.engine] = False
+            return False
+        # INTEGER PRIMARY KEY: unlike an implicit rowid, VACUUM keeps it
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {self.ids} (doc INTEGER PRIMARY "
+            f"KEY, row_id VARCHAR(36) NOT NULL UNIQUE)"))
+        self._enabled[conn.engine] = True
+        return True
+
+    def drop(self, conn):
+        conn.execute(text(f"DROP TABLE IF EXISTS {self.name}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {self.ids}"))
+        self._enabled.pop(conn.engine, None)
+
+    def rebuild(self, conn):
+        """Re-index every row of the model's table."""
+        table = self.model.__tablename__
+        columns = ', '.join(self.columns)
+        sources = ', '.join(f"COALESCE({c}, '')" for c in self.columns)
+        conn.execute(text(f"DELETE FROM {self.name}"))
+        conn.execute(text(f"DELETE FROM {self.ids}"))
+        conn.execute(text(f"INSERT INTO {self.ids} (row_id) "
+                          f"SELECT id FROM {table}"))
+        conn.execute(text(f"INSERT INTO {self.name} (rowid, {columns}) "
+                          f"SELECT ids.doc, {sources} FROM {table} "
+                          f"JOIN {self.ids} AS ids ON ids.row_id = {table}.id"))
+
+    def search(self, conn, query, limit, offset=0):
+        """Return [(id, score), ...] best first, higher scores better."""
+        phrases = parse_query(query)
+        if not phrases:
+            return []
+        match = ' '.join(f'"{term}"' + ('*' if prefix else '')
+                         for term, prefix in phrases)
+        weights = ', '.join(str(w) for w in self.weights.values())
+        rows = conn.execute(text(
+            f"SELECT ids.row_id, bm25({self.name}, {weights}) AS rank "
+            f"FROM {self.name} JOIN {self.ids} AS ids "
+            f"ON ids.doc = {self.name}.rowid "
+            f"WHERE {self.name} MATCH :match "
+            f"ORDER BY rank, ids.row_id LIMIT :limit OFFSET :offset"),
+            {'match': match, 'limit': limit, 'offset': offset})
+        return [(row.row_id, -row.rank) for row in rows]
+
+    def _delete(self, conn, obj_id):
+        conn.execute(text(f"DELETE FROM {self.name} WHERE rowid = "
+                          f"(SELECT doc FROM {self.ids} WHERE row_id = :id)"),
+                     {'id': obj_id})
+        conn.execute(text(f"DELETE FROM {self.ids} WHERE row_id = :id"),
+                     {'id': obj_id})
+
+    def _insert(self, conn, target):
+        doc = conn.execute(text(f"INSERT INTO {self.ids} (row_id) "
+                                f"VALUES (:id)"), {'id': target.id}).lastrowid
+        columns = ', '.join(self.columns)
+        params = ', '.join(f':{c}' for c in self.columns)
+        values = {c: getattr(target, c) or '' for c in self.columns}
+        conn.execute(text(f"INSERT INTO {self.name} (rowid, {columns}) "
+                          f"VALUES (:doc, {params})"), dict(values, doc=doc))
+
+    def _after_create(self, table, conn, **kw):
+        self.create(conn)
+
+    def _before_drop(self, table, conn, **kw):
+        if conn.dialect.name == 'sqlite':
+            self.drop(conn)
+        self._enabled.pop(conn.engine, None)
+
+    def _after_insert(self, mapper, conn, target):
+        if self.enabled(conn):
+            self._insert(conn, target)
+
+    def _after_update(self, mapper, conn, target):
+        state = inspect(target)
+        changed = any(state.attrs[c].history.has_changes()
+                      for c in self.columns)
+        if changed:
+            self.replace(conn, target)
+
+    def replace(self, conn, target):
+        """Re-index one row; for writes that bypass the mapper events."""
+        if self.enabled(conn):
+            self._delete(conn, target.id)
+            self._insert(conn, target)
+
+    def _after_delete(self, mapper, conn, target):
+        if self.enabled(conn):
+            self._delete(conn, target.id)
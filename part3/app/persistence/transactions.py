@@ -0,0 +1,70 @@
+import functools
+import random
+import threading
+import time
+from contextlib import nullcontext
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from app import db
+
+_settings = {'retries': 0, 'backoff': 0.05, 'serialize': False}
+_write_lock = threading.RLock()
+_local = threading.local()
+
+LOCK_ERRORS = ('database is locked', 'database is busy',
+               'database table is locked')
+
+
+def configure_sqlite(engine, pragmas):
+    """Run PRAGMA statements on every new connection of a SQLite engine."""
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def configure_writes(retries=0, backoff=0.05, serialize=False):
+    """Set how write_operation retries lock errors and whether writes in
+    this process are serialized behind one lock."""
+    _settings.update(retries=retries, backoff=backoff, serialize=serialize)
+
+
+def is_lock_error(error):
+    message = str(getattr(error, 'orig', error)).lower()
+    return any(text in message for text in LOCK_ERRORS)
+
+
+def write_operation(func):
+    """Run a facade write as a retryable unit of work.
+
+    On a lock error the whole session is rolled back and the operation is
+    replayed with exponential backoff and jitter, so changes staged outside
+    the repository (rating aggregates, amenity links) are replayed too.
+    Nested write operations run inside the outermost one's attempt.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'depth', 0):
+            return func(*args, **kwargs)
+        attempt = 0
+        while True:
+            lock = _write_lock if _settings['serialize'] else nullcontext()
+            _local.depth = 1
+            try:
+                with lock:
+                    return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_error(e) or attempt >= _settings['retries']:
+                    raise
+                db.session.rollback()
+            finally:
+                _local.depth = 0
+            delay = _settings['backoff'] * (2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            attempt += 1
+    return wrapper
@@ -0,0 +1,66 @@
+"""Per-table version counters, for the ETags of lists.
+
+Every transaction that writes to a tracked table bumps its row in
+`collection_versions`, in the same transaction, so a list's validator is a
+primary-key lookup rather than an aggregate over the table, and every
+worker sharing the database sees the same value.
+"""
+from sqlalchemy import event, inspect
+from app import db
+
+TRACKED_TABLES = ('users', 'amenities', 'places', 'reviews')
+
+collection_versions = db.Table(
+    'collection_versions',
+    db.Column('name', db.String(50), primary_key=True),
+    db.Column('version', db.Integer, nullable=False, default=0,
+              server_default='0'),
+)
+
+
+def seed(conn):
+    """Add the missing counter rows, starting at 0."""
+    existing = {row.name for row in conn.execute(
+        collection_versions.select())}
+    missing = [{'name': name, 'version': 0} for name in TRACKED_TABLES
+               if name not in existing]
+    if missing:
+        conn.execute(collection_versions.insert(), missing)
+
+
+@event.listens_for(collection_versions, 'after_create')
+def _after_create(table, conn, **kw):
+    seed(conn)
+
+
+def table_version(name):
+    """The counter of table `name`, bumped by every committed write."""
+    return db.session.execute(
+        db.select(collection_versions.c.version)
+        .where(collection_versions.c.name == name)).scalar()
+
+
+def _bump(session, names):
+    names = sorted(set(names).intersection(TRACKED_TABLES))
+    if names:
+        # On the session's connection: a flush or ORM statement must not
+        # be triggered from inside these hooks
+        session.connection().execute(
+            collection_versions.update()
+            .where(collection_versions.c.name.in_(names))
+            .values(version=collection_versions.c.version + 1))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _after_flush(session, flush_context):
+    _bump(session, (inspect(obj).mapper.local_table.name
+                    for obj in list(session.new) + list(session.dirty)
+                    + list(session.deleted)))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _on_bulk_write(state):
+    # ORM and Core UPDATE/DELETE statements alike name their table
+    table = getattr(state.statement, 'table', None)
+    if (state.is_update or state.is_delete) and table is not None:
+        _bump(state.session, [table.name])
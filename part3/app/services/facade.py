@@ -1,11 +1,27 @@
+import math
+from datetime import datetime
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
 from app.services.user_repository import UserRepository
-from app.services.place_repository import PlaceRepository
+from app.services.place_repository import PlaceRepository, PLACE_SORTS
 from app.services.review_repository import ReviewRepository
 from app.services.amenity_repository import AmenityRepository
 from app.models.user import User
 from app.models.amenity import Amenity
 from app.models.place import Place
 from app.models.review import Review
+from app.persistence.pagination import (encode_cursor, decode_cursor,
+                                       encode_key, decode_key)
+from app.persistence.cache import CachedRepository
+from app.persistence.geo import EARTH_RADIUS_KM
+from app.persistence.transactions import write_operation
+from app.passwords import passwords, PasswordServiceBusy
+
+# Fields an owner may change with a single conditional UPDATE: plain columns
+# with no references to check
+OWNED_PLACE_FIELDS = {'title', 'description', 'price', 'latitude',
+                      'longitude'}
+OWNED_REVIEW_FIELDS = {'text', 'rating'}
 
 
 class HBnBFacade:
@@ -16,12 +32,72 @@ class HBnBFacade:
         self.place_repo = PlaceRepository()
         self.review_repo = ReviewRepository()
 
+    def configure_cache(self, settings):
+        """Wrap repositories in a read-through cache, per model name.
+
+        `settings` maps a model name to CachedRepository options, e.g.
+        {'Place': {'maxsize': 1024, 'ttl': 60}}. Models left out are
+        served uncached; calling again replaces the previous setup.
+        """
+        for name in ('user_repo', 'amenity_repo', 'place_repo',
+                     'review_repo'):
+            repo = getattr(self, name)
+            repo = getattr(repo, 'inner', repo)
+            model = getattr(repo, 'model', None)
+            options = settings.get(model.__name__) if model else None
+            if options is not None:
+                repo = CachedRepository(repo, **options)
+            setattr(self, name, repo)
+
+    def collection_version(self, *names):
+        """Version of each named collection: 'users', 'places', 'reviews'
+        or 'amenities'. Any write to a collection changes its version."""
+        repos = {'users': self.user_repo, 'places': self.place_repo,
+                 'reviews': self.review_repo, 'amenities': self.amenity_repo}
+        return [repos[name].collection_version() for name in names]
+
+    def cache_stats(self):
+        return {repo.model.__name__: repo.stats
+                for repo in (self.user_repo, self.amenity_repo,
+                             self.place_repo, self.review_repo)
+                if isinstance(repo, CachedRepository)}
+
+    def _bulk_create(self, repo, items, build, chunk_size):
+        """Build each item with `build` (running the model validators) and
+        insert the valid ones in chunks.
+
+        Returns (created_count, [(index, message), ...]) sorted by index.
+        """
+        errors = []
+
+        def objects():
+            for index, data in enumerate(items):
+                try:
+                    if isinstance(data, Exception):
+                        raise data
+                    if not isinstance(data, dict):
+                        raise ValueError("Item must be a JSON object")
+                    yield index, build(data)
+                except KeyError as e:
+                    errors.append((index, f"Missing field: {e.args[0]}"))
+                except (ValueError, TypeError) as e:
+                    errors.append((index, str(e)))
+
+        created, db_errors = repo.bulk_add(objects(), chunk_size)
+        return created, sorted(errors + db_errors)
+
     # -----------------
     # User operations
     # -----------------
     def create_user(self, user_data):
         user = User(**user_data)
+        # Hashed before the write begins: bcrypt may wait for a worker of
+        # the password service and must not hold a transaction meanwhile
         user.hash_password(user_data['password'])
+        return self._add_user(user)
+
+    @write_operation
+    def _add_user(self, user):
         self.user_repo.add(user)
         return user
 
@@ -34,19 +110,54 @@ class HBnBFacade:
     def get_users(self):
         return self.user_repo.get_all()
 
+    def authenticate(self, email, password):
+        """The user with these credentials, or None.
+
+        A password hashed with another bcrypt cost than the configured one
+        is rehashed on the way, so changing BCRYPT_LOG_ROUNDS takes effect
+        as users log in. The rehash is skipped while the password service
+        is busy: the login has succeeded, a later one will redo it.
+        """
+        user = self.get_user_by_email(email)
+        if not user or not user.verify_password(password):
+            return None
+        if user.needs_rehash():
+            try:
+                hashed = passwords.hash(password)
+            except PasswordServiceBusy:
+                return user
+            self._update_user(user.id, {'password': hashed})
+        return user
+
+    def iter_users(self):
+        return self.user_repo.iter_all()
+
     def update_user(self, user_id, data):
-        user = self.get_user(user_id)
-        if not user:
+        # Checked before hashing: no bcrypt round for a missing user
+        if not self.get_user(user_id):
             return None
+        data = dict(data)
         if 'password' in data:
-            user.hash_password(data.pop('password'))
+            data['password'] = passwords.hash(data['password'])
+        return self._update_user(user_id, data)
+
+    @write_operation
+    def _update_user(self, user_id, data):
+        if not self.get_user(user_id):
+            return None
         self.user_repo.update(user_id, data)
         return self.get_user(user_id)
 
     # -----------------
     # Place operations
     # -----------------
+    @write_operation
     def create_place(self, place_data):
+        place = self._build_place(place_data)
+        self.place_repo.add(place)
+        return place
+
+    def _build_place(self, place_data):
         owner_id = place_data.get("owner_id")
         if not self.get_user(owner_id):
             raise ValueError("Owner not found")
@@ -68,15 +179,150 @@ class HBnBFacade:
             owner_id=owner_id,
         )
         place.amenities = amenity_objects
-        self.place_repo.add(place)
         return place
 
+    def bulk_create_places(self, items, owner_id=None, chunk_size=500):
+        """Create places from an iterable of dicts; items without an
+        owner_id are assigned to `owner_id`."""
+        def build(data):
+            return self._build_place({"owner_id": owner_id, **data})
+        return self._bulk_create(self.place_repo, items, build, chunk_size)
+
     def get_place(self, place_id):
         return self.place_repo.get(place_id)
 
-    def get_all_places(self):
-        return self.place_repo.get_all()
+    def get_place_details(self, place_id, fields=None, embed=None):
+        """Load a place with only `fields` and the `embed` relationships;
+        everything when neither is given."""
+        if fields is None and embed is None:
+            return self.place_repo.get_place_with_details(place_id)
+        options = self.place_repo.loader_options(fields, embed or ())
+        return self.place_repo.get_with_options(place_id, options)
+
+    def get_all_places(self, fields=None, embed=()):
+        return self.place_repo.get_all(
+            self.place_repo.loader_options(fields, embed, many=True))
+
+    def iter_places(self, fields=None, embed=()):
+        return self.place_repo.iter_all(options=self.place_repo.loader_options(
+            fields, embed, many=True))
+
+    def get_places_page(self, limit, cursor=None, fields=None, embed=()):
+        """Return (places, next_cursor) for one page of the catalog."""
+        after = decode_cursor(cursor) if cursor else None
+        # Fetch one extra row to know whether another page exists
+        places = self.place_repo.get_page(
+            limit + 1, after,
+            self.place_repo.loader_options(fields, embed, many=True))
+        if len(places) <= limit:
+            return places, None
+        places = places[:limit]
+        return places, encode_cursor(places[-1])
+
+    def filter_places(self, filters, sort='created_at', limit=20,
+                      cursor=None, fields=None, embed=()):
+        """Return (places, next_cursor) for one page of places matching
+        `filters` (min_price, max_price, amenity_ids, min_rating), ordered
+        by one of PLACE_SORTS."""
+        if sort not in PLACE_SORTS:
+            raise ValueError("sort must be one of " + ", ".join(PLACE_SORTS))
+        min_price = filters.get('min_price')
+        max_price = filters.get('max_price')
+        if any(p is not None and p < 0 for p in (min_price, max_price)):
+            raise ValueError("Prices must be non-negative")
+        if None not in (min_price, max_price) and min_price > max_price:
+            raise ValueError("min_price must not exceed max_price")
+        min_rating = filters.get('min_rating')
+        if min_rating is not None and not 0 <= min_rating <= 5:
+            raise ValueError("min_rating must be between 0 and 5")
+
+        after = None
+        if cursor:
+            value, place_id = decode_key(cursor)
+            try:
+                if sort.lstrip('-') == 'created_at':
+                    value = datetime.fromisoformat(value)
+                else:
+                    value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+            after = (value, place_id)
+
+        if fields is not None:
+            # The next cursor is built from the sort value of the last row
+            name = sort.lstrip('-')
+            fields = list(fields) + [
+                'average_rating' if name == 'rating' else name]
+        places = self.place_repo.search(
+            min_price=min_price, max_price=max_price,
+            amenity_ids=filters.get('amenity_ids'), min_rating=min_rating,
+            sort=sort, limit=limit + 1, after=after,
+            options=self.place_repo.loader_options(fields, embed, many=True))
+        if len(places) <= limit:
+            return places, None
+        places = places[:limit]
+        value = self.place_repo.sort_value(places[-1], sort)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        return places, encode_key([value, places[-1].id])
+
+    def search_places(self, query, limit, offset=0, fields=None, embed=()):
+        """Return ([(place, score), ...], next_offset) for one page of
+        full-text matches."""
+        if not query or not query.strip():
+            raise ValueError("Search query must not be empty")
+        results = self.place_repo.search_text(
+            query, limit + 1, offset,
+            self.place_repo.loader_options(fields, embed, many=True))
+        if len(results) <= limit:
+            return results, None
+        return results[:limit], offset + limit
 
+    def get_places_in_bbox(self, min_lat, min_lng, max_lat, max_lng,
+                           limit=20, cursor=None, fields=None, embed=()):
+        """Return (places, next_cursor) for one page of the places inside
+        a bounding box, oldest first."""
+        if not (-90 <= min_lat <= max_lat <= 90):
+            raise ValueError("Latitude bounds must satisfy "
+                             "-90 <= min_lat <= max_lat <= 90")
+        if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+            raise ValueError("Longitude bounds must be between -180 and 180")
+        after = decode_cursor(cursor) if cursor else None
+        places = self.place_repo.get_places_in_bbox(
+            min_lat, min_lng, max_lat, max_lng, limit + 1, after,
+            self.place_repo.loader_options(fields, embed, many=True))
+        if len(places) <= limit:
+            return places, None
+        places = places[:limit]
+        return places, encode_cursor(places[-1])
+
+    def get_places_near(self, latitude, longitude, radius_km, limit=20,
+                        cursor=None, fields=None, embed=()):
+        """Return ([(place, distance_km), ...], next_cursor) for one page
+        of the places within `radius_km`, nearest first."""
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("Invalid coordinates")
+        if radius_km <= 0:
+            raise ValueError("radius_km must be positive")
+        after = None
+        if cursor:
+            closeness, place_id = decode_key(cursor)
+            if not isinstance(closeness, float):
+                raise ValueError("Invalid cursor")
+            after = (closeness, place_id)
+        matches = self.place_repo.get_places_near(
+            latitude, longitude, radius_km, limit + 1, after,
+            self.place_repo.loader_options(fields, embed, many=True))
+        next_cursor = None
+        if len(matches) > limit:
+            matches = matches[:limit]
+            place, closeness = matches[-1]
+            next_cursor = encode_key([closeness, place.id])
+        return [(place, 2 * EARTH_RADIUS_KM * math.asin(
+                     min(1.0, math.sqrt(closeness))))
+                for place, closeness in matches], next_cursor
+
+    @write_operation
     def update_place(self, place_id, place_data):
         place = self.get_place(place_id)
         if not place:
@@ -96,26 +342,84 @@ class HBnBFacade:
                         raise ValueError("Amenity not found")
                     amenity_objects.append(amenity)
                 place.amenities = amenity_objects
+                # Link changes alone would leave updated_at, and so the
+                # place's ETag, untouched
+                update_data["updated_at"] = datetime.utcnow()
             else:
                 update_data[key] = value
 
         self.place_repo.update(place_id, update_data)
         return self.get_place(place_id)
 
+    @staticmethod
+    def owned_place_update_supported(place_data):
+        """Whether update_owned_place can apply `place_data`: only plain
+        columns, and coordinates in pairs so the geohash needs no load."""
+        keys = set(place_data)
+        return (bool(keys) and keys <= OWNED_PLACE_FIELDS
+                and ('latitude' in keys) == ('longitude' in keys))
+
+    @write_operation
+    def update_owned_place(self, place_id, owner_id, place_data):
+        """Update a place owned by `owner_id` without loading it first.
+
+        Returns the updated place, or None when it does not exist or
+        belongs to someone else.
+        """
+        # A transient probe runs the model validators and derives the geohash
+        probe = self._owned_probe(Place, self.place_repo, place_id,
+                                  'owner_id', owner_id, place_data)
+        if probe is None:
+            return None
+        values = {key: getattr(probe, key) for key in place_data}
+        if 'latitude' in values:
+            values['geohash'] = probe.geohash
+        row = self.place_repo.update_owned(place_id, 'owner_id', owner_id,
+                                           values)
+        if row is None:
+            return None
+        return self.place_repo.from_row(row)
+
+    @staticmethod
+    def _owned_probe(model, repo, obj_id, owner_column, owner_id, data):
+        """A transient `model` with `data` set, which runs its validators.
+
+        Invalid data is only reported to the owner: for a missing row or
+        someone else's, None is returned as when the write matches no row,
+        so the schema is not revealed to callers who may not write it.
+        """
+        probe = model()
+        try:
+            for key, value in data.items():
+                setattr(probe, key, value)
+        except ValueError:
+            obj = repo.get(obj_id)
+            if obj is None or getattr(obj, owner_column) != owner_id:
+                return None
+            raise
+        return probe
+
     # -----------------
     # Amenity operations
     # -----------------
+    @write_operation
     def create_amenity(self, amenity_data):
         amenity = Amenity(name=amenity_data["name"])
         self.amenity_repo.add(amenity)
         return amenity
 
+    def bulk_create_amenities(self, items, chunk_size=500):
+        return self._bulk_create(
+            self.amenity_repo, items,
+            lambda data: Amenity(name=data["name"]), chunk_size)
+
     def get_amenity(self, amenity_id):
         return self.amenity_repo.get(amenity_id)
 
     def get_all_amenities(self):
         return self.amenity_repo.get_all()
 
+    @write_operation
     def update_amenity(self, amenity_id, amenity_data):
         amenity = self.amenity_repo.get(amenity_id)
         if not amenity:
@@ -131,12 +435,28 @@ class HBnBFacade:
     # -----------------
     # Review operations
     # -----------------
+    @write_operation
     def create_review(self, review_data):
+        review, place = self._build_review(review_data)
+        # Committed together with the review by the repository
+        place.adjust_ratings({review.rating: 1})
+        try:
+            self.review_repo.add(review)
+        except IntegrityError:
+            # Lost a race with a concurrent review by the same user
+            raise ValueError("You have already reviewed this place")
+        return review
+
+    def has_reviewed(self, user_id, place_id):
+        return self.review_repo.exists_for_user_and_place(user_id, place_id)
+
+    def _build_review(self, review_data):
         user_id = review_data.get("user_id")
         place_id = review_data.get("place_id")
         if not self.get_user(user_id):
             raise ValueError("User not found")
-        if not self.get_place(place_id):
+        place = self.get_place(place_id)
+        if not place:
             raise ValueError("Place not found")
         review = Review(
             text=review_data.get("text"),
@@ -144,14 +464,40 @@ class HBnBFacade:
             place_id=place_id,
             user_id=user_id,
         )
-        self.review_repo.add(review)
-        return review
+        return review, place
+
+    def bulk_create_reviews(self, items, chunk_size=500):
+        touched = set()
+
+        def build(data):
+            review, place = self._build_review(data)
+            if place.owner_id == review.user_id:
+                raise ValueError("You cannot review your own place")
+            touched.add(place.id)
+            return review
+
+        try:
+            return self._bulk_create(self.review_repo, items, build,
+                                     chunk_size)
+        finally:
+            # Recompute once per touched place rather than per review
+            self.place_repo.rebuild_rating_aggregates(touched)
 
     def get_review(self, review_id):
         return self.review_repo.get(review_id)
 
-    def get_all_reviews(self):
-        return self.review_repo.get_all()
+    def get_review_details(self, review_id, fields=None, embed=()):
+        options = self.review_repo.loader_options(fields, embed)
+        return self.review_repo.get_with_options(review_id, options)
+
+    def get_all_reviews(self, fields=None, embed=()):
+        return self.review_repo.get_all(
+            self.review_repo.loader_options(fields, embed, many=True))
+
+    def iter_reviews(self, fields=None, embed=()):
+        return self.review_repo.iter_all(
+            options=self.review_repo.loader_options(fields, embed,
+                                                    many=True))
 
     def get_reviews_by_place(self, place_id):
         place = self.get_place(place_id)
@@ -159,6 +505,7 @@ class HBnBFacade:
             return []
         return place.reviews
 
+    @write_operation
     def update_review(self, review_id, review_data):
         review = self.get_review(review_id)
         if not review:
@@ -171,9 +518,11 @@ class HBnBFacade:
             raise ValueError("Text is required")
 
         update_data = {}
+        new_place = None
         for key, value in review_data.items():
             if key == "place_id":
-                if not self.get_place(value):
+                new_place = self.get_place(value)
+                if not new_place:
                     raise ValueError("Place not found")
                 update_data["place_id"] = value
             elif key == "user_id":
@@ -183,12 +532,82 @@ class HBnBFacade:
             else:
                 update_data[key] = value
 
-        self.review_repo.update(review_id, update_data)
+        self._move_rating(review, new_place,
+                          update_data.get("rating", review.rating))
+        try:
+            self.review_repo.update(review_id, update_data)
+        except IntegrityError:
+            raise ValueError("You have already reviewed this place")
         return self.get_review(review_id)
 
+    @staticmethod
+    def owned_review_update_supported(review_data):
+        """Whether update_owned_review can apply `review_data`."""
+        keys = set(review_data)
+        return bool(keys) and keys <= OWNED_REVIEW_FIELDS
+
+    @write_operation
+    def update_owned_review(self, review_id, user_id, review_data):
+        """Update a review written by `user_id` without loading it first.
+
+        A rating change moves the place aggregates with subqueries on the
+        review, in the same transaction. Returns the updated review, or
+        None when it does not exist or belongs to someone else.
+        """
+        probe = self._owned_probe(Review, self.review_repo, review_id,
+                                  'user_id', user_id, review_data)
+        if probe is None:
+            return None
+        values = {key: getattr(probe, key) for key in review_data}
+        if 'rating' in values:
+            # Runs before the review UPDATE, so the subquery reads the old
+            # rating; matches no place when the review is not the user's
+            mine = and_(Review.id == review_id, Review.user_id == user_id)
+            self.place_repo.update_values(
+                select(Review.place_id).where(mine).scalar_subquery(),
+                Place.rating_move_values(
+                    select(Review.rating).where(mine).scalar_subquery(),
+                    values['rating']),
+                commit=False)
+        row = self.review_repo.update_owned(review_id, 'user_id', user_id,
+                                            values)
+        if row is None:
+            return None
+        return self.review_repo.from_row(row)
+
+    @write_operation
+    def delete_owned_review(self, review_id, user_id):
+        """Delete a review written by `user_id` without loading it first;
+        False when it does not exist or belongs to someone else."""
+        row = self.review_repo.delete_owned(review_id, 'user_id', user_id,
+                                            commit=False)
+        if row is None:
+            return False
+        self.place_repo.update_values(
+            row.place_id, Place.rating_values({row.rating: -1}))
+        return True
+
+    def _move_rating(self, review, new_place, new_rating):
+        """Adjust place aggregates for a review changing rating and/or place."""
+        old_place = self.get_place(review.place_id)
+        if new_place is None or new_place is old_place:
+            if new_rating != review.rating:
+                old_place.adjust_ratings({review.rating: -1, new_rating: 1})
+            return
+        old_place.adjust_ratings({review.rating: -1})
+        new_place.adjust_ratings({new_rating: 1})
+
+    @write_operation
     def delete_review(self, review_id):
         review = self.get_review(review_id)
         if not review:
             return False
+        place = self.get_place(review.place_id)
+        place.adjust_ratings({review.rating: -1})
         self.review_repo.delete(review_id)
         return True
+
+    @write_operation
+    def rebuild_place_ratings(self):
+        """Recompute every place's rating aggregates from its reviews."""
+        return self.place_repo.rebuild_rating_aggregates()
@@ -1,10 +1,232 @@
-from app.models.place import Place
+import math
+from sqlalchemy import and_, func, or_, tuple_
+from app import db
+from sqlalchemy.orm import joinedload, lazyload, selectinload
+from app.persistence.geo import EARTH_RADIUS_KM, cover_bbox, radius_bbox
+from app.models.place import (Place, place_amenity, place_search,
+                              AVERAGE_RATING)
+from app.persistence.search import parse_query
+from app.models.review import Review
+from app.models.user import User
+from app.models.amenity import Amenity
 from app.persistence.repository import SQLAlchemyRepository
 
+# Sort names accepted by PlaceRepository.search: (expression, descending).
+# Each is backed by an index on (expression, id)
+PLACE_SORTS = {
+    'created_at': (Place.created_at, False),
+    '-created_at': (Place.created_at, True),
+    'price': (Place.price, False),
+    '-price': (Place.price, True),
+    'rating': (AVERAGE_RATING, False),
+    '-rating': (AVERAGE_RATING, True),
+}
+
+
+def haversine_term(latitude, longitude):
+    """SQL for the haversine term a of each place's distance from a point:
+    sin²(Δφ/2) + cos φ1 cos φ2 sin²(Δλ/2), increasing with the distance
+    2R·asin(√a). Periodic in longitude, so it is right across the
+    antimeridian."""
+    d_phi = func.radians(Place.latitude - latitude) / 2
+    d_lambda = func.radians(Place.longitude - longitude) / 2
+    return (func.sin(d_phi) * func.sin(d_phi)
+            + math.cos(math.radians(latitude))
+            * func.cos(func.radians(Place.latitude))
+            * func.sin(d_lambda) * func.sin(d_lambda))
+
 
 class PlaceRepository(SQLAlchemyRepository):
+    FIELD_COLUMNS = {
+        'average_rating': ('review_count', 'rating_sum'),
+        'rating_histogram': tuple(f'rating_{r}_count' for r in range(1, 6)),
+    }
+    EMBEDS = {
+        'owner': lambda many: (selectinload if many else joinedload)(
+            Place.owner).load_only(User.first_name, User.last_name,
+                                   User.email, User.updated_at),
+        'amenities': lambda many: selectinload(Place.amenities).load_only(
+            Amenity.name, Amenity.updated_at),
+        'reviews': lambda many: selectinload(Place.reviews).load_only(
+            Review.text, Review.rating, Review.user_id,
+            Review.updated_at).joinedload(Review.user).load_only(
+            User.first_name, User.last_name, User.updated_at),
+    }
+
     def __init__(self):
         super().__init__(Place)
 
+    def _owned_updated(self, row, values):
+        # Core updates skip the mapper events maintaining the search index
+        if values.keys() & set(place_search.columns):
+            place_search.replace(db.session.connection(), row)
+
     def get_places_by_owner(self, owner_id):
         return self.model.query.filter_by(owner_id=owner_id).all()
+
+    def get_place_with_details(self, place_id):
+        """Load a place with its owner, amenities and reviews (with their
+        authors) in a fixed number of queries, whatever the review count."""
+        return (self.model.query
+                .options(joinedload(Place.owner),
+                         selectinload(Place.amenities),
+                         selectinload(Place.reviews).joinedload(Review.user))
+                .filter_by(id=place_id)
+                .first())
+
+    def search(self, min_price=None, max_price=None, amenity_ids=None,
+               min_rating=None, sort='created_at', limit=20, after=None,
+               options=None):
+        """Return up to `limit` places matching every given filter, in one
+        query ordered by `sort` (a PLACE_SORTS key) then id.
+
+        `amenity_ids` keeps places offering all of them. `after` is the
+        (sort value, id) key of the previous page's last place.
+        """
+        expression, descending = PLACE_SORTS[sort]
+        # Summaries by default: skip the eager amenity load
+        query = self.model.query.options(
+            *(options or [lazyload(Place.amenities)]))
+        if min_price is not None:
+            query = query.filter(Place.price >= min_price)
+        if max_price is not None:
+            query = query.filter(Place.price <= max_price)
+        # One primary-key probe of place_amenity per amenity and candidate,
+        # so the sort index drives the scan and LIMIT stops it early
+        for amenity_id in set(amenity_ids or ()):
+            query = query.filter(db.exists().where(
+                place_amenity.c.place_id == Place.id,
+                place_amenity.c.amenity_id == amenity_id))
+        if min_rating is not None:
+            query = query.filter(AVERAGE_RATING >= min_rating)
+        if after:
+            key, bound = tuple_(expression, Place.id), tuple_(*after)
+            query = query.filter(key < bound if descending else key > bound)
+        if descending:
+            query = query.order_by(expression.desc(), Place.id.desc())
+        else:
+            query = query.order_by(expression, Place.id)
+        return query.limit(limit).all()
+
+    @staticmethod
+    def sort_value(place, sort):
+        """The value of `place` for a PLACE_SORTS expression, as the
+        database computes it."""
+        if sort.lstrip('-') == 'rating':
+            if not place.review_count:
+                return 0.0
+            return place.rating_sum / place.review_count
+        return getattr(place, sort.lstrip('-'))
+
+    def search_text(self, query, limit, offset=0, options=()):
+        """Full-text search over titles and descriptions.
+
+        Returns (place, score) pairs ranked by FTS5 bm25, best first. On
+        databases without FTS5 every term must appear as a substring of the
+        title or description; results then come in creation order with a
+        score of None.
+        """
+        conn = db.session.connection()
+        if place_search.enabled(conn):
+            ranked = place_search.search(conn, query, limit, offset)
+            places = {p.id: p for p in self.model.query.options(
+                *options).filter(
+                self.model.id.in_([place_id for place_id, _ in ranked]))}
+            return [(places[place_id], score) for place_id, score in ranked
+                    if place_id in places]
+
+        terms = parse_query(query)
+        if not terms:
+            return []
+        query = self.model.query.options(*options).filter(*[
+            or_(self.model.title.ilike(f'%{term}%'),
+                self.model.description.ilike(f'%{term}%'))
+            for term, _ in terms])
+        places = (query.order_by(self.model.created_at, self.model.id)
+                  .offset(offset).limit(limit).all())
+        return [(place, None) for place in places]
+
+    def _query_bbox_cells(self, min_lat, min_lng, max_lat, max_lng,
+                          options=()):
+        """Places inside a bounding box, as a query. The indexed geohash
+        column prefilters them, one range scan per covering cell prefix;
+        the coordinates then decide."""
+        query = self.model.query.options(*options).filter(
+            self.model.latitude.between(min_lat, max_lat),
+            self.model.longitude.between(min_lng, max_lng)
+            if min_lng <= max_lng else
+            or_(self.model.longitude >= min_lng,
+                self.model.longitude <= max_lng))
+        prefixes = cover_bbox(min_lat, min_lng, max_lat, max_lng)
+        if prefixes is not None:
+            geohash = self.model.geohash
+            query = query.filter(or_(*[
+                and_(geohash >= prefix, geohash < prefix + '~')
+                for prefix in prefixes
+            ]))
+        return query
+
+    def get_places_in_bbox(self, min_lat, min_lng, max_lat, max_lng,
+                           limit, after=None, options=()):
+        """Return up to `limit` places inside a bounding box in
+        (created_at, id) order, after the `after` key of the previous
+        page; min_lng > max_lng means the box crosses the antimeridian."""
+        query = self._query_bbox_cells(min_lat, min_lng, max_lat, max_lng,
+                                       options)
+        if after:
+            query = query.filter(tuple_(Place.created_at, Place.id)
+                                 > tuple_(*after))
+        return (query.order_by(Place.created_at, Place.id)
+                .limit(limit).all())
+
+    def get_places_near(self, latitude, longitude, radius_km, limit,
+                        after=None, options=()):
+        """Return up to `limit` (place, closeness) pairs within
+        `radius_km`, nearest first then by id.
+
+        Closeness is the haversine term of the distance, computed by the
+        database so that it can order, bound and page on it: `after` is
+        the (closeness, id) of the previous page's last place.
+        """
+        closeness = haversine_term(latitude, longitude)
+        query = (self._query_bbox_cells(
+            *radius_bbox(latitude, longitude, radius_km), options)
+            .add_columns(closeness)
+            .filter(closeness <= math.sin(
+                radius_km / (2 * EARTH_RADIUS_KM)) ** 2))
+        if after:
+            query = query.filter(tuple_(closeness, Place.id)
+                                 > tuple_(*after))
+        return [tuple(row) for row in
+                query.order_by(closeness, Place.id).limit(limit)]
+
+    def rebuild_rating_aggregates(self, place_ids=None):
+        """Recompute review_count, rating_sum and the rating histogram from
+        the reviews table with set-based UPDATEs, for every place or only
+        `place_ids`. Returns the number of places rewritten."""
+        def from_reviews(expression, *criteria):
+            return (db.select(expression)
+                    .where(Review.place_id == self.model.id, *criteria)
+                    .scalar_subquery())
+
+        values = {
+            'review_count': from_reviews(func.count()),
+            'rating_sum': from_reviews(func.coalesce(func.sum(Review.rating),
+                                                     0)),
+        }
+        for rating in range(1, 6):
+            values[f'rating_{rating}_count'] = from_reviews(
+                func.count(), Review.rating == rating)
+        statement = db.update(self.model).values(**values)
+        if place_ids is None:
+            count = db.session.execute(statement).rowcount
+        else:
+            # Bounded IN lists keep each statement under SQLite's limits
+            place_ids = list(place_ids)
+            count = 0
+            for start in range(0, len(place_ids), 500):
+                batch = place_ids[start:start + 500]
+                count += db.session.execute(
+                    statement.where(self.model.id.in_(batch))).rowcount
+        db.session.commit()
+        return count
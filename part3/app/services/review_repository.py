@@ -1,8 +1,21 @@
+from sqlalchemy.orm import joinedload, lazyload, selectinload
+from app import db
+from app.models.place import Place
 from app.models.review import Review
+from app.models.user import User
 from app.persistence.repository import SQLAlchemyRepository
 
 
 class ReviewRepository(SQLAlchemyRepository):
+    EMBEDS = {
+        'user': lambda many: (selectinload if many else joinedload)(
+            Review.user).load_only(User.first_name, User.last_name,
+                                   User.updated_at),
+        'place': lambda many: (selectinload if many else joinedload)(
+            Review.place).load_only(Place.title, Place.updated_at).options(
+            lazyload(Place.amenities)),
+    }
+
     def __init__(self):
         super().__init__(Review)
 
@@ -11,3 +24,8 @@ class ReviewRepository(SQLAlchemyRepository):
 
     def get_reviews_by_user(self, user_id):
         return self.model.query.filter_by(user_id=user_id).all()
+
+    def exists_for_user_and_place(self, user_id, place_id):
+        """Single indexed probe on the unique (user_id, place_id) index."""
+        query = self.model.query.filter_by(user_id=user_id, place_id=place_id)
+        return db.session.query(query.exists()).scalar()
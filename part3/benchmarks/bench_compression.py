@@ -0,0 +1,125 @@
+"""Benchmark response compression: bytes on the wire and CPU cost.
+
+Builds a throw-away SQLite database with --places rows, fetches the places
+list as JSON and as an NDJSON stream through the test client for every
+encoding and level, and reports the body size, the CPU time per request
+and the share of it spent compressing:
+
+    python benchmarks/bench_compression.py --places 5000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.compression import available_encodings, compress  # noqa: E402
+
+WORDS = ('quiet bright spacious cosy flat loft studio garden view river '
+         'centre station beach mountain terrace balcony kitchen').split()
+
+
+def populate(places):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    owner = str(uuid.uuid4())
+    db.session.execute(text(
+        "INSERT INTO users (id, first_name, last_name, email, password, "
+        "is_admin, created_at, updated_at) VALUES (:id, 'B', 'Owner', "
+        "'owner@bench.io', 'x', 0, :now, :now)"), {'id': owner, 'now': now})
+    db.session.execute(text(
+        "INSERT INTO places (id, title, description, price, latitude, "
+        "longitude, owner_id, created_at, updated_at) VALUES (:id, :title, "
+        ":description, :price, :lat, :lon, :owner, :at, :at)"),
+        [{'id': str(uuid.uuid4()),
+          'title': ' '.join(rng.choices(WORDS, k=3)).title(),
+          'description': ' '.join(rng.choices(WORDS, k=25)),
+          'price': round(rng.uniform(10, 1000), 2),
+          'lat': rng.uniform(-90, 90), 'lon': rng.uniform(-180, 180),
+          'owner': owner, 'at': now + timedelta(seconds=i)}
+         for i in range(places)])
+    db.session.commit()
+
+
+def measure(app, accept, encoding, repeats):
+    headers = {'Accept': accept}
+    if encoding:
+        headers['Accept-Encoding'] = encoding
+    client = app.test_client()
+    body = b''
+    start = time.process_time()
+    for _ in range(repeats):
+        res = client.get('/api/v1/places/', headers=headers)
+        # Drains streamed bodies too, so the whole response is produced
+        body = res.get_data()
+        assert res.headers.get('Content-Encoding') == encoding
+    return body, (time.process_time() - start) / repeats * 1000
+
+
+def compress_cost(body, encoding, level, repeats):
+    start = time.process_time()
+    for _ in range(repeats):
+        compress(body, encoding, level)
+    return (time.process_time() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--places', type=int, default=5000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6, 9])
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    def config(level):
+        class BenchConfig:
+            SECRET_KEY = 'bench'
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+            REPOSITORY_CACHE = {}
+            COMPRESS_LEVEL = level
+        return BenchConfig
+
+    app = create_app(config(6))
+    with app.app_context():
+        db.create_all()
+        populate(args.places)
+        db.engine.dispose()
+
+    rows = []
+    for accept in ('application/json', 'application/x-ndjson'):
+        app = create_app(config(6))
+        with app.app_context():
+            plain, plain_ms = measure(app, accept, None, args.repeats)
+            db.engine.dispose()
+        rows.append((accept, 'identity', '-', len(plain), len(plain),
+                     plain_ms, 0.0))
+        for level in args.levels:
+            app = create_app(config(level))
+            with app.app_context():
+                for encoding in available_encodings():
+                    body, ms = measure(app, accept, encoding, args.repeats)
+                    rows.append((accept, encoding, level, len(body),
+                                 len(plain), ms,
+                                 compress_cost(plain, encoding, level,
+                                               args.repeats)))
+                db.engine.dispose()
+
+    print(f"\n{args.places} places, GET /api/v1/places/\n")
+    print(f"{'accept':<22}{'encoding':<10}{'level':>6}{'bytes':>12}"
+          f"{'ratio':>8}{'request ms':>12}{'compress ms':>13}")
+    for accept, encoding, level, size, plain_size, ms, compress_ms in rows:
+        print(f"{accept:<22}{encoding:<10}{level:>6}{size:>12}"
+              f"{plain_size / size:>7.1f}x{ms:>12.1f}{compress_ms:>13.1f}")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark login throughput and how the limiter absorbs a flood.
+
+For each bcrypt cost in --rounds, times successful logins through the test
+client, then --attempts wrong-password logins for one email with and
+without LOGIN_RATE_LIMITS, counting the bcrypt checks that actually ran:
+
+    python benchmarks/bench_login.py --rounds 10 12 --attempts 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app, db  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import facade  # noqa: E402
+
+EMAIL = 'bench@example.com'
+
+
+def run(app, count, password):
+    client = app.test_client()
+    checks = []
+    verify = User.verify_password
+
+    def counted(user, candidate):
+        checks.append(1)
+        return verify(user, candidate)
+
+    codes = {}
+    with mock.patch.object(User, 'verify_password', counted):
+        start = time.perf_counter()
+        for _ in range(count):
+            code = client.post('/api/v1/auth/login', json={
+                'email': EMAIL, 'password': password}).status_code
+            codes[code] = codes.get(code, 0) + 1
+        elapsed = time.perf_counter() - start
+    return count / elapsed, len(checks), codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 12])
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--attempts', type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    rows = []
+    for rounds in args.rounds:
+        for limits in ({}, {'email': (5, 60), 'ip': (20, 60)}):
+            class BenchConfig:
+                SECRET_KEY = 'bench'
+                SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+                REPOSITORY_CACHE = {}
+                BCRYPT_LOG_ROUNDS = rounds
+                LOGIN_RATE_LIMITS = limits
+
+            app = create_app(BenchConfig)
+            with app.app_context():
+                db.drop_all()
+                db.create_all()
+                facade.create_user({'first_name': 'B', 'last_name': 'User',
+                                    'email': EMAIL, 'password': 'secret'})
+                label = 'limited' if limits else 'unlimited'
+                if not limits:
+                    rows.append((rounds, 'valid logins', label,
+                                 args.logins, *run(app, args.logins,
+                                                   'secret')))
+                rows.append((rounds, 'wrong-password flood', label,
+                             args.attempts, *run(app, args.attempts,
+                                                 'guess')))
+                db.engine.dispose()
+
+    print(f"\n{'cost':>4}  {'scenario':<22}{'limits':<11}{'requests':>9}"
+          f"{'req/s':>10}{'bcrypt':>8}  status codes")
+    for rounds, scenario, label, count, rate, checks, codes in rows:
+        print(f"{rounds:>4}  {scenario:<22}{label:<11}{count:>9}"
+              f"{rate:>10.1f}{checks:>8}  {codes}")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
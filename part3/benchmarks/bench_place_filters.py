@@ -0,0 +1,139 @@
+"""Benchmark filtered and sorted place listings before and after indexing.
+
+Builds a throw-away SQLite database with --places rows (and a few amenities
+per place), times PlaceRepository.search for common filter combinations
+without the price and rating indexes, applies the migrations and times
+them again:
+
+    python benchmarks/bench_place_filters.py --places 500000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.persistence.migrations import upgrade, _set_version  # noqa: E402
+from app.services.place_repository import PlaceRepository  # noqa: E402
+
+FILTER_INDEXES = ['ix_places_price_id', 'ix_places_rating_id']
+AMENITIES = 20
+AMENITIES_PER_PLACE = 3
+
+
+def populate(places):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    owner = str(uuid.uuid4())
+    db.session.execute(text(
+        "INSERT INTO users (id, first_name, last_name, email, password, "
+        "is_admin, created_at, updated_at) VALUES (:id, 'B', 'Owner', "
+        "'owner@bench.io', 'x', 0, :now, :now)"), {'id': owner, 'now': now})
+    amenity_ids = [str(uuid.uuid4()) for _ in range(AMENITIES)]
+    db.session.execute(text(
+        "INSERT INTO amenities (id, name, created_at, updated_at) "
+        "VALUES (:id, :name, :now, :now)"),
+        [{'id': a, 'name': f'Amenity {i}', 'now': now}
+         for i, a in enumerate(amenity_ids)])
+
+    batch, links = [], []
+    for i in range(places):
+        place_id = str(uuid.uuid4())
+        reviews = rng.randint(0, 20)
+        batch.append({'id': place_id, 'price': round(rng.uniform(10, 1000), 2),
+                      'owner': owner, 'reviews': reviews,
+                      'sum': sum(rng.randint(1, 5) for _ in range(reviews)),
+                      'at': now + timedelta(seconds=i)})
+        links.extend({'place': place_id, 'amenity': a}
+                     for a in rng.sample(amenity_ids, AMENITIES_PER_PLACE))
+        if len(batch) == 50000 or i == places - 1:
+            db.session.execute(text(
+                "INSERT INTO places (id, title, price, latitude, longitude, "
+                "owner_id, review_count, rating_sum, created_at, updated_at) "
+                "VALUES (:id, 'Bench', :price, 0, 0, :owner, :reviews, :sum, "
+                ":at, :at)"), batch)
+            db.session.execute(text(
+                "INSERT INTO place_amenity (place_id, amenity_id) "
+                "VALUES (:place, :amenity)"), links)
+            batch, links = [], []
+    db.session.commit()
+    return amenity_ids
+
+
+def time_searches(amenity_ids, repeats):
+    places = PlaceRepository()
+    cases = {
+        'price 100-150, sort price': dict(min_price=100, max_price=150,
+                                          sort='price'),
+        'sort -price': dict(sort='-price'),
+        'min_rating 4.5, sort -rating': dict(min_rating=4.5, sort='-rating'),
+        '2 amenities, sort price': dict(amenity_ids=amenity_ids[:2],
+                                        sort='price'),
+        'price <= 200 + rating >= 4': dict(max_price=200, min_rating=4),
+    }
+    results = {}
+    for name, filters in cases.items():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            page = places.search(limit=20, **filters)
+            # Second page through the keyset cursor
+            last = page[-1]
+            places.search(limit=20, after=(
+                places.sort_value(last, filters.get('sort', 'created_at')),
+                last.id), **filters)
+        results[name] = (time.perf_counter() - start) / repeats * 1000
+        db.session.expunge_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--places', type=int, default=500_000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    class BenchConfig:
+        SECRET_KEY = 'bench'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        REPOSITORY_CACHE = {}
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as conn:
+            for name in FILTER_INDEXES:
+                conn.execute(text(f"DROP INDEX {name}"))
+            _set_version(conn, 4)
+
+        start = time.perf_counter()
+        amenity_ids = populate(args.places)
+        print(f"Inserted {args.places} places in "
+              f"{time.perf_counter() - start:.1f}s")
+        db.session.execute(text("ANALYZE"))
+
+        before = time_searches(amenity_ids, args.repeats)
+        start = time.perf_counter()
+        upgrade(log=lambda message: None)
+        db.session.execute(text("ANALYZE"))
+        print(f"Migration built indexes in {time.perf_counter() - start:.1f}s")
+        after = time_searches(amenity_ids, args.repeats)
+
+    print(f"\n{'two pages of 20':<32}{'before ms':>12}{'after ms':>12}"
+          f"{'speedup':>10}")
+    for name in before:
+        print(f"{name:<32}{before[name]:>12.2f}{after[name]:>12.2f}"
+              f"{before[name] / after[name]:>9.1f}x")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark foreign-key lookups before and after the index migration.
+
+Builds a throw-away SQLite database with --reviews rows, times the
+repository lookups without the lookup indexes, applies the migrations and
+times them again:
+
+    python benchmarks/bench_review_indexes.py --reviews 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.persistence.migrations import upgrade, HEAD, _set_version  # noqa: E402
+from app.services.place_repository import PlaceRepository  # noqa: E402
+from app.services.review_repository import ReviewRepository  # noqa: E402
+
+LOOKUP_INDEXES = ['ix_reviews_place_id', 'unique_user_place_review',
+                  'ix_places_owner_id', 'ix_place_amenity_amenity_id']
+
+
+def populate(reviews):
+    users = max(reviews // 50, 1)
+    places = max(reviews // 20, 1)
+    now = datetime.utcnow()
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    place_ids = [str(uuid.uuid4()) for _ in range(places)]
+    db.session.execute(text(
+        "INSERT INTO users (id, first_name, last_name, email, password, "
+        "is_admin, created_at, updated_at) VALUES (:id, 'B', 'User', "
+        ":email, 'x', 0, :now, :now)"),
+        [{'id': u, 'email': f'{u}@bench.io', 'now': now} for u in user_ids])
+    db.session.execute(text(
+        "INSERT INTO places (id, title, price, latitude, longitude, "
+        "owner_id, created_at, updated_at) VALUES (:id, 'Bench', 10, 0, 0, "
+        ":owner, :now, :now)"),
+        [{'id': p, 'owner': user_ids[i % users], 'now': now}
+         for i, p in enumerate(place_ids)])
+    batch = []
+    for r in range(reviews):
+        user = r % users
+        # Consecutive places per user keep (user_id, place_id) unique
+        place = (user + r // users) % places
+        batch.append({'id': str(uuid.uuid4()), 'user': user_ids[user],
+                      'place': place_ids[place], 'now': now})
+        if len(batch) == 50000 or r == reviews - 1:
+            db.session.execute(text(
+                "INSERT INTO reviews (id, text, rating, user_id, place_id, "
+                "created_at, updated_at) VALUES (:id, 'ok', 4, :user, "
+                ":place, :now, :now)"), batch)
+            batch = []
+    db.session.commit()
+    return user_ids, place_ids
+
+
+def time_lookups(user_ids, place_ids, lookups):
+    reviews = ReviewRepository()
+    places = PlaceRepository()
+    rng = random.Random(42)
+    sample = [(rng.choice(user_ids), rng.choice(place_ids))
+              for _ in range(lookups)]
+    cases = {
+        'get_reviews_by_place': lambda u, p: reviews.get_reviews_by_place(p),
+        'get_reviews_by_user': lambda u, p: reviews.get_reviews_by_user(u),
+        'get_places_by_owner': lambda u, p: places.get_places_by_owner(u),
+        'duplicate review check': lambda u, p: reviews.model.query.filter_by(
+            user_id=u, place_id=p).first(),
+    }
+    results = {}
+    for name, lookup in cases.items():
+        start = time.perf_counter()
+        for user_id, place_id in sample:
+            lookup(user_id, place_id)
+        results[name] = (time.perf_counter() - start) / lookups * 1000
+        db.session.expunge_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    class BenchConfig:
+        SECRET_KEY = 'bench'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        REPOSITORY_CACHE = {}
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as conn:
+            for name in LOOKUP_INDEXES:
+                conn.execute(text(f"DROP INDEX {name}"))
+            _set_version(conn, HEAD - 1)
+
+        start = time.perf_counter()
+        user_ids, place_ids = populate(args.reviews)
+        print(f"Inserted {args.reviews} reviews in "
+              f"{time.perf_counter() - start:.1f}s")
+
+        before = time_lookups(user_ids, place_ids, args.lookups)
+        start = time.perf_counter()
+        upgrade(log=lambda message: None)
+        print(f"Migration built indexes in {time.perf_counter() - start:.1f}s")
+        after = time_lookups(user_ids, place_ids, args.lookups)
+
+    print(f"\n{'lookup':<26}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<26}{before[name]:>12.3f}{after[name]:>12.3f}"
+              f"{before[name] / after[name]:>9.0f}x")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
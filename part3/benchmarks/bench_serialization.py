@@ -0,0 +1,146 @@
+"""Benchmark JSON encoding of place lists: per-endpoint dicts vs serializers.
+
+Loads --places rows (with their owner and amenities) from a throw-away
+SQLite database once, then times only the encoding of the list, as the
+summary and with ?embed=owner,amenities:
+
+* dicts + json: the previous path, a dict built field by field for every
+  place, then the whole list encoded by the stdlib json module
+* serializer + json: compiled Serializer views, stdlib encoder
+* serializer + orjson: the same views, encoded by orjson (when installed)
+
+    python benchmarks/bench_serialization.py --places 10000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.orm import joinedload, selectinload  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.api.v1 import serializers  # noqa: E402
+from app.api.v1.places import SUMMARY_FIELDS  # noqa: E402
+from app.models.place import Place  # noqa: E402
+
+
+def project(obj, fields):
+    data = {'id': obj.id}
+    for name in fields:
+        data[name] = getattr(obj, name)
+    return data
+
+
+def legacy_representation(place, fields, embed):
+    data = project(place, fields)
+    if 'owner' in embed:
+        owner = place.owner
+        data['owner'] = owner and {
+            'id': owner.id,
+            'first_name': owner.first_name,
+            'last_name': owner.last_name,
+            'email': owner.email
+        }
+    if 'amenities' in embed:
+        data['amenities'] = [{'id': a.id, 'name': a.name}
+                             for a in place.amenities]
+    return data
+
+
+def populate(places):
+    now = datetime.utcnow()
+    owner = str(uuid.uuid4())
+    db.session.execute(text(
+        "INSERT INTO users (id, first_name, last_name, email, password, "
+        "is_admin, created_at, updated_at) VALUES (:id, 'B', 'Owner', "
+        "'owner@bench.io', 'x', 0, :now, :now)"), {'id': owner, 'now': now})
+    amenity_ids = [str(uuid.uuid4()) for _ in range(3)]
+    db.session.execute(text(
+        "INSERT INTO amenities (id, name, created_at, updated_at) "
+        "VALUES (:id, :name, :now, :now)"),
+        [{'id': a, 'name': f'Amenity {i}', 'now': now}
+         for i, a in enumerate(amenity_ids)])
+    place_ids = [str(uuid.uuid4()) for _ in range(places)]
+    db.session.execute(text(
+        "INSERT INTO places (id, title, description, price, latitude, "
+        "longitude, owner_id, review_count, rating_sum, created_at, "
+        "updated_at) VALUES (:id, :title, 'A bench place', :price, 1.5, "
+        "2.5, :owner, 4, 15, :now, :now)"),
+        [{'id': p, 'title': f'Place {i}', 'price': 10.0 + i % 500,
+          'owner': owner, 'now': now} for i, p in enumerate(place_ids)])
+    db.session.execute(text(
+        "INSERT INTO place_amenity (place_id, amenity_id) "
+        "VALUES (:place, :amenity)"),
+        [{'place': p, 'amenity': a} for p in place_ids for a in amenity_ids])
+    db.session.commit()
+
+
+def best_of(repeats, encode):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        size = len(encode())
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--places', type=int, default=10_000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    class BenchConfig:
+        SECRET_KEY = 'bench'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        REPOSITORY_CACHE = {}
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        populate(args.places)
+        places = db.session.query(Place).options(
+            joinedload(Place.owner), selectinload(Place.amenities)).all()
+
+        shapes = {'summary': (SUMMARY_FIELDS, ()),
+                  'embed=owner,amenities': (SUMMARY_FIELDS,
+                                            ('owner', 'amenities'))}
+        print(f"\n{'encode ' + str(len(places)) + ' places':<24}"
+              f"{'path':<22}{'ms':>9}{'bytes':>11}{'speedup':>9}")
+        for shape, (fields, embed) in shapes.items():
+            represent = serializers.PLACE.only(fields, embed)
+            runs = {
+                'dicts + json': lambda: json.dumps([
+                    legacy_representation(p, fields, embed)
+                    for p in places]),
+            }
+
+            def stdlib():
+                with mock.patch.object(serializers, 'orjson', None):
+                    return serializers.dumps(places, represent)
+            runs['serializer + json'] = stdlib
+            if serializers.orjson is not None:
+                runs['serializer + orjson'] = lambda: serializers.dumps(
+                    places, represent)
+
+            baseline = None
+            for name, encode in runs.items():
+                ms, size = best_of(args.repeats, encode)
+                baseline = baseline or ms
+                print(f"{shape:<24}{name:<22}{ms:>9.1f}{size:>11}"
+                      f"{baseline / ms:>8.1f}x")
+        db.engine.dispose()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
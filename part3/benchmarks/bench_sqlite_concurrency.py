@@ -0,0 +1,127 @@
+"""Benchmark reads sustained during concurrent writes on SQLite.
+
+Runs reader and writer threads against a file database, once with the
+default rollback journal and no retries, once with SQLITE_WAL_PRAGMAS and
+lock retries, and reports throughput and lock errors for each mode:
+
+    python benchmarks/bench_sqlite_concurrency.py --readers 4 --writers 2
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.services import facade  # noqa: E402
+from config import SQLITE_WAL_PRAGMAS  # noqa: E402
+
+MODES = {
+    'rollback journal, no retry': {'SQLITE_PRAGMAS': {'busy_timeout': 100},
+                                   'DB_WRITE_RETRIES': 0},
+    'WAL + pragmas, retry': {'SQLITE_PRAGMAS': SQLITE_WAL_PRAGMAS,
+                             'DB_WRITE_RETRIES': 5},
+}
+
+
+def seed(places):
+    owner = facade.create_user({'first_name': 'Bench', 'last_name': 'Owner',
+                                'email': 'owner@bench.io',
+                                'password': 'bench'})
+    return [facade.create_place({'title': f'Place {i}', 'price': 10.0,
+                                 'latitude': 0.0, 'longitude': 0.0,
+                                 'owner_id': owner.id}).id
+            for i in range(places)]
+
+
+def run_mode(settings, args):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    class BenchConfig:
+        SECRET_KEY = 'bench'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': args.readers + args.writers}
+        REPOSITORY_CACHE = {}
+        BCRYPT_LOG_ROUNDS = 4
+        DB_WRITE_BACKOFF = 0.01
+
+    for key, value in settings.items():
+        setattr(BenchConfig, key, value)
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        place_ids = seed(args.places)
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'read errors': 0, 'write errors': 0}
+    lock = threading.Lock()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def reader():
+        rng = random.Random()
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    facade.get_places_page(20)
+                    facade.get_place(rng.choice(place_ids))
+                    count('reads')
+                except OperationalError:
+                    db.session.rollback()
+                    count('read errors')
+                db.session.remove()
+
+    def writer():
+        rng = random.Random()
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    facade.update_place(rng.choice(place_ids),
+                                        {'price': rng.uniform(1, 500)})
+                    count('writes')
+                except OperationalError:
+                    db.session.rollback()
+                    count('write errors')
+                db.session.remove()
+
+    threads = ([threading.Thread(target=reader) for _ in range(args.readers)]
+               + [threading.Thread(target=writer)
+                  for _ in range(args.writers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    with app.app_context():
+        db.engine.dispose()
+    return {key: value / args.seconds if key in ('reads', 'writes') else value
+            for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--places', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<30}{'reads/s':>10}{'writes/s':>10}"
+          f"{'read err':>10}{'write err':>10}")
+    for name, settings in MODES.items():
+        result = run_mode(settings, args)
+        print(f"{name:<30}{result['reads']:>10.0f}{result['writes']:>10.0f}"
+              f"{result['read errors']:>10}{result['write errors']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,63 @@
 import os
 
+# Opt-in SQLite tuning: WAL lets readers run while a write is in progress
+# and busy_timeout makes writers wait for the lock instead of failing
+SQLITE_WAL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'busy_timeout': 5000,
+}
+
+# Opt-in read-through cache in front of repository.get(), per model name.
+# Writes invalidate it in their own process only, so other processes may
+# serve stale rows for up to `ttl` seconds: single-process deployments only
+REPOSITORY_CACHE_SETTINGS = {
+    'User': {'maxsize': 4096, 'ttl': 60},
+    'Place': {'maxsize': 4096, 'ttl': 60},
+    'Amenity': {'maxsize': 256, 'ttl': 300},
+}
+
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'default_secret_key')
     DEBUG = False
+    # bcrypt cost factor; hashes made with another cost are redone at login
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', '12'))
+    # Login attempts allowed per (attempts, seconds), per email and, with
+    # LOGIN_IP_LIMIT set, per client address. Behind a reverse proxy every
+    # client has the proxy's address unless PROXY_FIX_X_FOR is set too
+    LOGIN_RATE_LIMITS = dict({'email': (5, 60)}, **(
+        {'ip': (20, 60)} if os.getenv('LOGIN_IP_LIMIT') else {}))
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted
+    # for the client address (0: use the peer address)
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', '0'))
+    # bcrypt on a pool of this many 'thread' or 'process' workers (0: in
+    # the request thread); past PASSWORD_QUEUE_LIMIT waiting calls -> 503
+    PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', '0'))
+    PASSWORD_POOL = os.getenv('PASSWORD_POOL', 'thread')
+    PASSWORD_QUEUE_LIMIT = int(os.getenv('PASSWORD_QUEUE_LIMIT', '16'))
+    # PRAGMA name -> value, applied to every new SQLite connection
+    SQLITE_PRAGMAS = SQLITE_WAL_PRAGMAS if os.getenv('SQLITE_TUNING') else {}
+    # Facade writes failing on a lock error are replayed with backoff
+    DB_WRITE_RETRIES = 3
+    DB_WRITE_BACKOFF = 0.05
+    # Serialize writes within one process (useful with SQLite)
+    DB_SERIALIZE_WRITES = False
+    # Model name -> cache settings; see REPOSITORY_CACHE_SETTINGS
+    REPOSITORY_CACHE = (REPOSITORY_CACHE_SETTINGS
+                        if os.getenv('REPOSITORY_CACHE') else {})
+    # Rows per commit for the /bulk import endpoints
+    BULK_CHUNK_SIZE = 500
+    # Response compression (br only when the brotli package is installed)
+    COMPRESS_ENABLED = True
+    COMPRESS_ALGORITHMS = ('br', 'gzip', 'deflate')
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson',
+                          'text/html', 'text/plain', 'text/css',
+                          'application/javascript')
 
 
 class DevelopmentConfig(Config):
@@ -12,7 +66,31 @@ class DevelopmentConfig(Config):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 
+class ProductionConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Per-process pool: keep workers * (pool_size + max_overflow) below the
+    # database's connection limit
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    }
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    BCRYPT_LOG_ROUNDS = 4
+    REPOSITORY_CACHE = {}
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+
 config = {
     'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
@@ -1,9 +1,11 @@
+import os
 from app import create_app, db
 
-app = create_app()
-
-with app.app_context():
-    db.create_all()
+app = create_app(os.getenv('HBNB_CONFIG', 'config.DevelopmentConfig'))
 
 if __name__ == '__main__':
+    # Development server only: under gunicorn every worker imports this
+    # module, so schema changes are left to `flask db-upgrade`
+    with app.app_context():
+        db.create_all()
     app.run(debug=True)
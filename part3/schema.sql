@@ -14,10 +14,37 @@ CREATE TABLE places (
     price DECIMAL(10, 2) NOT NULL,
     latitude FLOAT NOT NULL,
     longitude FLOAT NOT NULL,
+    geohash VARCHAR(12),
+    review_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_1_count INT NOT NULL DEFAULT 0,
+    rating_2_count INT NOT NULL DEFAULT 0,
+    rating_3_count INT NOT NULL DEFAULT 0,
+    rating_4_count INT NOT NULL DEFAULT 0,
+    rating_5_count INT NOT NULL DEFAULT 0,
     owner_id CHAR(36) NOT NULL,
     FOREIGN KEY (owner_id) REFERENCES users(id)
 );
 
+CREATE INDEX ix_places_geohash ON places (geohash);
+CREATE INDEX ix_places_owner_id ON places (owner_id);
+CREATE INDEX ix_places_price_id ON places (price, id);
+CREATE INDEX ix_places_rating_id ON places (
+    CASE WHEN (review_count > 0)
+         THEN (rating_sum * 1.0) / (review_count + 0.0) ELSE 0.0 END, id);
+
+-- Full-text index of place titles and descriptions, kept in sync by the ORM.
+-- Its rows are keyed by rowid; places_fts_ids maps each one to its place
+CREATE VIRTUAL TABLE places_fts USING fts5(
+    title, description,
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TABLE places_fts_ids (
+    doc INTEGER PRIMARY KEY,
+    row_id VARCHAR(36) NOT NULL UNIQUE
+);
+
 CREATE TABLE reviews (
     id CHAR(36) PRIMARY KEY,
     text TEXT NOT NULL,
@@ -30,6 +57,9 @@ CREATE TABLE reviews (
     CONSTRAINT unique_user_place_review UNIQUE (user_id, place_id)
 );
 
+-- user_id lookups are served by the unique (user_id, place_id) index
+CREATE INDEX ix_reviews_place_id ON reviews (place_id);
+
 CREATE TABLE amenities (
     id CHAR(36) PRIMARY KEY,
     name VARCHAR(255) NOT NULL UNIQUE
@@ -41,4 +71,15 @@ CREATE TABLE place_amenity (
     PRIMARY KEY (place_id, amenity_id),
     FOREIGN KEY (place_id) REFERENCES places(id),
     FOREIGN KEY (amenity_id) REFERENCES amenities(id)
-);
\ No newline at end of file
+);
+
+CREATE INDEX ix_place_amenity_amenity_id ON place_amenity (amenity_id);
+
+-- One version counter per table, bumped by every write, for list ETags
+CREATE TABLE collection_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0
+);
+
+INSERT INTO collection_versions (name, version) VALUES
+    ('users', 0), ('amenities', 0), ('places', 0), ('reviews', 0);
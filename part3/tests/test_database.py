@@ -0,0 +1,1711 @@
+import gzip
+import json
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+import zlib
+from unittest import mock
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import load_only
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.schema import CreateIndex
+from flask_jwt_extended import create_access_token
+from app import create_app, db, bcrypt
+from config import ProductionConfig, TestingConfig, SQLITE_WAL_PRAGMAS
+from app.api.v1 import serializers
+from app.api.v1.serializers import AMENITY, PLACE, USER, Serializer
+from app.api.v1.throttling import TokenBucketLimiter, init_login_throttle
+from app.models.amenity import Amenity
+from app.passwords import passwords, PasswordServiceBusy
+from app.persistence.geo import geohash_encode, haversine_km
+from app.persistence.migrations import (upgrade, LOOKUP_INDEXES,
+                                        SORT_INDEXES, UPDATED_AT_INDEXES)
+from app.persistence.repository import InMemoryRepository
+from app.persistence.search import InvertedIndex, SearchUnavailableError
+from app.models.place import Place, PLACE_SEARCH_WEIGHTS
+from app.models.user import User
+from app.persistence.transactions import configure_writes
+from app.services.user_repository import UserRepository
+from app.services.place_repository import PlaceRepository
+from app.services.review_repository import ReviewRepository
+from app.services.amenity_repository import AmenityRepository
+
+
+def reset_facade():
+    """Point the shared facade at fresh SQLAlchemy repositories."""
+    from app.services import facade
+    facade.user_repo = UserRepository()
+    facade.amenity_repo = AmenityRepository()
+    facade.place_repo = PlaceRepository()
+    facade.review_repo = ReviewRepository()
+    return facade
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs each test against a fresh in-memory SQLite database."""
+
+    def setUp(self):
+        self.app = create_app("config.TestingConfig")
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.facade = reset_facade()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def make_user(self, email='owner@example.com', is_admin=False):
+        return self.facade.create_user({
+            'first_name': 'Test', 'last_name': 'User',
+            'email': email, 'password': 'secret', 'is_admin': is_admin
+        })
+
+    def auth_header(self, user):
+        token = create_access_token(identity=user.id,
+                                    additional_claims={'is_admin':
+                                                       user.is_admin})
+        return {'Authorization': f'Bearer {token}'}
+
+    @contextmanager
+    def count_queries(self, skip_versions=False):
+        """Collect the SQL statements executed inside the block, optionally
+        leaving out the collection version lookups behind list ETags."""
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            if not (skip_versions and 'collection_versions' in statement):
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_execute)
+
+    def make_place(self, owner, title='Place', price=100.0, **extra):
+        data = {'title': title, 'price': price, 'latitude': 10.0,
+                'longitude': 20.0, 'owner_id': owner.id}
+        data.update(extra)
+        return self.facade.create_place(data)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Keyset pagination
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestPlacePagination(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        owner = self.make_user()
+        base = datetime(2024, 1, 1)
+        self.places = []
+        for i in range(5):
+            place = self.make_place(owner, title=f'Place {i}')
+            # Two places share a timestamp so the id tie-breaker is exercised
+            place.created_at = base + timedelta(minutes=min(i, 3))
+            self.places.append(place)
+        db.session.commit()
+
+    def expected_order(self):
+        return [p.id for p in sorted(self.places,
+                                     key=lambda p: (p.created_at, p.id))]
+
+    def test_pages_cover_catalog_once_in_order(self):
+        seen = []
+        cursor = None
+        while True:
+            res = self.client.get('/api/v1/places/',
+                                  query_string={'limit': 2,
+                                                'cursor': cursor or ''})
+            self.assertEqual(res.status_code, 200)
+            body = res.get_json()
+            seen.extend(p['id'] for p in body['items'])
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected_order())
+
+    def test_insert_after_cursor_is_not_skipped(self):
+        body = self.client.get('/api/v1/places/?limit=3').get_json()
+        late = self.make_place(self.places[0].owner, title='Late')
+        rest = self.client.get('/api/v1/places/',
+                               query_string={'limit': 10,
+                                             'cursor': body['next_cursor']})
+        ids = [p['id'] for p in rest.get_json()['items']]
+        self.assertEqual(ids[-1], late.id)
+        self.assertFalse(set(ids) & {p['id'] for p in body['items']})
+
+    def test_invalid_cursor(self):
+        res = self.client.get('/api/v1/places/?cursor=not-a-cursor')
+        self.assertEqual(res.status_code, 400)
+
+    def test_limit_out_of_range(self):
+        res = self.client.get('/api/v1/places/?limit=0')
+        self.assertEqual(res.status_code, 400)
+
+    def test_unpaginated_list_unchanged(self):
+        res = self.client.get('/api/v1/places/')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.get_json()), 5)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Place detail query plan
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestPlaceDetailQueries(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        owner = self.make_user()
+        amenity = self.facade.create_amenity({'name': 'Wi-Fi'})
+        self.place_id = self.make_place(owner, amenities=[amenity.id]).id
+
+    def add_reviews(self, count, start=0):
+        for i in range(start, start + count):
+            reviewer = self.make_user(f'reviewer{i}@example.com')
+            self.facade.create_review({'text': 'Nice', 'rating': 4,
+                                       'user_id': reviewer.id,
+                                       'place_id': self.place_id})
+
+    def get_detail(self):
+        db.session.expunge_all()
+        with self.count_queries() as statements:
+            res = self.client.get(f'/api/v1/places/{self.place_id}')
+        self.assertEqual(res.status_code, 200)
+        return res.get_json(), len(statements)
+
+    def test_query_count_independent_of_reviews(self):
+        self.add_reviews(1)
+        body, few = self.get_detail()
+        self.assertEqual(len(body['reviews']), 1)
+
+        self.add_reviews(20, start=1)
+        body, many = self.get_detail()
+        self.assertEqual(len(body['reviews']), 21)
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, 3)
+
+    def test_detail_payload(self):
+        self.add_reviews(1)
+        body, _ = self.get_detail()
+        self.assertEqual(body['owner']['email'], 'owner@example.com')
+        self.assertEqual(body['amenities'][0]['name'], 'Wi-Fi')
+        self.assertEqual(body['reviews'][0]['user_name'], 'Test User')
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Geo search
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestPlaceGeoSearch(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        owner = self.make_user()
+        coords = {
+            'Louvre': (48.8606, 2.3376),
+            'Eiffel': (48.8584, 2.2945),
+            'Versailles': (48.8049, 2.1204),
+            'London': (51.5072, -0.1276),
+            'Fiji': (-17.7134, 178.0650),
+            'Samoa': (-13.7590, -172.1046),
+        }
+        self.ids = {}
+        for title, (lat, lng) in coords.items():
+            place = self.make_place(owner, title=title,
+                                    latitude=lat, longitude=lng)
+            self.ids[place.id] = title
+
+    def titles(self, res):
+        self.assertEqual(res.status_code, 200)
+        return [self.ids[p['id']] for p in res.get_json()]
+
+    def test_geohash_follows_coordinates(self):
+        place = self.facade.get_all_places()[0]
+        before = place.geohash
+        self.facade.update_place(place.id, {'latitude': -45.0})
+        self.assertNotEqual(place.geohash, before)
+        self.assertEqual(len(place.geohash), 9)
+
+    def test_bbox(self):
+        res = self.client.get('/api/v1/places/?bbox=48.8,2.2,48.9,2.4')
+        self.assertEqual(sorted(self.titles(res)), ['Eiffel', 'Louvre'])
+
+    def test_bbox_across_antimeridian(self):
+        res = self.client.get('/api/v1/places/?bbox=-20,170,-10,-170')
+        self.assertEqual(sorted(self.titles(res)), ['Fiji', 'Samoa'])
+
+    def test_near_sorted_by_distance(self):
+        res = self.client.get(
+            '/api/v1/places/?near=48.8606,2.3376&radius_km=25')
+        self.assertEqual(self.titles(res), ['Louvre', 'Eiffel', 'Versailles'])
+        self.assertEqual(res.get_json()[0]['distance_km'], 0)
+
+    def test_near_excludes_outside_radius(self):
+        res = self.client.get('/api/v1/places/?near=48.8606,2.3376&radius_km=4')
+        self.assertEqual(self.titles(res), ['Louvre', 'Eiffel'])
+
+    def test_geo_pages_follow_cursors(self):
+        def walk(query):
+            titles, cursor = [], ''
+            while cursor is not None:
+                res = self.client.get(f'/api/v1/places/?{query}&limit=1'
+                                      + (f'&cursor={cursor}' if cursor else ''))
+                page = res.get_json()
+                self.assertLessEqual(len(page['items']), 1)
+                titles += [self.ids[p['id']] for p in page['items']]
+                cursor = page['next_cursor']
+            return titles
+
+        self.assertEqual(walk('near=48.8606,2.3376&radius_km=25'),
+                         ['Louvre', 'Eiffel', 'Versailles'])
+        # Oldest first, in creation order
+        self.assertEqual(walk('bbox=-90,-180,90,180'), list(self.ids.values()))
+        near = self.client.get('/api/v1/places/?near=-17,179&radius_km=500')
+        self.assertEqual(self.titles(near), ['Fiji'])
+        self.assertAlmostEqual(near.get_json()[0]['distance_km'],
+                               haversine_km(-17, 179, -17.7134, 178.0650),
+                               places=3)
+
+    def test_invalid_geo_parameters(self):
+        for query in ('bbox=1,2,3', 'bbox=50,0,40,10', 'near=48.8,2.3',
+                      'near=abc,2&radius_km=5', 'near=1,2&radius_km=-1',
+                      'near=1,2&radius_km=5&cursor=abc'):
+            res = self.client.get(f'/api/v1/places/?{query}')
+            self.assertEqual(res.status_code, 400, query)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Rating aggregates
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestPlaceRatingAggregates(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        owner = self.make_user()
+        self.place = self.make_place(owner)
+        self.other = self.make_place(owner, title='Other')
+
+    def review(self, rating, place=None, email='r@example.com'):
+        reviewer = self.make_user(email)
+        return self.facade.create_review({
+            'text': 'Text', 'rating': rating, 'user_id': reviewer.id,
+            'place_id': (place or self.place).id
+        })
+
+    def assert_aggregates(self, place, count, total, histogram):
+        self.assertEqual(place.review_count, count)
+        self.assertEqual(place.rating_sum, total)
+        self.assertEqual([place.rating_histogram[str(r)] for r in range(1, 6)],
+                         histogram)
+
+    def test_create_update_delete(self):
+        first = self.review(5, email='a@example.com')
+        self.review(3, email='b@example.com')
+        self.assert_aggregates(self.place, 2, 8, [0, 0, 1, 0, 1])
+        self.assertEqual(self.place.average_rating, 4.0)
+
+        self.facade.update_review(first.id, {'rating': 1})
+        self.assert_aggregates(self.place, 2, 4, [1, 0, 1, 0, 0])
+
+        self.facade.update_review(first.id, {'place_id': self.other.id,
+                                             'rating': 2})
+        self.assert_aggregates(self.place, 1, 3, [0, 0, 1, 0, 0])
+        self.assert_aggregates(self.other, 1, 2, [0, 1, 0, 0, 0])
+
+        self.facade.delete_review(first.id)
+        self.assert_aggregates(self.other, 0, 0, [0, 0, 0, 0, 0])
+        self.assertIsNone(self.other.average_rating)
+
+    def test_rebuild_repairs_drift(self):
+        self.review(4, email='a@example.com')
+        self.review(2, place=self.other, email='b@example.com')
+        self.place.review_count = 99
+        self.other.rating_5_count = 7
+        db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(args=['rebuild-ratings'])
+        self.assertIn('2 places', result.output)
+        self.assert_aggregates(self.place, 1, 4, [0, 0, 0, 1, 0])
+        self.assert_aggregates(self.other, 1, 2, [0, 1, 0, 0, 0])
+
+    def test_place_responses_include_ratings(self):
+        self.review(4)
+        detail = self.client.get(f'/api/v1/places/{self.place.id}').get_json()
+        self.assertEqual(detail['review_count'], 1)
+        self.assertEqual(detail['average_rating'], 4.0)
+        self.assertEqual(detail['rating_histogram']['4'], 1)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Repository cache
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestRepositoryCache(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.facade.configure_cache({'Place': {'maxsize': 2, 'ttl': 60},
+                                     'User': {'maxsize': 8, 'ttl': 60}})
+        self.owner_id = self.make_user().id
+        self.place_id = self.make_place(self.owner()).id
+        db.session.remove()
+
+    def owner(self):
+        return self.facade.get_user(self.owner_id)
+
+    def tearDown(self):
+        self.facade.configure_cache({})
+        super().tearDown()
+
+    def fresh_get(self, place_id):
+        db.session.remove()
+        with self.count_queries() as statements:
+            place = self.facade.get_place(place_id)
+        return place, len(statements)
+
+    def test_hit_skips_database(self):
+        _, first = self.fresh_get(self.place_id)
+        place, second = self.fresh_get(self.place_id)
+        self.assertGreater(first, 0)
+        self.assertEqual(second, 0)
+        self.assertEqual(place.title, 'Place')
+        # Re-attached instances still lazy-load relationships
+        self.assertEqual(place.owner.email, 'owner@example.com')
+        self.assertEqual(self.facade.place_repo.stats['hits'], 1)
+
+    def test_update_invalidates(self):
+        self.fresh_get(self.place_id)
+        self.facade.update_place(self.place_id, {'title': 'Renamed'})
+        place, _ = self.fresh_get(self.place_id)
+        self.assertEqual(place.title, 'Renamed')
+
+    def test_review_write_invalidates_place(self):
+        self.fresh_get(self.place_id)
+        reviewer = self.make_user('r@example.com')
+        self.facade.create_review({'text': 'Good', 'rating': 5,
+                                   'user_id': reviewer.id,
+                                   'place_id': self.place_id})
+        place, _ = self.fresh_get(self.place_id)
+        self.assertEqual(place.review_count, 1)
+
+    def test_bulk_update_clears_model(self):
+        self.fresh_get(self.place_id)
+        db.session.execute(db.update(self.facade.place_repo.model)
+                           .values(title='Bulk'))
+        db.session.commit()
+        place, queries = self.fresh_get(self.place_id)
+        self.assertEqual(place.title, 'Bulk')
+        self.assertGreater(queries, 0)
+
+    def test_lru_bound_and_ttl(self):
+        other = [self.make_place(self.owner(), title=f'P{i}').id
+                 for i in range(2)]
+        for place_id in [self.place_id] + other:
+            self.fresh_get(place_id)
+        self.assertEqual(self.facade.place_repo.stats['size'], 2)
+        _, queries = self.fresh_get(self.place_id)
+        self.assertGreater(queries, 0)
+
+        self.facade.place_repo.cache.ttl = 0
+        self.fresh_get(other[0])
+        _, queries = self.fresh_get(other[0])
+        self.assertGreater(queries, 0)
+
+    def test_uncached_models_untouched(self):
+        self.assertNotIn('Review', self.facade.cache_stats())
+        self.assertIn('Place', self.facade.cache_stats())
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Bulk imports
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestBulkImport(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['BULK_CHUNK_SIZE'] = 2
+        self.admin = self.make_user('admin@example.com', is_admin=True)
+        self.headers = self.auth_header(self.admin)
+
+    def place_item(self, title, **extra):
+        return dict({'title': title, 'price': 10.0, 'latitude': 1.0,
+                     'longitude': 2.0}, **extra)
+
+    def test_json_array_with_item_errors(self):
+        items = [self.place_item('A'), self.place_item('', price=1),
+                 self.place_item('B'), self.place_item('C', price=-5),
+                 self.place_item('D'), 'not an object']
+        res = self.client.post('/api/v1/places/bulk', json=items,
+                               headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        body = res.get_json()
+        self.assertEqual(body['created'], 3)
+        self.assertEqual([e['index'] for e in body['errors']], [1, 3, 5])
+        titles = sorted(p.title for p in self.facade.get_all_places())
+        self.assertEqual(titles, ['A', 'B', 'D'])
+        self.assertTrue(all(p.owner_id == self.admin.id
+                            for p in self.facade.get_all_places()))
+
+    def test_ndjson_stream(self):
+        lines = ['{"name": "Wi-Fi"}', '', '{broken', '{"name": "Pool"}',
+                 '{"name": "%s"}' % ('x' * 51)]
+        res = self.client.post('/api/v1/amenities/bulk',
+                               data='\n'.join(lines),
+                               content_type='application/x-ndjson',
+                               headers=self.headers)
+        body = res.get_json()
+        self.assertEqual(body['created'], 2)
+        self.assertEqual([e['index'] for e in body['errors']], [1, 3])
+
+    def test_missing_field_reported_by_name(self):
+        res = self.client.post('/api/v1/amenities/bulk',
+                               json=[{'title': 'Wi-Fi'}],
+                               headers=self.headers)
+        self.assertEqual(res.get_json()['errors'],
+                         [{'index': 0, 'error': 'Missing field: name'}])
+
+    def test_database_errors_isolated_within_chunk(self):
+        amenity = self.facade.create_amenity({'name': 'Taken'})
+        repo = self.facade.amenity_repo
+        items = [(0, Amenity(name='Fresh')), (1, Amenity(name='Dup')),
+                 (2, Amenity(name='Also fresh'))]
+        items[1][1].id = amenity.id
+        created, errors = repo.bulk_add(items, chunk_size=3)
+        self.assertEqual(created, 2)
+        self.assertEqual([index for index, _ in errors], [1])
+        self.assertEqual(len(self.facade.get_all_amenities()), 3)
+
+    def test_reviews_update_aggregates(self):
+        owner = self.make_user()
+        place = self.make_place(owner)
+        users = [self.make_user(f'u{i}@example.com') for i in range(3)]
+        items = [{'text': 'ok', 'rating': 4, 'user_id': u.id,
+                  'place_id': place.id} for u in users]
+        items.append({'text': 'mine', 'rating': 5, 'user_id': owner.id,
+                      'place_id': place.id})
+        res = self.client.post('/api/v1/reviews/bulk', json=items,
+                               headers=self.headers)
+        body = res.get_json()
+        self.assertEqual(body['created'], 3)
+        self.assertEqual(body['errors'][0]['index'], 3)
+        db.session.refresh(place)
+        self.assertEqual((place.review_count, place.rating_sum), (3, 12))
+
+    def test_admin_only(self):
+        user = self.make_user('plain@example.com')
+        for path in ('/api/v1/places/bulk', '/api/v1/amenities/bulk',
+                     '/api/v1/reviews/bulk'):
+            res = self.client.post(path, json=[],
+                                   headers=self.auth_header(user))
+            self.assertEqual(res.status_code, 403)
+
+    def test_body_must_be_array(self):
+        res = self.client.post('/api/v1/places/bulk', json={'title': 'A'},
+                               headers=self.headers)
+        self.assertEqual(res.status_code, 400)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# NDJSON export
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestNdjsonExport(DatabaseTestCase):
+
+    NDJSON = {'Accept': 'application/x-ndjson'}
+
+    def read_lines(self, path):
+        res = self.client.get(path, headers=self.NDJSON)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertTrue(res.is_streamed)
+        return [json.loads(line) for line in res.data.decode().splitlines()]
+
+    def test_streams_every_row(self):
+        owner = self.make_user()
+        for i in range(7):
+            self.make_place(owner, title=f'P{i}')
+        places = self.read_lines('/api/v1/places/')
+        self.assertEqual(sorted(p['title'] for p in places),
+                         [f'P{i}' for i in range(7)])
+        users = self.read_lines('/api/v1/users/')
+        self.assertEqual(users[0]['email'], 'owner@example.com')
+        self.assertEqual(self.read_lines('/api/v1/reviews/'), [])
+
+    def test_json_remains_default(self):
+        self.make_user()
+        res = self.client.get('/api/v1/users/')
+        self.assertEqual(res.mimetype, 'application/json')
+        self.assertEqual(len(res.get_json()), 1)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Schema migrations
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestMigrations(DatabaseTestCase):
+
+    LEGACY_SCHEMA = [
+        "CREATE TABLE users (id VARCHAR(36) PRIMARY KEY, first_name "
+        "VARCHAR(50), last_name VARCHAR(50), email VARCHAR(120), password "
+        "VARCHAR(128), is_admin BOOLEAN, created_at DATETIME, updated_at "
+        "DATETIME)",
+        "CREATE TABLE places (id VARCHAR(36) PRIMARY KEY, title VARCHAR(100),"
+        " description VARCHAR(500), price FLOAT, latitude FLOAT, longitude "
+        "FLOAT, owner_id VARCHAR(36), created_at DATETIME, updated_at "
+        "DATETIME)",
+        "CREATE TABLE amenities (id VARCHAR(36) PRIMARY KEY, name "
+        "VARCHAR(50), created_at DATETIME, updated_at DATETIME)",
+        "CREATE TABLE place_amenity (place_id VARCHAR(36), amenity_id "
+        "VARCHAR(36), PRIMARY KEY (place_id, amenity_id))",
+        "CREATE TABLE reviews (id VARCHAR(36) PRIMARY KEY, text VARCHAR(500),"
+        " rating INTEGER, place_id VARCHAR(36), user_id VARCHAR(36), "
+        "created_at DATETIME, updated_at DATETIME)",
+        "INSERT INTO places (id, title, price, latitude, longitude, owner_id)"
+        " VALUES ('p1', 'Old', 10, 48.8606, 2.3376, 'u1')",
+        "INSERT INTO reviews (id, text, rating, place_id, user_id) "
+        "VALUES ('r1', 'ok', 4, 'p1', 'u2'), ('r2', 'ok', 2, 'p1', 'u3')",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        db.drop_all()
+        with db.engine.begin() as conn:
+            for statement in self.LEGACY_SCHEMA:
+                conn.execute(text(statement))
+
+    def test_upgrade_legacy_database(self):
+        self.assertEqual(upgrade(log=lambda message: None),
+                         [1, 2, 3, 4, 5, 6, 7, 8])
+        place = self.facade.get_place('p1')
+        self.assertEqual(self.facade.place_repo.search_text('old', 10)[0][0].id,
+                         'p1')
+        self.assertEqual(place.geohash, geohash_encode(48.8606, 2.3376))
+        self.assertEqual((place.review_count, place.rating_sum), (2, 6))
+
+        indexes = {index['name'] for table in ('places', 'reviews',
+                                               'place_amenity')
+                   for index in inspect(db.engine).get_indexes(table)}
+        self.assertTrue({'ix_places_owner_id', 'ix_reviews_place_id',
+                         'unique_user_place_review',
+                         'ix_place_amenity_amenity_id'} <= indexes)
+        self.assertEqual(self.facade.collection_version('places', 'users'),
+                         [0, 0])
+        self.assertEqual(upgrade(log=lambda message: None), [])
+
+    def test_migrations_create_the_declared_indexes(self):
+        # A new model index needs a new migration, not an edited one
+        def ddl(index):
+            return str(CreateIndex(index).compile(db.engine))
+
+        migrated = {index.name: ddl(index) for index in (
+            LOOKUP_INDEXES + SORT_INDEXES + UPDATED_AT_INDEXES)}
+        declared = {index.name: ddl(index)
+                    for table in db.metadata.sorted_tables
+                    for index in table.indexes}
+        self.assertEqual(migrated, declared)
+
+    def test_unique_review_index_enforced(self):
+        upgrade(log=lambda message: None)
+        with self.assertRaises(IntegrityError):
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO reviews (id, text, rating, place_id, "
+                    "user_id) VALUES ('r3', 'again', 5, 'p1', 'u2')"))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Filtering and sorting
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestPlaceFilters(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.make_user()
+        self.wifi = self.facade.create_amenity({'name': 'Wi-Fi'})
+        self.pool = self.facade.create_amenity({'name': 'Pool'})
+        self.cheap = self.make_place(self.owner, 'Cheap', 40.0,
+                                     amenities=[self.wifi.id])
+        self.mid = self.make_place(self.owner, 'Mid', 90.0,
+                                   amenities=[self.wifi.id, self.pool.id])
+        self.lux = self.make_place(self.owner, 'Lux', 300.0,
+                                   amenities=[self.pool.id])
+        for i, (place, rating) in enumerate([(self.cheap, 2), (self.mid, 5),
+                                             (self.lux, 4)]):
+            guest = self.make_user(f'guest{i}@example.com')
+            self.facade.create_review({'text': 'ok', 'rating': rating,
+                                       'user_id': guest.id,
+                                       'place_id': place.id})
+
+    def titles(self, **params):
+        response = self.client.get('/api/v1/places/', query_string=params)
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        return [item['title'] for item in body['items']], body['next_cursor']
+
+    def test_price_range_and_sorts(self):
+        self.assertEqual(self.titles(min_price=50, max_price=300)[0],
+                         ['Mid', 'Lux'])
+        self.assertEqual(self.titles(sort='-price')[0],
+                         ['Lux', 'Mid', 'Cheap'])
+        self.assertEqual(self.titles(sort='-rating')[0],
+                         ['Mid', 'Lux', 'Cheap'])
+        self.assertEqual(self.titles(sort='created_at')[0],
+                         ['Cheap', 'Mid', 'Lux'])
+
+    def test_amenities_all_of_and_min_rating(self):
+        both = f'{self.wifi.id},{self.pool.id}'
+        self.assertEqual(self.titles(amenities=both)[0], ['Mid'])
+        self.assertEqual(self.titles(amenities=self.pool.id,
+                                     sort='price')[0], ['Mid', 'Lux'])
+        self.assertEqual(self.titles(min_rating=4, sort='rating')[0],
+                         ['Lux', 'Mid'])
+
+    def test_cursor_pages_follow_sort(self):
+        for i in range(4):
+            self.make_place(self.owner, f'Extra {i}', 90.0)
+        seen = []
+        cursor = None
+        while True:
+            params = {'sort': '-price', 'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            titles, cursor = self.titles(**params)
+            seen.extend(titles)
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen[0], 'Lux')
+        self.assertEqual(seen[-1], 'Cheap')
+
+    def test_single_query(self):
+        wifi_id = self.wifi.id
+        with self.count_queries(skip_versions=True) as statements:
+            self.titles(min_price=10, amenities=wifi_id,
+                        min_rating=1, sort='-rating')
+        self.assertEqual(len(statements), 1, statements)
+
+    def query_plan(self, **search):
+        """EXPLAIN QUERY PLAN of the statement PlaceRepository.search runs."""
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, *args):
+            captured.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            self.facade.place_repo.search(**search)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        statement, parameters = captured[0]
+        with db.engine.connect() as conn:
+            return str(conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + statement, parameters).all())
+
+    def test_indexes_used(self):
+        self.assertIn('ix_places_price_id', self.query_plan(
+            min_price=10, max_price=100, sort='price'))
+        self.assertIn('ix_places_rating_id', self.query_plan(
+            min_rating=4, sort='-rating', after=(4.5, 'z')))
+
+    def test_invalid_parameters(self):
+        for params in ({'sort': 'title'}, {'min_price': 10, 'max_price': 5},
+                       {'min_rating': 6}, {'sort': 'price', 'cursor': 'x'}):
+            response = self.client.get('/api/v1/places/',
+                                       query_string=params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Sparse fieldsets and embedding
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestSparseFieldsets(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        owner = self.make_user()
+        wifi = self.facade.create_amenity({'name': 'Wi-Fi'})
+        self.place_ids = [self.make_place(owner, f'Place {i}', 10.0 + i,
+                                          amenities=[wifi.id]).id
+                          for i in range(3)]
+        guest = self.make_user('guest@example.com')
+        self.review_id = self.facade.create_review({
+            'text': 'Great', 'rating': 5, 'user_id': guest.id,
+            'place_id': self.place_ids[0]}).id
+
+    def get(self, url, **params):
+        db.session.expunge_all()
+        with self.count_queries(skip_versions=True) as statements:
+            response = self.client.get(url, query_string=params)
+        return response.status_code, response.get_json(), statements
+
+    def test_detail_loads_only_requested_columns(self):
+        status, body, statements = self.get(
+            f'/api/v1/places/{self.place_ids[0]}', fields='title,price')
+        self.assertEqual(status, 200)
+        self.assertEqual(set(body), {'id', 'title', 'price'})
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn('places.description', statements[0])
+
+    def test_detail_embed_owner_joined(self):
+        _, body, statements = self.get(
+            f'/api/v1/places/{self.place_ids[0]}', embed='owner',
+            fields='average_rating')
+        self.assertEqual(body['owner']['email'], 'owner@example.com')
+        self.assertEqual(body['average_rating'], 5.0)
+        self.assertNotIn('amenities', body)
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn('users.password', statements[0])
+
+    def test_list_embeds_without_n_plus_one(self):
+        _, body, plain = self.get('/api/v1/places/')
+        self.assertEqual(len(plain), 1)
+        self.assertNotIn('amenities', body[0])
+
+        _, body, statements = self.get('/api/v1/places/', fields='title',
+                                       embed='amenities,owner')
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(set(body[0]), {'id', 'title', 'amenities', 'owner'})
+        self.assertEqual(body[0]['amenities'][0]['name'], 'Wi-Fi')
+
+    def test_filtered_pages_keep_cursor_fields(self):
+        _, first, _ = self.get('/api/v1/places/', fields='title',
+                               sort='-price', limit=2)
+        self.assertEqual([p['title'] for p in first['items']],
+                         ['Place 2', 'Place 1'])
+        _, second, _ = self.get('/api/v1/places/', fields='title',
+                                sort='-price', limit=2,
+                                cursor=first['next_cursor'])
+        self.assertEqual([p['title'] for p in second['items']], ['Place 0'])
+
+    def test_geo_and_search_results_shaped(self):
+        for url, params, key in (
+                ('/api/v1/places/', {'bbox': '0,0,20,30'}, None),
+                ('/api/v1/places/', {'near': '10,20', 'radius_km': 5},
+                 'distance_km'),
+                ('/api/v1/places/search', {'q': 'place'}, 'score')):
+            status, body, statements = self.get(
+                url, fields='title', embed='amenities', **params)
+            self.assertEqual(status, 200, url)
+            items = body['items'] if 'items' in body else body
+            self.assertEqual(len(items), 3)
+            self.assertEqual(set(items[0]) - {key},
+                             {'id', 'title', 'amenities'})
+            self.assertEqual(items[0]['amenities'][0]['name'], 'Wi-Fi')
+            self.assertFalse([s for s in statements
+                              if 'places.description' in s])
+            self.assertEqual(self.get(url, embed='reviewers',
+                                      **params)[0], 400)
+
+    def test_reviews(self):
+        _, body, statements = self.get('/api/v1/reviews/', fields='rating',
+                                       embed='user')
+        self.assertEqual(body, [{'id': self.review_id, 'rating': 5,
+                                 'user': body[0]['user']}])
+        self.assertEqual(body[0]['user']['first_name'], 'Test')
+        self.assertEqual(len(statements), 2)
+
+        _, body, statements = self.get(f'/api/v1/reviews/{self.review_id}',
+                                       embed='place')
+        self.assertEqual(body['place']['title'], 'Place 0')
+        self.assertEqual(body['place_id'], self.place_ids[0])
+        self.assertEqual(len(statements), 1)
+
+    def test_unknown_names_rejected(self):
+        for url, params in (('/api/v1/places/', {'fields': 'password'}),
+                            ('/api/v1/places/', {'embed': 'reviewers'}),
+                            (f'/api/v1/places/{self.place_ids[0]}',
+                             {'fields': 'geohash'}),
+                            ('/api/v1/reviews/', {'embed': 'owner'})):
+            self.assertEqual(self.get(url, **params)[0], 400, params)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Conditional requests
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestConditionalRequests(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.make_user()
+        self.place = self.make_place(self.owner, 'Loft')
+        self.guest = self.make_user('guest@example.com')
+        self.review = self.facade.create_review({
+            'text': 'Nice', 'rating': 4, 'user_id': self.guest.id,
+            'place_id': self.place.id})
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers=headers)
+
+    def test_detail_not_modified(self):
+        url = f'/api/v1/users/{self.owner.id}'
+        first = self.get(url)
+        etag = first.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('Last-Modified', first.headers)
+
+        again = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.data, b'')
+        since = self.get(url, **{
+            'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(since.status_code, 304)
+
+        self.facade.update_user(self.owner.id, {'first_name': 'Renamed'})
+        changed = self.get(url, **{'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+    def test_list_not_modified_skips_loading(self):
+        first = self.get('/api/v1/places/')
+        etag = first.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        with self.count_queries() as statements:
+            again = self.get('/api/v1/places/', **{'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(len(statements), 1)
+
+        # Other query strings are other representations
+        paged = self.get('/api/v1/places/?limit=5', **{'If-None-Match': etag})
+        self.assertEqual(paged.status_code, 200)
+
+        self.make_place(self.owner, 'Cabin')
+        self.assertEqual(self.get('/api/v1/places/', **{
+            'If-None-Match': etag}).status_code, 200)
+
+    def test_list_deletion_changes_validators(self):
+        older = self.facade.create_review({
+            'text': 'Old', 'rating': 2, 'user_id': self.owner.id,
+            'place_id': self.make_place(self.guest, 'Flat').id})
+        first = self.get('/api/v1/reviews/')
+        # A deletion below the newest row would not move Last-Modified
+        self.assertNotIn('Last-Modified', first.headers)
+        self.facade.delete_review(older.id)
+        self.assertEqual(self.get('/api/v1/reviews/', **{
+            'If-None-Match': first.headers['ETag']}).status_code, 200)
+
+    def test_list_versions_skip_table_scans(self):
+        etag = self.get('/api/v1/places/').headers['ETag']
+        with self.count_queries() as statements:
+            self.get('/api/v1/places/?limit=20', **{'If-None-Match': etag})
+        self.assertFalse([s for s in statements if 'count(' in s.lower()])
+        # Statement-level writes bump the counter as well as flushes
+        self.facade.place_repo.update_values(self.place.id, {'price': 1.0})
+        self.assertEqual(self.get('/api/v1/places/', **{
+            'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(self.get('/api/v1/amenities/', **{
+            'If-None-Match': self.get('/api/v1/amenities/').headers['ETag']
+        }).status_code, 304)
+
+    def test_detail_etag_follows_embedded_rows(self):
+        url = f'/api/v1/places/{self.place.id}'
+        etag = self.get(url).headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.facade.update_review(self.review.id, {'text': 'Edited'})
+        self.assertEqual(self.get(url, **{
+            'If-None-Match': etag}).status_code, 200)
+
+        etag = self.get(url).headers['ETag']
+        wifi = self.facade.create_amenity({'name': 'Wi-Fi'})
+        self.facade.update_place(self.place.id, {'amenities': [wifi.id]})
+        self.assertNotEqual(self.get(url).headers['ETag'], etag)
+
+    def test_if_match_on_put(self):
+        url = f'/api/v1/places/{self.place.id}'
+        headers = self.auth_header(self.owner)
+        etag = self.get(url).headers['ETag']
+
+        self.facade.update_place(self.place.id, {'price': 120.0})
+        stale = self.client.put(url, json={'title': 'Mine'},
+                                headers=dict(headers, **{'If-Match': etag}))
+        self.assertEqual(stale.status_code, 412)
+
+        etag = self.get(url).headers['ETag']
+        fresh = self.client.put(url, json={'title': 'Mine'},
+                                headers=dict(headers, **{'If-Match': etag}))
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh.headers['ETag'], etag)
+
+        anything = self.client.put(url, json={'title': 'Again'},
+                                   headers=dict(headers, **{'If-Match': '*'}))
+        self.assertEqual(anything.status_code, 200)
+
+    def test_if_match_compares_strong_tags(self):
+        url = f'/api/v1/users/{self.owner.id}'
+        headers = self.auth_header(self.owner)
+        # As a compressed response would have given it
+        weak = 'W/' + self.get(url).headers['ETag']
+        res = self.client.put(url, json={'first_name': 'Weak'},
+                              headers=dict(headers, **{'If-Match': weak}))
+        self.assertEqual(res.status_code, 412)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Full-text search
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestPlaceSearch(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.make_user()
+        self.loft = self.make_place(self.owner, 'Sunny loft',
+                                    description='Bright flat near the river')
+        self.cabin = self.make_place(self.owner, 'Forest cabin',
+                                     description='A sunny deck and a stove')
+        self.cafe = self.make_place(self.owner, 'Room above the Café',
+                                    description='Noisy but central')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/v1/places/search',
+                                   query_string=dict(params, q=q))
+        return response.status_code, response.get_json()
+
+    def test_title_matches_rank_first(self):
+        status, body = self.search('sunny')
+        self.assertEqual(status, 200)
+        self.assertEqual([item['id'] for item in body['items']],
+                         [self.loft.id, self.cabin.id])
+        self.assertGreater(body['items'][0]['score'],
+                           body['items'][1]['score'])
+
+    def test_all_terms_required_prefix_and_diacritics(self):
+        self.assertEqual(self.search('sunny stove')[1]['items'][0]['id'],
+                         self.cabin.id)
+        self.assertEqual(len(self.search('sunny stove')[1]['items']), 1)
+        self.assertEqual(self.search('riv*')[1]['items'][0]['id'],
+                         self.loft.id)
+        self.assertEqual(self.search('cafe')[1]['items'][0]['id'],
+                         self.cafe.id)
+        # Ids are not searchable
+        self.assertEqual(self.search(self.loft.id[:8])[1]['items'], [])
+
+    def test_pagination(self):
+        for i in range(5):
+            self.make_place(self.owner, f'Sunny studio {i}')
+        status, first = self.search('sunny', limit=4)
+        self.assertEqual(first['next_offset'], 4)
+        _, second = self.search('sunny', limit=4, offset=4)
+        self.assertIsNone(second['next_offset'])
+        ids = [item['id'] for item in first['items'] + second['items']]
+        self.assertEqual(len(set(ids)), 7)
+
+    def test_index_follows_updates_and_bulk_import(self):
+        self.facade.update_place(self.loft.id, {'title': 'Quiet attic'})
+        self.assertEqual(self.search('attic')[1]['items'][0]['id'],
+                         self.loft.id)
+        self.assertEqual([item['id'] for item in self.search('sunny')[1]
+                          ['items']], [self.cabin.id])
+
+        self.facade.bulk_create_places(
+            [{'title': 'Imported igloo', 'price': 1, 'latitude': 0,
+              'longitude': 0}], owner_id=self.owner.id)
+        self.assertEqual(len(self.search('igloo')[1]['items']), 1)
+
+    def test_deleted_place_leaves_index(self):
+        db.session.delete(self.loft)
+        db.session.commit()
+        self.assertEqual([item['id'] for item in self.search('sunny')[1]
+                          ['items']], [self.cabin.id])
+        count = db.session.execute(text(
+            "SELECT COUNT(*) FROM places_fts_ids")).scalar()
+        self.assertEqual(count, 2)
+
+    def test_invalid_queries(self):
+        self.assertEqual(self.search('  ')[0], 400)
+        self.assertEqual(self.search('"; DROP TABLE places')[1]['items'], [])
+        self.assertEqual(self.client.get(
+            '/api/v1/places/search').status_code, 400)
+
+    def test_inverted_index_matches_fts_ranking(self):
+        index = InvertedIndex(PLACE_SEARCH_WEIGHTS)
+        for place in (self.loft, self.cabin, self.cafe):
+            index.add(place.id, {'title': place.title,
+                                 'description': place.description})
+        for query in ('sunny', 'sunny stove', 'riv*', 'cafe'):
+            expected = [p.id for p, _ in
+                        self.facade.place_repo.search_text(query, 10)]
+            self.assertEqual([doc for doc, _ in index.search(query)],
+                             expected)
+
+    def test_in_memory_repository_search(self):
+        repo = InMemoryRepository(search_weights=PLACE_SEARCH_WEIGHTS)
+        for place in (self.loft, self.cabin, self.cafe):
+            repo.add(place)
+        self.assertEqual([p.id for p, _ in repo.search_text('sunny', 10)],
+                         [self.loft.id, self.cabin.id])
+        repo.update(self.loft.id, {'title': 'Quiet attic'})
+        repo.delete(self.cabin.id)
+        self.assertEqual(repo.search_text('sunny', 10), [])
+        self.assertEqual(repo.search_text('attic', 10)[0][0].id, self.loft.id)
+        with self.assertRaises(SearchUnavailableError):
+            InMemoryRepository().search_text('sunny', 10)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Duplicate review detection
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestDuplicateReview(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.place_id = self.make_place(self.make_user()).id
+        self.reviewer = self.make_user('r@example.com')
+        self.payload = {'text': 'Great', 'rating': 5,
+                        'user_id': self.reviewer.id, 'place_id': self.place_id}
+
+    def post_review(self):
+        return self.client.post('/api/v1/reviews/', json=self.payload,
+                                headers=self.auth_header(self.reviewer))
+
+    def test_second_review_rejected_without_scanning(self):
+        self.assertEqual(self.post_review().status_code, 201)
+        with self.count_queries() as statements:
+            res = self.post_review()
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('already reviewed', res.get_json()['error'])
+        self.assertFalse(any(s.lstrip().startswith('SELECT reviews.')
+                             for s in statements))
+
+    def test_constraint_violation_maps_to_same_error(self):
+        self.facade.create_review(dict(self.payload))
+        # Simulates a concurrent request that passed the existence check
+        with self.assertRaisesRegex(ValueError, 'already reviewed'):
+            self.facade.create_review(dict(self.payload))
+        place = self.facade.get_place(self.place_id)
+        self.assertEqual(place.review_count, 1)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Production engine configuration
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestProductionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        class PooledConfig(ProductionConfig):
+            SQLALCHEMY_DATABASE_URI = (
+                f'sqlite:///{self.tmpdir.name}/pool.db')
+            SQLALCHEMY_ENGINE_OPTIONS = dict(
+                ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS,
+                pool_size=3, max_overflow=2)
+            REPOSITORY_CACHE = {}
+
+        self.app = create_app(PooledConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        self.tmpdir.cleanup()
+
+    def test_engine_options_applied(self):
+        pool = db.engine.pool
+        self.assertEqual(pool.size(), 3)
+        self.assertEqual(pool._max_overflow, 2)
+        self.assertTrue(pool._pre_ping)
+
+    def test_stats_endpoint_reports_pool(self):
+        admin = create_access_token(identity='admin',
+                                    additional_claims={'is_admin': True})
+        user = create_access_token(identity='user',
+                                   additional_claims={'is_admin': False})
+        client = self.app.test_client()
+        res = client.get('/api/v1/admin/stats',
+                         headers={'Authorization': f'Bearer {user}'})
+        self.assertEqual(res.status_code, 403)
+        with db.engine.connect():
+            res = client.get('/api/v1/admin/stats',
+                             headers={'Authorization': f'Bearer {admin}'})
+        pool = res.get_json()['pool']
+        self.assertEqual(pool['class'], 'QueuePool')
+        self.assertEqual(pool['size'], 3)
+        self.assertGreaterEqual(pool['checkedout'], 1)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SQLite tuning and lock retries
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestSqliteTuning(DatabaseTestCase):
+
+    def locked_once(self, method):
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('INSERT', {},
+                                       Exception('database is locked'))
+            return method(*args, **kwargs)
+        return flaky, calls
+
+    def test_write_retried_on_lock_error(self):
+        owner = self.make_user()
+        flaky, calls = self.locked_once(self.facade.place_repo.add)
+        with mock.patch.object(self.facade.place_repo, 'add', flaky):
+            place = self.make_place(owner)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.facade.get_place(place.id).title, 'Place')
+
+    def test_retries_exhausted(self):
+        configure_writes(retries=0)
+        self.addCleanup(configure_writes,
+                        retries=self.app.config['DB_WRITE_RETRIES'])
+        flaky, _ = self.locked_once(self.facade.amenity_repo.add)
+        with mock.patch.object(self.facade.amenity_repo, 'add', flaky):
+            with self.assertRaises(OperationalError):
+                self.facade.create_amenity({'name': 'Wi-Fi'})
+
+    def test_other_errors_not_retried(self):
+        calls = []
+
+        def broken(*args, **kwargs):
+            calls.append(1)
+            raise OperationalError('INSERT', {}, Exception('no such table'))
+        with mock.patch.object(self.facade.amenity_repo, 'add', broken):
+            with self.assertRaises(OperationalError):
+                self.facade.create_amenity({'name': 'Wi-Fi'})
+        self.assertEqual(len(calls), 1)
+
+    def test_pragmas_applied_on_connect(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            class TunedConfig(TestingConfig):
+                SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmpdir}/tuned.db'
+                SQLITE_PRAGMAS = SQLITE_WAL_PRAGMAS
+
+            app = create_app(TunedConfig)
+            with app.app_context():
+                with db.engine.connect() as conn:
+                    mode = conn.exec_driver_sql(
+                        "PRAGMA journal_mode").scalar()
+                    timeout = conn.exec_driver_sql(
+                        "PRAGMA busy_timeout").scalar()
+                db.engine.dispose()
+        self.assertEqual(mode, 'wal')
+        self.assertEqual(timeout, 5000)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Response compression
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestCompression(DatabaseTestCase):
+
+    GZIP = {'Accept-Encoding': 'gzip'}
+
+    def setUp(self):
+        super().setUp()
+        owner = self.make_user()
+        for i in range(20):
+            self.make_place(owner, title=f'Place {i}',
+                            description='A quiet flat near the river')
+
+    def test_large_json_gzipped(self):
+        plain = self.client.get('/api/v1/places/')
+        res = self.client.get('/api/v1/places/', headers=self.GZIP)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertLess(int(res.headers['Content-Length']), len(plain.data))
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+
+    def test_deflate_and_quality_values(self):
+        res = self.client.get('/api/v1/places/', headers={
+            'Accept-Encoding': 'gzip;q=0.5, deflate'})
+        self.assertEqual(res.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(json.loads(zlib.decompress(res.data))[0]['id'],
+                         self.client.get('/api/v1/places/').get_json()[0]['id'])
+        refused = self.client.get('/api/v1/places/', headers={
+            'Accept-Encoding': 'gzip;q=0, deflate;q=0'})
+        self.assertNotIn('Content-Encoding', refused.headers)
+
+    def test_small_body_and_no_accept_untouched(self):
+        owner = self.facade.get_user_by_email('owner@example.com')
+        small = self.client.get(f'/api/v1/users/{owner.id}',
+                                headers=self.GZIP)
+        self.assertNotIn('Content-Encoding', small.headers)
+        self.assertEqual(small.get_json()['id'], owner.id)
+        self.assertFalse(small.headers['ETag'].startswith('W/'))
+        plain = self.client.get('/api/v1/places/')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+    def test_not_modified_stays_empty(self):
+        etag = self.client.get('/api/v1/places/').headers['ETag']
+        res = self.client.get('/api/v1/places/', headers={
+            'If-None-Match': etag, **self.GZIP})
+        self.assertEqual(res.status_code, 304)
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.data, b'')
+
+    def test_ndjson_stream_compressed(self):
+        headers = {'Accept': 'application/x-ndjson', **self.GZIP}
+        with mock.patch('app.api.v1.ndjson.STREAM_BATCH', 3):
+            res = self.client.get('/api/v1/places/', headers=headers)
+            self.assertTrue(res.is_streamed)
+            self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+            self.assertNotIn('Content-Length', res.headers)
+            chunks = list(res.response)
+        # Every chunk is flushed, so each prefix already decodes to rows
+        decoder = zlib.decompressobj(31)
+        first = decoder.decompress(chunks[0])
+        self.assertEqual(len(first.decode().splitlines()), 3)
+        body = first + b''.join(decoder.decompress(c) for c in chunks[1:])
+        lines = body.decode().splitlines()
+        self.assertEqual(len(lines), 20)
+        self.assertTrue(all(json.loads(line)['title'] for line in lines))
+
+    def test_compressed_etag_names_its_encoding(self):
+        owner = self.facade.get_user_by_email('owner@example.com')
+        self.facade.update_user(owner.id, {'first_name': 'x' * 600})
+        url = f'/api/v1/users/{owner.id}'
+        plain = self.client.get(url).headers['ETag']
+        res = self.client.get(url, headers=self.GZIP)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        etag = res.headers['ETag']
+        self.assertEqual(etag, plain[:-1] + '-gzip"')
+        again = self.client.get(url, headers={'If-None-Match': etag,
+                                              **self.GZIP})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers['ETag'], etag)
+        # The compressed copy's tag still satisfies If-Match
+        token = create_access_token(identity=owner.id,
+                                    additional_claims={'is_admin': False})
+        updated = self.client.put(url, json={'last_name': 'Renamed'},
+                                  headers={'If-Match': etag, **self.GZIP,
+                                           'Authorization': f'Bearer {token}'})
+        self.assertEqual(updated.status_code, 200)
+
+    def test_disabled(self):
+        class PlainConfig(TestingConfig):
+            COMPRESS_ENABLED = False
+
+        app = create_app(PlainConfig)
+        with app.app_context():
+            db.create_all()
+            res = app.test_client().get('/api/v1/places/', headers=self.GZIP)
+        self.assertNotIn('Content-Encoding', res.headers)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Serializers
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestSerializers(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.make_user()
+        self.wifi = self.facade.create_amenity({'name': 'Wi-Fi'})
+        self.place = self.make_place(self.owner, 'Loft',
+                                     amenities=[self.wifi.id])
+
+    def test_views_compiled_once_per_shape(self):
+        view = PLACE.only(('title', 'price'), ('amenities',))
+        self.assertIs(view, PLACE.only(('title', 'price'), ('amenities',)))
+        self.assertEqual(view(self.place), {
+            'id': self.place.id, 'title': 'Loft', 'price': 100.0,
+            'amenities': [{'id': self.wifi.id, 'name': 'Wi-Fi'}]})
+        self.assertEqual(USER(self.owner)['email'], 'owner@example.com')
+
+    def test_views_keyed_by_canonical_shape(self):
+        view = PLACE.only(('price', 'title', 'price', 'id'),
+                          ('amenities', 'owner', 'amenities'))
+        self.assertIs(view, PLACE.only(('title', 'price'),
+                                       ('owner', 'amenities')))
+        self.assertEqual(list(view(self.place)),
+                         ['id', 'title', 'price', 'owner', 'amenities'])
+        serializer = Serializer(Place, *PLACE.attributes)
+        for i in range(serializers.VIEW_CACHE_SIZE * 2):
+            serializer.only(('title', f'extra_{i}'))
+        self.assertLessEqual(serializer._views.cache_info().currsize,
+                             serializers.VIEW_CACHE_SIZE)
+
+    def test_unloaded_columns_still_read(self):
+        place_id = self.place.id
+        db.session.expire_all()
+        place = db.session.query(Place).options(
+            load_only(Place.title)).filter_by(id=place_id).one()
+        self.assertNotIn('price', place.__dict__)
+        self.assertEqual(PLACE.only(('title', 'price'))(place)['price'],
+                         100.0)
+
+    def test_stdlib_fallback_matches_orjson(self):
+        data = {'at': datetime(2024, 1, 2, 3, 4, 5, 6),
+                'uuid': uuid.UUID(int=1), 'places': [self.place]}
+        fast = serializers.dumps(data, PLACE)
+        with mock.patch.object(serializers, 'orjson', None):
+            slow = serializers.dumps(data, PLACE)
+        self.assertEqual(json.loads(fast), json.loads(slow))
+        decoded = json.loads(slow)
+        self.assertEqual(decoded['at'], '2024-01-02T03:04:05.000006')
+        self.assertEqual(decoded['uuid'], str(uuid.UUID(int=1)))
+        self.assertEqual(decoded['places'][0]['title'], 'Loft')
+
+    def test_endpoints_share_representations(self):
+        listed = self.client.get('/api/v1/places/?embed=owner,amenities')
+        self.assertEqual(listed.mimetype, 'application/json')
+        item = listed.get_json()[0]
+        self.assertEqual(item['owner'], USER(self.owner))
+        self.assertEqual(item['amenities'], [AMENITY(self.wifi)])
+        detail = self.client.get(f'/api/v1/places/{self.place.id}').get_json()
+        self.assertEqual(detail['title'], 'Loft')
+        self.assertEqual(detail['rating_histogram']['5'], 0)
+        missing = self.client.get('/api/v1/places/nope')
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(missing.get_json(), {'error': 'Place not found'})
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Login: bcrypt cost and throttling
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestLogin(DatabaseTestCase):
+
+    def login(self, email='owner@example.com', password='secret'):
+        return self.client.post('/api/v1/auth/login',
+                                json={'email': email, 'password': password})
+
+    def test_rehash_when_cost_changes(self):
+        user = self.make_user()
+        self.assertTrue(user.password.startswith('$2b$04$'))
+        self.assertFalse(user.needs_rehash())
+        user.password = bcrypt.generate_password_hash('secret', 5).decode()
+        db.session.commit()
+        self.assertTrue(user.needs_rehash())
+
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        self.assertTrue(user.password.startswith('$2b$05$'))
+        self.assertEqual(self.login().status_code, 200)
+        db.session.expire_all()
+        stored = self.facade.get_user(user.id).password
+        self.assertTrue(stored.startswith('$2b$04$'))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_busy_rehash_skipped(self):
+        user = self.make_user()
+        user.password = bcrypt.generate_password_hash('secret', 5).decode()
+        db.session.commit()
+        with mock.patch.object(passwords, 'hash',
+                               side_effect=PasswordServiceBusy('busy')):
+            self.assertEqual(self.login().status_code, 200)
+        db.session.expire_all()
+        self.assertTrue(self.facade.get_user(user.id).password
+                        .startswith('$2b$05$'))
+
+    def test_update_of_missing_user_skips_hashing(self):
+        with mock.patch.object(passwords, 'hash') as hash_password:
+            self.assertIsNone(self.facade.update_user(
+                str(uuid.uuid4()), {'password': 'new'}))
+        hash_password.assert_not_called()
+
+    def test_email_flood_rejected_before_bcrypt(self):
+        self.make_user()
+        with mock.patch.object(User, 'verify_password',
+                               return_value=False) as verify:
+            codes = [self.login(password='guess').status_code
+                     for _ in range(7)]
+        self.assertEqual(codes, [401] * 5 + [429] * 2)
+        self.assertEqual(verify.call_count, 5)
+        res = self.login(email=' Owner@Example.com ')
+        self.assertEqual(res.status_code, 429)
+        self.assertGreaterEqual(int(res.headers['Retry-After']), 1)
+
+    def limit_ips(self):
+        self.app.config['LOGIN_RATE_LIMITS'] = {'email': (5, 60),
+                                                'ip': (20, 60)}
+        init_login_throttle(self.app)
+
+    def test_ip_limit_opt_in(self):
+        self.assertEqual(set(self.app.extensions['login_throttle']),
+                         {'email'})
+        codes = {self.login(email=f'user{i}@example.com').status_code
+                 for i in range(25)}
+        self.assertEqual(codes, {401})
+
+    def test_ip_limit_spans_emails(self):
+        self.limit_ips()
+        codes = [self.login(email=f'user{i}@example.com').status_code
+                 for i in range(21)]
+        self.assertEqual(codes, [401] * 20 + [429])
+        other = self.client.post(
+            '/api/v1/auth/login', environ_base={'REMOTE_ADDR': '10.0.0.2'},
+            json={'email': 'new@example.com', 'password': 'x'})
+        self.assertEqual(other.status_code, 401)
+
+    def test_ip_limit_behind_trusted_proxy(self):
+        class ProxiedConfig(TestingConfig):
+            LOGIN_RATE_LIMITS = {'ip': (1, 60)}
+            PROXY_FIX_X_FOR = 1
+
+        app = create_app(ProxiedConfig)
+        with app.app_context():
+            db.create_all()
+            client = app.test_client()
+            codes = [client.post(
+                '/api/v1/auth/login', json={'email': 'a@b.c', 'password': 'x'},
+                headers={'X-Forwarded-For': address}).status_code
+                for address in ('10.0.0.1', '10.0.0.2', '10.0.0.1')]
+        self.assertEqual(codes, [401, 401, 429])
+
+    def test_refused_attempts_spend_no_tokens(self):
+        self.limit_ips()
+        codes = [self.login(password='guess').status_code
+                 for _ in range(10)]
+        self.assertEqual(codes, [401] * 5 + [429] * 5)
+        codes = [self.login(email=f'user{i}@example.com').status_code
+                 for i in range(16)]
+        self.assertEqual(codes, [401] * 15 + [429])
+
+    def test_token_bucket_refills(self):
+        now = [0.0]
+        limiter = TokenBucketLimiter(2, 10, max_keys=2,
+                                     clock=lambda: now[0])
+        self.assertEqual(limiter.acquire('a'), 0)
+        self.assertEqual(limiter.acquire('a'), 0)
+        self.assertAlmostEqual(limiter.acquire('a'), 5.0)
+        self.assertAlmostEqual(limiter.peek('a'), 5.0)
+        now[0] = 5.0
+        self.assertEqual(limiter.peek('a'), 0)
+        self.assertEqual(limiter.acquire('a'), 0)
+        limiter.acquire('b')
+        limiter.acquire('c')
+        self.assertNotIn('a', limiter._buckets)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Password service
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestPasswordService(DatabaseTestCase):
+
+    def configure(self, **options):
+        class PoolConfig(TestingConfig):
+            pass
+        for name, value in options.items():
+            setattr(PoolConfig, name, value)
+        passwords.init_app(create_app(PoolConfig))
+        self.addCleanup(passwords.init_app, self.app)
+
+    def test_pooled_hashes_interchangeable(self):
+        for pool in ('thread', 'process'):
+            self.configure(PASSWORD_WORKERS=2, PASSWORD_POOL=pool)
+            hashed = passwords.hash('secret')
+            self.assertTrue(hashed.startswith('$2b$04$'))
+            self.assertTrue(bcrypt.check_password_hash(hashed, 'secret'))
+            self.assertTrue(passwords.verify(hashed, 'secret'))
+            self.assertFalse(passwords.verify(hashed, 'other'))
+
+    def test_full_queue_rejected(self):
+        self.configure(PASSWORD_WORKERS=1, PASSWORD_QUEUE_LIMIT=1)
+        release = threading.Event()
+        blocked = [threading.Thread(target=passwords._run,
+                                    args=(release.wait,))
+                   for _ in range(2)]
+        for thread in blocked:
+            thread.start()
+        try:
+            # One call running, one waiting: the next one is turned away
+            while passwords._slots._value:
+                time.sleep(0.001)
+            with self.assertRaises(PasswordServiceBusy):
+                passwords.hash('secret')
+        finally:
+            release.set()
+            for thread in blocked:
+                thread.join()
+        self.assertTrue(passwords.verify(passwords.hash('secret'), 'secret'))
+
+    def test_busy_endpoints_answer_503(self):
+        admin = self.make_user('admin@example.com', is_admin=True)
+        with mock.patch.object(passwords, '_run',
+                               side_effect=PasswordServiceBusy('busy')):
+            created = self.client.post('/api/v1/users/', json={
+                'first_name': 'A', 'last_name': 'B',
+                'email': 'new@example.com', 'password': 'pw'},
+                headers=self.auth_header(admin))
+            login = self.client.post('/api/v1/auth/login', json={
+                'email': 'admin@example.com', 'password': 'secret'})
+            updated = self.client.put(
+                f'/api/v1/users/{admin.id}', json={'password': 'new'},
+                headers=self.auth_header(admin))
+        for res in (created, login, updated):
+            self.assertEqual(res.status_code, 503)
+            self.assertEqual(res.headers['Retry-After'], '1')
+        self.assertIsNone(self.facade.get_user_by_email('new@example.com'))
+        self.assertTrue(admin.verify_password('secret'))
+
+    def test_hashing_outside_write(self):
+        user_id = self.make_user().id
+        with mock.patch.object(passwords, 'hash',
+                               side_effect=PasswordServiceBusy('busy')):
+            with self.count_queries() as statements:
+                with self.assertRaises(PasswordServiceBusy):
+                    self.facade.update_user(user_id, {'password': 'new'})
+        # Only the existence check ran: nothing was written
+        self.assertEqual([s.split()[0] for s in statements], ['SELECT'])
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Owner writes checked in the UPDATE/DELETE itself
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestOwnedWrites(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.make_user()
+        self.stranger = self.make_user('stranger@example.com')
+        self.place = self.make_place(self.owner, description='Quiet flat')
+        self.review = self.facade.create_review({
+            'text': 'Nice', 'rating': 4, 'user_id': self.stranger.id,
+            'place_id': self.place.id})
+        self.place_id, self.review_id = self.place.id, self.review.id
+        self.owner, self.stranger = (self.auth_header(self.owner),
+                                     self.auth_header(self.stranger))
+        db.session.remove()
+
+    def put(self, path, auth, data, **headers):
+        with self.count_queries() as statements:
+            response = self.client.put(path, json=data,
+                                       headers={**auth, **headers})
+        return response, statements
+
+    def writes(self, statements):
+        # Leaving out the version counter bumps that come with every write
+        return [s for s in statements if not s.startswith('SELECT')
+                and 'collection_versions' not in s]
+
+    def aggregates(self):
+        db.session.remove()
+        place = self.facade.get_place(self.place_id)
+        return place.review_count, place.rating_sum, [
+            place.rating_histogram[str(r)] for r in range(1, 6)]
+
+    def test_place_update_skips_load(self):
+        response, statements = self.put(
+            f'/api/v1/places/{self.place_id}', self.owner,
+            {'title': 'Renamed', 'latitude': 48.85, 'longitude': 2.35})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], 'Renamed')
+        self.assertTrue(response.headers['ETag'])
+        # UPDATE ... RETURNING plus the search index refresh, nothing loaded
+        self.assertFalse([s for s in statements
+                          if s.startswith('SELECT places.')])
+        db.session.remove()
+        place = self.facade.get_place(self.place_id)
+        self.assertEqual(place.geohash, geohash_encode(48.85, 2.35))
+        matches, _ = self.facade.search_places('renamed', 5)
+        self.assertEqual([p.id for p, _ in matches], [self.place_id])
+        self.assertEqual(self.facade.search_places('place', 5), ([], None))
+
+    def test_place_forbidden_missing_and_invalid(self):
+        response, _ = self.put(f'/api/v1/places/{self.place_id}',
+                               self.stranger, {'title': 'Mine'})
+        self.assertEqual(response.status_code, 403)
+        response, _ = self.put(f'/api/v1/places/{uuid.uuid4()}',
+                               self.owner, {'title': 'Ghost'})
+        self.assertEqual(response.status_code, 404)
+        response, statements = self.put(f'/api/v1/places/{self.place_id}',
+                                        self.owner, {'price': -1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.writes(statements), [])
+        self.assertEqual(self.facade.get_place(self.place_id).title, 'Place')
+
+    def test_invalid_payload_checked_after_ownership(self):
+        for path, owner, stranger, data in (
+                (f'/api/v1/places/{self.place_id}', self.owner,
+                 self.stranger, {'price': -1}),
+                (f'/api/v1/reviews/{self.review_id}', self.stranger,
+                 self.owner, {'rating': 9})):
+            response, _ = self.put(path, stranger, data)
+            self.assertEqual(response.status_code, 403, path)
+            self.assertEqual(response.get_json(),
+                             {'error': 'Unauthorized action'})
+            missing = path.rsplit('/', 1)[0] + f'/{uuid.uuid4()}'
+            self.assertEqual(self.put(missing, owner, data)[0].status_code,
+                             404, path)
+            self.assertEqual(self.put(path, owner, data)[0].status_code,
+                             400, path)
+
+    def test_other_payloads_and_if_match_use_load_path(self):
+        self.assertFalse(self.facade.owned_place_update_supported(
+            {'latitude': 1.0}))
+        self.assertFalse(self.facade.owned_place_update_supported(
+            {'title': 'T', 'amenities': []}))
+        etag = self.client.get(
+            f'/api/v1/places/{self.place_id}').headers['ETag']
+        with mock.patch.object(self.facade, 'update_owned_place') as owned:
+            response, _ = self.put(f'/api/v1/places/{self.place_id}',
+                                   self.owner, {'title': 'Matched'},
+                                   **{'If-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        owned.assert_not_called()
+
+    def test_review_rating_change_moves_aggregates(self):
+        response, statements = self.put(f'/api/v1/reviews/{self.review_id}',
+                                        self.stranger, {'rating': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['rating'], 2)
+        self.assertEqual(len(self.writes(statements)), 2)
+        self.assertEqual(self.aggregates(), (1, 2, [0, 1, 0, 0, 0]))
+
+        response, _ = self.put(f'/api/v1/reviews/{self.review_id}',
+                               self.owner, {'rating': 5})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.aggregates(), (1, 2, [0, 1, 0, 0, 0]))
+
+    def test_review_text_update_is_one_statement(self):
+        response, statements = self.put(f'/api/v1/reviews/{self.review_id}',
+                                        self.stranger, {'text': 'Better'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.writes(statements)), 1)
+        self.assertEqual(self.aggregates(), (1, 4, [0, 0, 0, 1, 0]))
+
+    def test_review_delete(self):
+        path = f'/api/v1/reviews/{self.review_id}'
+        response = self.client.delete(path,
+                                      headers=self.owner)
+        self.assertEqual(response.status_code, 403)
+        with self.count_queries() as statements:
+            response = self.client.delete(
+                path, headers=self.stranger)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.writes(statements)), 2)
+        self.assertEqual(self.aggregates(), (0, 0, [0, 0, 0, 0, 0]))
+        response = self.client.delete(
+            path, headers=self.stranger)
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_place_invalidated(self):
+        self.facade.configure_cache({'Place': {'maxsize': 8, 'ttl': 60}})
+        try:
+            self.facade.get_place(self.place_id)
+            self.put(f'/api/v1/reviews/{self.review_id}', self.stranger,
+                     {'rating': 1})
+            self.put(f'/api/v1/places/{self.place_id}', self.owner,
+                     {'price': 42.0})
+            place = self.facade.get_place(self.place_id)
+            self.assertEqual((place.price, place.rating_sum), (42.0, 1))
+        finally:
+            self.facade.configure_cache({})